@@ -0,0 +1,178 @@
+import os
+
+import numpy as np
+
+
+class IVFIndex:
+    """Approximate nearest neighbour index over float32 vectors using an inverted file.
+
+    Vectors are bucketed by their nearest k-means centroid. A query only scans
+    the buckets of its `nprobe` nearest centroids, so search cost grows with
+    N / n_lists instead of N. Until enough vectors are available to train the
+    centroids, everything is kept in a single bucket and searched exactly.
+    """
+
+    def __init__(self, dim, n_lists=256, nprobe=8, train_size=None):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        # Train automatically once there are enough points per centroid
+        self.train_size = train_size or 40 * n_lists
+        self.centroids = None
+        self.lists = [self._empty_list()]
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    @property
+    def count(self):
+        return sum(bucket['count'] for bucket in self.lists)
+
+    def ids(self):
+        """Return every id held by the index"""
+        return np.concatenate([bucket['ids'][:bucket['count']] for bucket in self.lists])
+
+    def _empty_list(self, capacity=16):
+        return {
+            'ids': np.empty(capacity, dtype=np.int64),
+            'vectors': np.empty((capacity, self.dim), dtype=np.float32),
+            'norms': np.empty(capacity, dtype=np.float32),
+            'count': 0,
+        }
+
+    def _append(self, bucket, ids, vectors):
+        """Append to a bucket, growing its arrays geometrically"""
+        n = bucket['count']
+        needed = n + len(ids)
+        if needed > len(bucket['ids']):
+            capacity = max(needed, 2 * len(bucket['ids']))
+            grown = self._empty_list(capacity)
+            grown['ids'][:n] = bucket['ids'][:n]
+            grown['vectors'][:n] = bucket['vectors'][:n]
+            grown['norms'][:n] = bucket['norms'][:n]
+            bucket['ids'], bucket['vectors'], bucket['norms'] = grown['ids'], grown['vectors'], grown['norms']
+        bucket['ids'][n:needed] = ids
+        bucket['vectors'][n:needed] = vectors
+        bucket['norms'][n:needed] = (bucket['vectors'][n:needed] ** 2).sum(axis=1)
+        bucket['count'] = needed
+
+    def _nearest_centroids(self, vectors, count=1):
+        """Indices of the `count` nearest centroids for each vector"""
+        norms = (self.centroids * self.centroids).sum(axis=1)
+        scores = norms - 2.0 * (vectors @ self.centroids.T)
+        if count >= len(self.centroids):
+            return np.argsort(scores, axis=1)
+        nearest = np.argpartition(scores, count - 1, axis=1)[:, :count]
+        order = np.take_along_axis(scores, nearest, axis=1).argsort(axis=1)
+        return np.take_along_axis(nearest, order, axis=1)
+
+    def train(self, vectors=None, iterations=10, seed=0):
+        """Fit the centroids with k-means and re-bucket every stored vector"""
+        ids = self.ids()
+        stored = np.concatenate([bucket['vectors'][:bucket['count']] for bucket in self.lists])
+        if vectors is None:
+            vectors = stored
+
+        rng = np.random.default_rng(seed)
+        n_lists = min(self.n_lists, len(vectors))
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), 64 * n_lists), replace=False)]
+        self.centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = self._nearest_centroids(sample)[:, 0]
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignment, sample)
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = counts > 0
+            self.centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.lists = [self._empty_list() for _ in range(n_lists)]
+        if len(ids):
+            self._bucket(ids, stored)
+
+    def _bucket(self, ids, vectors):
+        assignment = self._nearest_centroids(vectors)[:, 0]
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(len(self.lists) + 1))
+        for i, bucket in enumerate(self.lists):
+            rows = order[bounds[i]:bounds[i + 1]]
+            if len(rows):
+                self._append(bucket, ids[rows], vectors[rows])
+
+    def add(self, ids, vectors):
+        """Add vectors incrementally; trains the centroids once enough have arrived"""
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        if self.trained:
+            self._bucket(ids, vectors)
+        else:
+            self._append(self.lists[0], ids, vectors)
+            if self.lists[0]['count'] >= self.train_size:
+                self.train()
+
+    def search(self, query, k=10, nprobe=None):
+        """Return the ids and squared L2 distances of the k nearest stored vectors"""
+        query = np.asarray(query, dtype=np.float32).reshape(self.dim)
+        if self.trained:
+            probes = self._nearest_centroids(query[None], nprobe or self.nprobe)[0]
+            buckets = [self.lists[i] for i in probes]
+        else:
+            buckets = self.lists
+
+        ids, distances = [], []
+        query_norm = query @ query
+        for bucket in buckets:
+            n = bucket['count']
+            if n == 0:
+                continue
+            distances.append(bucket['norms'][:n] - 2.0 * (bucket['vectors'][:n] @ query) + query_norm)
+            ids.append(bucket['ids'][:n])
+
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(ids)
+        distances = np.concatenate(distances)
+        if k < len(ids):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(distances[top])]
+        return ids[top], distances[top]
+
+    def save(self, path):
+        """Write the index to an .npz file"""
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        arrays = {
+            'config': np.array([self.dim, self.n_lists, self.nprobe, self.train_size]),
+            'counts': np.array([bucket['count'] for bucket in self.lists]),
+            'ids': self.ids(),
+            'vectors': np.concatenate([bucket['vectors'][:bucket['count']] for bucket in self.lists]),
+        }
+        if self.trained:
+            arrays['centroids'] = self.centroids
+        # Write next to the target and rename so a crash never leaves a torn file
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Read an index written by save()"""
+        with np.load(path) as data:
+            dim, n_lists, nprobe, train_size = (int(v) for v in data['config'])
+            index = cls(dim, n_lists=n_lists, nprobe=nprobe, train_size=train_size)
+            counts = data['counts']
+            ids, vectors = data['ids'], data['vectors']
+            if 'centroids' in data:
+                index.centroids = data['centroids']
+            index.lists = [index._empty_list(max(int(c), 16)) for c in counts]
+
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        for i, bucket in enumerate(index.lists):
+            index._append(bucket, ids[offsets[i]:offsets[i + 1]], vectors[offsets[i]:offsets[i + 1]])
+        return index
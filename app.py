@@ -1,15 +1,28 @@
+import time
+
+STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import ttk, messagebox
-import cv2
-import numpy as np
-from PIL import Image, ImageTk
+from tkinter import ttk, messagebox, filedialog
 from datetime import datetime
-from database import Database
+import threading
+from camera import CameraManager
+from database import ATTENDANCE_PAGE_SIZE, Database
+from metrics import METRICS, MetricsLog, serve_metrics
+from presence import Cooldown
+from profiling import StartupProfile
 import os
 
+# cv2, NumPy, PIL and the modules built on them are imported where first
+# used, so the first window appears before they load; warm_up() then loads
+# them in the background while the kiosk sits on the main menu.
+
 
 class AttendanceSystem:
-    def __init__(self):
+    def __init__(self, detector_options=None, matcher_options=None, profile=None):
+        self.profile = profile or StartupProfile(STARTED)
+        self.profile.mark("imports")
+
         self.root = tk.Tk()
         self.root.title("Smart Attendance System")
         self.root.geometry("1200x800")
@@ -19,17 +32,97 @@ class AttendanceSystem:
         self.center_window()
 
         # Initialize database
-        self.db = Database()
+        with self.profile.stage("open database"):
+            self.db = Database()
+        METRICS.add_source("cache", self.db.cache_stats, label="cache")
+
+        # Detector backend, downscaling and face size limits given on the command
+        # line; unset ones come from the site's calibration (see calibrate.py)
+        self.detector_options = detector_options or {}
 
-        # Initialize face detector
-        self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+        # One camera for every video window, opened in the background right away
+        self.camera = CameraManager(0).warm()
 
+        # Face matcher backend, see matchers.create_matcher()
+        self.matcher_options = matcher_options or {}
 
-        # Configure styles
-        self.configure_styles()
+        # The matcher and enrolled templates are loaded by warm_up() or on first use
+        self.face_matcher = None
+        self.face_identifier = None
+        self.identifier_lock = threading.RLock()
+        self.templates = None
 
-        # Create main container
-        self.create_main_page()
+        # A student who keeps clicking after being marked gets one popup, then status line updates
+        self.notify_cooldown = Cooldown()
+
+        with self.profile.stage("build main window"):
+            # Configure styles
+            self.configure_styles()
+
+            # Create main container
+            self.create_main_page()
+
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.root.after_idle(lambda: self.profile.mark("first window shown"))
+        self.warm_up()
+
+    @property
+    def matcher(self):
+        """The face matcher backend, created on first use"""
+        with self.identifier_lock:
+            if self.face_matcher is None:
+                from matchers import create_matcher
+                self.face_matcher = create_matcher(**self.matcher_options)
+            return self.face_matcher
+
+    @property
+    def identifier(self):
+        """Every enrolled template for 1:N identification, loaded on first use"""
+        return self.load_identifier()
+
+    def load_identifier(self):
+        """Load the enrolled templates now, if not yet loaded, and return the identifier"""
+        with self.identifier_lock:
+            if self.face_identifier is None:
+                from matchers import index_path_for
+                from recognition import FaceIdentifier
+                self.face_identifier = FaceIdentifier(self.db, index_path=index_path_for(self.matcher),
+                                                      matcher=self.matcher)
+            return self.face_identifier
+
+    def warm_up(self):
+        """Load the heavy modules and enrolled templates in the background"""
+        def run():
+            with self.profile.stage("import cv2 + numpy"):
+                import cv2
+                import numpy
+            with self.profile.stage("import PIL"):
+                from PIL import Image, ImageTk
+            with self.profile.stage("import recognition"):
+                import matchers
+                import pipeline
+                import recognition
+                import tracking
+            with self.profile.stage("load templates"):
+                self.load_identifier()
+            with self.profile.stage("load today's attendance"):
+                self.db.presence.today()
+            with self.profile.stage("wait for camera"):
+                self.camera.wait()
+            self.profile.record("open camera", self.camera.open_started, self.camera.open_finished)
+
+        self.warm_thread = threading.Thread(target=run, daemon=True)
+        self.warm_thread.start()
+
+    def report_startup(self):
+        """Print the startup profile once warm-up finishes, then exit"""
+        if self.warm_thread.is_alive():
+            self.root.after(50, self.report_startup)
+            return
+        print(self.profile.report())
+        if self.camera.error:
+            print(f"Camera unavailable: {self.camera.error}")
+        self.on_close()
 
     def center_window(self):
         """Center the window on the screen"""
@@ -40,6 +133,12 @@ class AttendanceSystem:
         y = (self.root.winfo_screenheight() // 2) - (height // 2)
         self.root.geometry(f'+{x}+{y}')
 
+    def create_detector(self):
+        """Create a tracking face detector for a camera pipeline"""
+        from detection import load_detector_options
+        from tracking import create_tracking_detector
+        return create_tracking_detector(load_detector_options(**self.detector_options))
+
     def configure_styles(self):
         """Configure custom styles for the application"""
         style = ttk.Style()
@@ -183,6 +282,12 @@ class AttendanceSystem:
                                   command=self.create_register_page)
         register_btn.pack(pady=20, ipadx=30, ipady=15)
 
+        quick_btn = ttk.Button(buttons_frame,
+                               text="Quick Attendance",
+                               style="Secondary.TButton",
+                               command=lambda: self.take_attendance(identify=True))
+        quick_btn.pack(pady=20, ipadx=30, ipady=15)
+
         # Footer
         footer_frame = ttk.Frame(main_frame, style="Main.TFrame")
         footer_frame.pack(side="bottom", pady=20)
@@ -277,7 +382,13 @@ class AttendanceSystem:
 
     def capture_face(self):
         """Capture face using webcam"""
-        cap = cv2.VideoCapture(0)
+        from PIL import Image, ImageTk
+        from pipeline import FramePipeline
+        from quality import QualityGate
+
+        # Only crops that pass the quality gate can be enrolled
+        pipeline = FramePipeline(self.camera, self.create_detector, display_size=(640, 480), workers=1,
+                                 release_capture=False, quality=QualityGate()).start()
 
         # Create a new window for face capture
         capture_window = tk.Toplevel(self.root)
@@ -300,30 +411,30 @@ class AttendanceSystem:
         btn_frame = ttk.Frame(capture_window)
         btn_frame.pack(pady=10)
 
+        def close():
+            pipeline.stop()
+            capture_window.destroy()
+
         def on_capture():
-            nonlocal cap
-            ret, frame = cap.read()
-            if ret:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-
-                if len(faces) > 0:
-                    x, y, w, h = faces[0]
-                    face = gray[y:y + h, x:x + w]
-                    self.face_template = cv2.resize(face, (100, 100))
-
-                    # Display captured face in the main form
-                    img = Image.fromarray(self.face_template)
-                    img = img.resize((200, 200), Image.LANCZOS)
-                    photo = ImageTk.PhotoImage(img)
-                    self.face_label.configure(image=photo)
-                    self.face_label.image = photo
-                    self.face_label.configure(text="")
-
-                    capture_window.destroy()
-                    cap.release()
-                else:
-                    messagebox.showerror("Error", "No face detected. Please try again.")
+            # Use the sharpest, largest, most frontal face of the last second,
+            # which with several people in view is the one closest to the camera
+            best = pipeline.best_face()
+            if best is not None:
+                self.face_template = best[0].copy()
+
+                # Display captured face in the main form
+                img = Image.fromarray(self.face_template)
+                img = img.resize((200, 200), Image.LANCZOS)
+                photo = ImageTk.PhotoImage(img)
+                self.face_label.configure(image=photo)
+                self.face_label.image = photo
+                self.face_label.configure(text="")
+
+                close()
+            elif pipeline.rejection:
+                messagebox.showerror("Error", f"Face {pipeline.rejection}. Please try again.")
+            else:
+                messagebox.showerror("Error", "No face detected. Please try again.")
 
         ttk.Button(btn_frame, text="Capture",
                    style="Primary.TButton",
@@ -331,26 +442,20 @@ class AttendanceSystem:
 
         ttk.Button(btn_frame, text="Cancel",
                    style="Danger.TButton",
-                   command=lambda: [capture_window.destroy(), cap.release()]).pack(side="right", padx=10, ipadx=20, ipady=5)
+                   command=close).pack(side="right", padx=10, ipadx=20, ipady=5)
 
-        # Function to update video feed
-        def update_video():
-            ret, frame = cap.read()
-            if ret:
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
+        capture_window.protocol("WM_DELETE_WINDOW", close)
 
-                for (x, y, w, h) in faces:
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                img = Image.fromarray(frame)
-                img = img.resize((640, 480), Image.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-
-                video_label.configure(image=photo)
-                video_label.image = photo
+        # One PhotoImage for the life of the window; each new frame is pasted into it
+        video_photo = pipeline.create_photo()
+        video_label.configure(image=video_photo)
+        video_label.image = video_photo
 
+        # Function to update video feed
+        def update_video():
+            if not pipeline.running:
+                return
+            pipeline.display(video_photo)
             video_label.after(10, update_video)
 
         update_video()
@@ -368,18 +473,27 @@ class AttendanceSystem:
             messagebox.showerror("Error", "Please fill all fields and capture a face")
             return
 
-        # Convert face template to bytes
+        import cv2
+        from recognition import encode_vector
+
+        # Convert face template to bytes, plus the raw feature vector used for matching
         face_template = cv2.imencode('.jpg', self.face_template)[1].tobytes()
+        face_vector = encode_vector(self.face_template)
+
+        # The identifier must be loaded first so it sees this user through its register hook
+        self.load_identifier()
 
         # Register user in database
-        if self.db.register_user(
-                self.name_var.get(),
-                self.enrollment_var.get(),
-                self.college_var.get(),
-                self.class_var.get(),
-                self.section_var.get(),
-                face_template
-        ):
+        user_id = self.db.register_user(
+            self.name_var.get(),
+            self.enrollment_var.get(),
+            self.college_var.get(),
+            self.class_var.get(),
+            self.section_var.get(),
+            face_template,
+            face_vector
+        )
+        if user_id:
             messagebox.showinfo("Success", "Registration successful!")
             self.create_main_page()
         else:
@@ -447,10 +561,12 @@ class AttendanceSystem:
         """Verify user login"""
         result = self.db.verify_login(self.login_name_var.get(), self.login_enrollment_var.get())
         if result:
+            if self.templates is None:
+                from recognition import TemplateCache
+                self.templates = TemplateCache(self.db, self.matcher)
+                METRICS.add_source("template_cache", self.templates.stats)
             self.user_id = result[0]
-            face_array = np.frombuffer(result[1], dtype=np.uint8)
-            self.stored_template = cv2.imdecode(face_array, cv2.IMREAD_GRAYSCALE)
-            self.stored_template = cv2.resize(self.stored_template, (100, 100))
+            self.stored_vector = self.templates.get(*result)
             self.create_options_page()
         else:
             messagebox.showerror("Error", "Invalid credentials")
@@ -497,8 +613,12 @@ class AttendanceSystem:
                    style="Success.TButton",  # Changed to success style for better visibility
                    command=self.view_attendance).pack(pady=15, ipadx=30, ipady=15)
 
-    def take_attendance(self):
+    def take_attendance(self, identify=False):
         """Take attendance using face recognition"""
+        # In identify mode the face is matched against every enrolled user
+        # instead of verifying the logged in one
+        self.identify_mode = identify
+
         attendance_window = tk.Toplevel(self.root)
         attendance_window.title("Take Attendance")
         attendance_window.geometry("1000x700")
@@ -519,6 +639,9 @@ class AttendanceSystem:
                                       style="Modern.TLabel")
         self.status_label.pack(side="left")
 
+        self.stats_label = ttk.Label(status_frame, text="", style="Modern.TLabel")
+        self.stats_label.pack(side="right")
+
         # Buttons with improved visibility
         btn_frame = ttk.Frame(attendance_window)
         btn_frame.pack(fill="x", padx=20, pady=20)
@@ -529,91 +652,165 @@ class AttendanceSystem:
 
         ttk.Button(btn_frame, text="Close",
                    style="Danger.TButton",
-                   command=attendance_window.destroy).pack(side="right", padx=10, ipadx=20, ipady=5)
-
-        # Start video capture
-        self.cap = cv2.VideoCapture(0)
+                   command=lambda: self.close_attendance(attendance_window)).pack(side="right", padx=10, ipadx=20, ipady=5)
+
+        attendance_window.protocol("WM_DELETE_WINDOW", lambda: self.close_attendance(attendance_window))
+
+        # Start video capture, detection and rendering in the background
+        # Faces are tracked between full detections, which needs frames in order on one worker
+        from pipeline import FramePipeline
+        from quality import QualityGate
+        self.pipeline = FramePipeline(self.camera, self.create_detector, display_size=(800, 600), workers=1,
+                                      release_capture=False, quality=QualityGate()).start()
+        # One PhotoImage for the life of the window; each new frame is pasted into it
+        self.video_photo = self.pipeline.create_photo()
+        self.video_label.configure(image=self.video_photo)
         self.update_video_feed()
 
         # Store window reference
         self.attendance_window = attendance_window
 
+    def close_attendance(self, window):
+        """Stop the camera pipeline and close the attendance window"""
+        self.pipeline.stop()
+        window.destroy()
+
     def update_video_feed(self):
         """Update the video feed in real-time"""
-        ret, frame = self.cap.read()
-        if ret:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-
-            for (x, y, w, h) in faces:
-                cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            img = Image.fromarray(frame)
-            img = img.resize((800, 600), Image.LANCZOS)
-            photo = ImageTk.PhotoImage(img)
+        if not self.pipeline.running:
+            return
 
-            self.video_label.configure(image=photo)
-            self.video_label.image = photo
+        # Paste only when the pipeline has rendered a newer frame
+        with METRICS.timer("ui.video_feed"):
+            if self.pipeline.display(self.video_photo):
+                stats = self.pipeline.stats()
+                self.stats_label.config(text=f"Camera {stats['capture_fps']:.0f} fps | "
+                                             f"Detection {stats['detect_fps']:.0f} fps | "
+                                             f"Display {stats['render_fps']:.0f} fps")
 
-            self.video_label.after(10, self.update_video_feed)
+        self.video_label.after(10, self.update_video_feed)
 
     def capture_and_mark_attendance(self, window):
         """Capture face and mark attendance"""
-        ret, frame = self.cap.read()
-        if ret:
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            faces = self.face_cascade.detectMultiScale(gray, 1.3, 5)
-
-            if len(faces) > 0:
-                x, y, w, h = faces[0]
-                face = gray[y:y + h, x:x + w]
-                face = cv2.resize(face, (100, 100))
-
-                # Compare with stored template
-                diff = cv2.absdiff(face, self.stored_template)
-                if np.mean(diff) < 50:  # Threshold for similarity
-                    # Get user info and mark attendance
-                    user_info = self.db.get_user_info(self.user_id)
-                    if user_info:
-                        name, enrollment = user_info[0], user_info[1]
-                        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                        # Update attendance in database
-                        success, message = self.db.mark_attendance(self.user_id, current_time)
-                        if success:
-                            self.status_label.config(text="Attendance marked successfully!")
-
-                            # Show success message in a dialog
-                            success_window = tk.Toplevel(window)
-                            success_window.title("Success")
-                            success_window.geometry("500x300")
-
-                            ttk.Label(success_window,
-                                      text="Attendance Marked Successfully!",
-                                      style="Title.TLabel").pack(pady=20)
-
-                            ttk.Label(success_window,
-                                      text=f"Name: {name}\nEnrollment: {enrollment}\nTime: {current_time}",
-                                      style="Modern.TLabel").pack(pady=10)
-
-                            ttk.Button(success_window,
-                                       text="OK",
-                                       style="Success.TButton",
-                                       command=lambda: [success_window.destroy(), window.destroy()]).pack(pady=20)
-
-                            self.cap.release()
-                            self.view_attendance()  # Show updated attendance
-                        else:
-                            messagebox.showwarning("Warning", message)
-                else:
-                    messagebox.showerror("Error", "Face not recognized. Please try again.")
+        clicked = time.perf_counter()
+        if self.identify_mode:
+            # Every face of the newest frame the pipeline has already run detection on
+            result = self.pipeline.latest()
+            if result is not None and len(result.faces) > 0:
+                self.mark_group_attendance(window, result.gray, result.faces, clicked)
             else:
                 messagebox.showerror("Error", "No face detected. Please try again.")
+            return
+
+        # The best faces of the last second rather than the newest frame, so a
+        # blink or motion blur at the moment of the click doesn't force a retry.
+        # Each person in view is compared, so a classmate nearer the camera
+        # doesn't hide the user.
+        good = self.pipeline.good_faces()
+        if good:
+            with METRICS.timer("verify"):
+                vectors = self.matcher.embed([face for face, _, _ in good])
+                distances = self.matcher.distances(vectors, self.stored_vector)
+            if distances.min() < self.matcher.threshold:
+                # Get user info and mark attendance
+                user_info = self.db.get_user_info(self.user_id)
+                if user_info:
+                    name, enrollment = user_info[0], user_info[1]
+                    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+                    # Update attendance in database
+                    success, message = self.db.mark_attendance(self.user_id, current_time)
+                    METRICS.observe("ui.click_to_commit", time.perf_counter() - clicked)
+                    if success:
+                        self.status_label.config(text="Attendance marked successfully!")
+
+                        # Show success message in a dialog
+                        success_window = tk.Toplevel(window)
+                        success_window.title("Success")
+                        success_window.geometry("500x300")
+
+                        ttk.Label(success_window,
+                                  text="Attendance Marked Successfully!",
+                                  style="Title.TLabel").pack(pady=20)
+
+                        ttk.Label(success_window,
+                                  text=f"Name: {name}\nEnrollment: {enrollment}\nTime: {current_time}",
+                                  style="Modern.TLabel").pack(pady=10)
+
+                        ttk.Button(success_window,
+                                   text="OK",
+                                   style="Success.TButton",
+                                   command=lambda: [success_window.destroy(), window.destroy()]).pack(pady=20)
+
+                        self.pipeline.stop()
+                        self.view_attendance()  # Show updated attendance
+                    elif self.notify_cooldown.ready(self.user_id):
+                        messagebox.showwarning("Warning", message)
+                    else:
+                        self.status_label.config(text=message)
+            else:
+                messagebox.showerror("Error", "Face not recognized. Please try again.")
+        elif self.pipeline.rejection:
+            messagebox.showerror("Error", f"Face {self.pipeline.rejection}. Please try again.")
+        else:
+            messagebox.showerror("Error", "No face detected. Please try again.")
+
+    def mark_group_attendance(self, window, gray, faces, clicked=None):
+        """Identify every face in the frame and mark them all in one transaction"""
+        # Blurry, tiny or turned-away faces are skipped rather than matched
+        crops, quality = self.pipeline.quality.crop(gray, faces)
+        if not quality.passed.any():
+            messagebox.showerror("Error", f"Face {quality.reason(0)}. Please try again.")
+            return
+        skipped = len(faces) - int(quality.passed.sum())
+
+        matches = self.identifier.best_matches(crops[quality.passed])
+        user_ids = [match[0] for match in matches if match]
+        if not user_ids:
+            messagebox.showerror("Error", "Face not recognized. Please try again.")
+            return
+
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        results = self.db.mark_attendance_bulk(user_ids, current_time)
+        if clicked is not None:
+            METRICS.observe("ui.click_to_commit", time.perf_counter() - clicked)
+
+        lines = []
+        for user_id, success, message in results:
+            name, enrollment = self.db.get_user_info(user_id)[:2]
+            lines.append(f"{name} ({enrollment}): {'Marked' if success else message}")
+        marked = sum(1 for _, success, _ in results if success)
+
+        self.status_label.config(text=f"Marked {marked} of {len(results)} recognized, "
+                                      f"{len(faces) - skipped - len(user_ids)} not recognized, "
+                                      f"{skipped} unclear")
+        # Every user is checked so each starts a cooldown; a group that was all
+        # marked and shown a moment ago only updates the status line
+        shown = [self.notify_cooldown.ready(user_id) for user_id, _, _ in results]
+        if not marked and not any(shown):
+            return
+
+        # Keep the camera running for the next group
+        result_window = tk.Toplevel(window)
+        result_window.title("Attendance")
+        result_window.geometry("600x500")
+
+        ttk.Label(result_window,
+                  text=f"Attendance Marked for {marked}",
+                  style="Title.TLabel").pack(pady=20)
+
+        ttk.Label(result_window,
+                  text="\n".join(lines) + f"\n\nTime: {current_time}",
+                  style="Modern.TLabel").pack(pady=10)
+
+        ttk.Button(result_window,
+                   text="OK",
+                   style="Success.TButton",
+                   command=result_window.destroy).pack(pady=20)
 
     def view_attendance(self):
-        """View attendance records"""
-        records = self.db.get_attendance(self.user_id)
+        """View attendance records, a page at a time as the list is scrolled"""
+        user_info = self.db.get_user_info(self.user_id)
 
         attendance_window = tk.Toplevel(self.root)
         attendance_window.title("Attendance Records")
@@ -644,27 +841,44 @@ class AttendanceSystem:
             tree.heading(col, text=col)
             tree.column(col, width=140, anchor="center")
 
+        # Only the rows scrolled into reach are fetched; the last one shown is
+        # where the next page starts
+        page = {"last": None, "done": False}
+
+        def load_page():
+            if page["done"]:
+                return
+            records = self.db.get_attendance_page(self.user_id, after=page["last"])
+            for record in records:
+                tree.insert("", "end", values=user_info + record)
+            if records:
+                page["last"] = records[-1][:2]
+            page["done"] = len(records) < ATTENDANCE_PAGE_SIZE
+
+        def on_scroll(first, last):
+            y_scrollbar.set(first, last)
+            # Fetch the next page as the bottom of the list comes into view
+            if float(last) > 0.9:
+                load_page()
+
         # Add scrollbars
         y_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
         x_scrollbar = ttk.Scrollbar(tree_frame, orient="horizontal", command=tree.xview)
-        tree.configure(yscrollcommand=y_scrollbar.set, xscrollcommand=x_scrollbar.set)
+        tree.configure(yscrollcommand=on_scroll, xscrollcommand=x_scrollbar.set)
 
         # Pack widgets
         tree.pack(side="left", fill="both", expand=True)
         y_scrollbar.pack(side="right", fill="y")
         x_scrollbar.pack(side="bottom", fill="x")
 
-        # Add records to treeview
-        for record in records:
-            tree.insert("", "end", values=record)
+        load_page()
 
         # Summary frame
         summary_frame = ttk.Frame(main_frame)
         summary_frame.pack(fill="x", pady=(20, 0))
 
-        # Calculate attendance statistics
-        total_days = len(records)
-        present_days = sum(1 for record in records if record[7] == "Present")
+        # Attendance statistics over the whole history, counted by SQLite
+        total_days, present_days = self.db.get_attendance_summary(self.user_id)
         attendance_percentage = (present_days / total_days * 100) if total_days > 0 else 0
 
         # Display statistics
@@ -674,18 +888,127 @@ class AttendanceSystem:
 
         # Export button with improved visibility
         ttk.Button(summary_frame, text="Export to Excel",
-                   style="Secondary.TButton").pack(side="right", padx=10, ipadx=10, ipady=5)
+                   style="Secondary.TButton",
+                   command=lambda: self.export_attendance(attendance_window)).pack(side="right", padx=10, ipadx=10, ipady=5)
 
         # Close button with improved visibility
         ttk.Button(summary_frame, text="Close",
                    style="Danger.TButton",
                    command=attendance_window.destroy).pack(side="right", padx=10, ipadx=20, ipady=5)
 
+    def export_attendance(self, parent):
+        """Export the user's attendance to Excel or CSV on a background thread"""
+        from export import AttendanceExporter, ExportCancelled
+
+        path = filedialog.asksaveasfilename(parent=parent,
+                                            title="Export Attendance",
+                                            defaultextension=".xlsx",
+                                            filetypes=[("Excel workbook", "*.xlsx"), ("CSV file", "*.csv")])
+        if not path:
+            return
+
+        exporter = AttendanceExporter(self.db, path, user_id=self.user_id).start()
+
+        progress_window = tk.Toplevel(parent)
+        progress_window.title("Exporting")
+        progress_window.geometry("400x160")
+
+        progress_label = ttk.Label(progress_window, text="Starting export...", style="Modern.TLabel")
+        progress_label.pack(pady=(20, 10))
+        progress_bar = ttk.Progressbar(progress_window, length=340, maximum=1.0)
+        progress_bar.pack(pady=5)
+        ttk.Button(progress_window, text="Cancel",
+                   style="Danger.TButton",
+                   command=exporter.cancel).pack(pady=10)
+
+        # The export thread never touches Tk; its progress is polled from here
+        def poll():
+            if not exporter.done:
+                progress_bar["value"] = exporter.fraction
+                progress_label.config(text=f"{exporter.written:,} of {exporter.total:,} rows")
+                progress_window.after(100, poll)
+                return
+
+            progress_window.destroy()
+            if isinstance(exporter.error, ExportCancelled):
+                return
+            if exporter.error:
+                messagebox.showerror("Error", f"Export failed: {exporter.error}", parent=parent)
+            else:
+                messagebox.showinfo("Success", f"Exported {exporter.written:,} records to {path}", parent=parent)
+
+        poll()
+
+    def on_close(self):
+        """Save state and shut down"""
+        if self.face_identifier is not None:
+            self.face_identifier.save_index()
+        self.camera.release()
+        self.db.close()
+        self.root.destroy()
+
     def run(self):
         """Run the application"""
         self.root.mainloop()
 
 
 if __name__ == "__main__":
-    app = AttendanceSystem()
-    app.run()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Smart Attendance System")
+    parser.add_argument("--headless", action="store_true",
+                        help="recognize faces from --source and mark attendance without a GUI")
+    parser.add_argument("--source", default="0",
+                        help="video file, image directory, stream URL or camera index (default: 0)")
+    parser.add_argument("--max-frames", type=int, default=None,
+                        help="stop after this many frames")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                        help="seconds between throughput reports")
+    parser.add_argument("--detector", choices=["haar", "lbp", "yunet"], default=None,
+                        help="face detector backend (default: the calibrated one, else haar)")
+    parser.add_argument("--detector-model", default=None,
+                        help="cascade XML or YuNet ONNX file for --detector, if not the default under models/")
+    parser.add_argument("--detect-scale", type=float, default=None,
+                        help="run face detection on a frame downscaled by this factor, e.g. 0.5 for 1080p")
+    parser.add_argument("--min-face", type=int, default=None,
+                        help="smallest face side to detect, in full-resolution pixels")
+    parser.add_argument("--max-face", type=int, default=None,
+                        help="largest face side to detect, in full-resolution pixels")
+    parser.add_argument("--matcher", choices=["pixel", "dnn"], default="pixel",
+                        help="face matcher: raw pixel difference, or embeddings from --embedding-model")
+    parser.add_argument("--embedding-model", default=None,
+                        help="ONNX face embedding model for --matcher dnn, e.g. OpenCV Zoo's SFace")
+    parser.add_argument("--dnn-threads", type=int, default=None,
+                        help="CPU threads for OpenCV, including DNN inference")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve stage latencies, FPS, queue depths and cache hit rates at "
+                             "http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-log", type=float, default=None,
+                        help="print a latency summary every this many seconds")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="print how long imports, database, window, templates and camera took, then exit")
+    args = parser.parse_args()
+
+    detector_options = {
+        "backend": args.detector,
+        "model_path": args.detector_model,
+        "scale": args.detect_scale,
+        "min_size": (args.min_face, args.min_face) if args.min_face else None,
+        "max_size": (args.max_face, args.max_face) if args.max_face else None,
+    }
+    matcher_options = {"name": args.matcher, "model_path": args.embedding_model, "threads": args.dnn_threads}
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.metrics_log:
+        MetricsLog(args.metrics_log).start()
+
+    if args.headless:
+        from headless import run_headless
+        run_headless(args.source, max_frames=args.max_frames, report_interval=args.report_interval,
+                     detector_options=detector_options, matcher_options=matcher_options)
+    else:
+        app = AttendanceSystem(detector_options, matcher_options)
+        if args.profile_startup:
+            app.report_startup()
+        app.run()
@@ -0,0 +1,80 @@
+"""Compare recall and latency of the IVF index against exact search.
+
+Usage: python benchmarks/bench_ann.py [--sizes 10000 100000 1000000] [--dim 625]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ann_index import IVFIndex
+
+
+def synthetic_templates(n, dim, rng, clusters=1000):
+    """Clustered vectors roughly shaped like coarse face descriptors"""
+    centers = rng.uniform(0, 255, (clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, clusters, n)]
+    vectors += rng.normal(0, 20, (n, dim)).astype(np.float32)
+    return vectors
+
+
+def exact_search(vectors, norms, query, k):
+    scores = norms - 2.0 * (vectors @ query)
+    top = np.argpartition(scores, k - 1)[:k]
+    return top[np.argsort(scores[top])]
+
+
+def run(n, dim, queries, k, nprobe, rng):
+    vectors = synthetic_templates(n, dim, rng)
+    # Probes are noisy re-captures of enrolled faces
+    targets = rng.choice(n, queries, replace=False)
+    probes = vectors[targets] + rng.normal(0, 10, (queries, dim)).astype(np.float32)
+
+    n_lists = max(16, int(4 * np.sqrt(n)))
+    index = IVFIndex(dim, n_lists=n_lists, nprobe=nprobe)
+    start = time.perf_counter()
+    index.add(np.arange(n), vectors)
+    if not index.trained:
+        index.train()
+    build_time = time.perf_counter() - start
+
+    norms = (vectors * vectors).sum(axis=1)
+    exact_ids, exact_time = [], time.perf_counter()
+    for probe in probes:
+        exact_ids.append(exact_search(vectors, norms, probe, k))
+    exact_time = (time.perf_counter() - exact_time) / queries
+
+    hits, start = 0, time.perf_counter()
+    for probe, truth in zip(probes, exact_ids):
+        ids, _ = index.search(probe, k)
+        hits += len(np.intersect1d(ids, truth))
+    ann_time = (time.perf_counter() - start) / queries
+
+    print(f"{n:>9,} | {n_lists:>6} | {nprobe:>6} | {build_time:>8.1f}s | "
+          f"{exact_time * 1000:>9.2f} | {ann_time * 1000:>9.2f} | {hits / (queries * k):>8.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=625,
+                        help="descriptor length (625 matches FaceIdentifier; lower it for 1M on small machines)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"dim={args.dim} k={args.k} queries={args.queries}")
+    print("    users |  lists | nprobe |     build | exact ms |   ann ms | recall@k")
+    for n in args.sizes:
+        run(n, args.dim, args.queries, args.k, args.nprobe, rng)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Measure Database query latency on a large synthetic attendance table.
+
+Runs each query shape against the tuned database (WAL, indexes, migrations)
+and against the same data with SQLite's defaults and no secondary indexes.
+
+Usage: python benchmarks/bench_database.py [--users 5000] [--rows 1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from fixtures import populate
+
+
+def untune(db):
+    """Undo the tuning layer: default journal and sync, only the UNIQUE index"""
+    db.conn.execute('DROP INDEX IF EXISTS idx_attendance_history')
+    db.conn.execute('PRAGMA journal_mode = DELETE')
+    db.conn.execute('PRAGMA synchronous = FULL')
+    db.conn.execute('PRAGMA cache_size = -2000')
+    db.conn.commit()
+
+
+def timed(fn, args_list):
+    """Median and p95 latency in milliseconds"""
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def run(db, users, next_day, samples, rng):
+    user_ids = [rng.randint(1, users) for _ in range(samples)]
+    day = next_day.isoformat()
+    results = {
+        "verify_login": timed(db.verify_login, [(f"Student {u}", f"EN{u:07d}") for u in user_ids]),
+        "get_attendance": timed(db.get_attendance, [(u,) for u in user_ids]),
+        "get_attendance_page": timed(db.get_attendance_page, [(u,) for u in user_ids]),
+        "get_attendance_summary": timed(db.get_attendance_summary, [(u,) for u in user_ids]),
+        "get_group_report(college)": timed(db.get_group_report,
+                                           [(None, None, f"College {u % 5}") for u in user_ids[:20]]),
+        "get_monthly_report(class)": timed(db.get_monthly_report,
+                                           [("2020-03", f"College {u % 5}", f"Class {u % 40}") for u in user_ids[:20]]),
+        "mark_attendance": timed(db.mark_attendance,
+                                 [(u, f"{day} 10:00:00") for u in dict.fromkeys(user_ids)]),
+        "mark_attendance_bulk(100)": timed(
+            db.mark_attendance_bulk,
+            [([rng.randint(1, users) for _ in range(100)], f"{next_day + timedelta(days=i + 1)} 10:00:00")
+             for i in range(max(samples // 20, 5))]),
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        next_day = populate(db, args.users, args.rows)
+        print(f"{args.rows:,} attendance rows for {args.users:,} users "
+              f"loaded in {time.perf_counter() - start:.1f}s")
+
+        tuned = run(db, args.users, next_day, args.samples, random.Random(args.seed))
+        untune(db)
+        untuned = run(db, args.users, next_day + timedelta(days=400), args.samples, random.Random(args.seed))
+        db.close()
+
+    print(f"{'query':<26} | {'default p50':>11} | {'default p95':>11} | {'tuned p50':>9} | {'tuned p95':>9}")
+    for name in tuned:
+        print(f"{name:<26} | {untuned[name][0]:>9.3f}ms | {untuned[name][1]:>9.3f}ms | "
+              f"{tuned[name][0]:>7.3f}ms | {tuned[name][1]:>7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Measure face detection speed and recall at different downscale factors.
+
+Faces are taken from the enrolled templates in the database (or a directory
+of face crops) and pasted at known positions into high-resolution frames;
+without either, drawn synthetic faces are used (see fixtures.py).
+
+Usage: python benchmarks/bench_detection.py [--resolution 1920x1080] [--scales 1 0.5 0.25]
+                                            [--detector haar|lbp|yunet]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection import create_detector
+from fixtures import synthetic_frames, synthetic_templates
+from tracking import iou
+
+
+def load_faces(db_path, faces_dir, rng):
+    """Grayscale face crops from a directory or the users table, else synthetic ones"""
+    if faces_dir:
+        faces = [cv2.imread(os.path.join(faces_dir, name), cv2.IMREAD_GRAYSCALE)
+                 for name in sorted(os.listdir(faces_dir))]
+    elif os.path.exists(db_path):
+        import sqlite3
+        conn = sqlite3.connect(db_path)
+        faces = [cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+                 for (blob,) in conn.execute('SELECT face_template FROM users')]
+        conn.close()
+    else:
+        faces = []
+    faces = [face for face in faces if face is not None]
+    if not faces:
+        print("No enrolled faces found; using synthetic ones")
+        faces = list(synthetic_templates(range(20), rng))
+    return faces
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default="data/attendance.db")
+    parser.add_argument("--faces", help="directory of face crops to use instead of the database")
+    parser.add_argument("--resolution", default="1920x1080")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.25])
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--faces-per-frame", type=int, default=4)
+    parser.add_argument("--face-size", type=int, nargs=2, default=[120, 360],
+                        help="range of face sides in pixels")
+    parser.add_argument("--detector", choices=["haar", "lbp", "yunet"], default="haar")
+    parser.add_argument("--detector-model", default=None, help="cascade XML or YuNet ONNX file for --detector")
+    parser.add_argument("--min-face", type=int, default=None)
+    parser.add_argument("--max-face", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    rng = np.random.default_rng(args.seed)
+    frames = synthetic_frames(load_faces(args.db, args.faces, rng), args.frames, width, height,
+                              args.faces_per_frame, args.face_size, rng)
+    total = sum(len(boxes) for _, boxes in frames)
+
+    print(f"{width}x{height}, {args.frames} frames, {total} faces")
+    print(" scale | ms/frame | speedup | recall | false positives")
+    baseline = None
+    for scale in args.scales:
+        detect = create_detector(
+            args.detector,
+            scale=scale,
+            model_path=args.detector_model,
+            min_size=(args.min_face, args.min_face) if args.min_face else None,
+            max_size=(args.max_face, args.max_face) if args.max_face else None,
+        )
+        found, false_positives, elapsed = 0, 0, 0.0
+        for frame, boxes in frames:
+            start = time.perf_counter()
+            detections = detect(frame)
+            elapsed += time.perf_counter() - start
+            if len(detections) == 0:
+                continue
+            matched = iou(boxes, detections) >= 0.5
+            found += int(matched.any(axis=1).sum())
+            false_positives += int((~matched.any(axis=0)).sum())
+
+        ms = elapsed / len(frames) * 1000
+        baseline = baseline or ms
+        print(f"{scale:>6.2f} | {ms:>8.1f} | {baseline / ms:>6.1f}x | {found / total:>6.3f} | {false_positives:>6}")
+
+
+if __name__ == "__main__":
+    main()
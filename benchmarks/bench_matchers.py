@@ -0,0 +1,152 @@
+"""Measure how accurately each face matcher tells enrolled people apart.
+
+Faces are cropped the way the app crops them (Haar detection on the
+grayscale image, largest face, resized to 100x100), the first image of
+each person is enrolled and the rest are probes. For every matcher it
+reports top-1 identification accuracy, genuine and impostor distances,
+the false accept and false reject rates at the matcher's threshold, and
+the threshold that keeps false accepts under --far on this data.
+
+Run it on photos from the site (one directory per person) before
+switching a kiosk to --matcher dnn; without --faces it uses synthetic
+faces, which only check that everything runs.
+
+Usage: python benchmarks/bench_matchers.py [--faces DIR] [--matchers pixel dnn]
+                                           [--embedding-model models/face_recognition_sface_2021dec.onnx]
+"""
+import argparse
+import os
+import sys
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection import create_detector
+from fixtures import draw_face
+from matchers import create_matcher
+from recognition import extract_face
+
+IMAGE_EXTENSIONS = ('.bmp', '.jpg', '.jpeg', '.png')
+
+
+def largest_face(detect, gray):
+    """The 100x100 crop of the largest detected face, or None"""
+    boxes = np.asarray(detect(gray), dtype=np.int32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return None
+    return extract_face(gray, boxes[np.argmax(boxes[:, 2] * boxes[:, 3])])
+
+
+def load_people(directory, detect):
+    """{person: [crops]} from a directory holding one sub-directory of photos per person"""
+    people, missed = {}, 0
+    for person in sorted(os.listdir(directory)):
+        folder = os.path.join(directory, person)
+        if not os.path.isdir(folder):
+            continue
+        for name in sorted(os.listdir(folder)):
+            if not name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            gray = cv2.imread(os.path.join(folder, name), cv2.IMREAD_GRAYSCALE)
+            face = largest_face(detect, gray) if gray is not None else None
+            if face is None:
+                missed += 1
+                continue
+            people.setdefault(person, []).append(face)
+    return people, missed
+
+
+def synthetic_people(count, captures, detect, rng):
+    """Synthetic people photographed `captures` times at varying size, position and exposure"""
+    people, missed = {}, 0
+    for identity in range(1, count + 1):
+        for _ in range(captures):
+            side = int(rng.integers(120, 220))
+            frame = np.full((320, 320), int(rng.integers(60, 120)), dtype=np.uint8)
+            x, y = rng.integers(0, 320 - side, 2)
+            frame[y:y + side, x:x + side] = draw_face(identity, side, rng)
+            frame = cv2.convertScaleAbs(frame, alpha=rng.uniform(0.8, 1.2), beta=rng.uniform(-20, 20))
+            face = largest_face(detect, frame)
+            if face is None:
+                missed += 1
+                continue
+            people.setdefault(identity, []).append(face)
+    return people, missed
+
+
+def split(people):
+    """Enroll each person's first crop; the others become probes labelled with the person's row"""
+    people = {person: faces for person, faces in people.items() if len(faces) >= 2}
+    gallery = np.stack([faces[0] for faces in people.values()])
+    probes = np.stack([face for faces in people.values() for face in faces[1:]])
+    labels = np.array([row for row, faces in enumerate(people.values()) for _ in faces[1:]])
+    return gallery, probes, labels
+
+
+def evaluate(matcher, gallery, probes, labels, far):
+    distances = matcher.distances(matcher.embed(probes), matcher.embed(gallery))
+    rows = np.arange(len(probes))
+    genuine = distances[rows, labels]
+    impostor_mask = np.ones(distances.shape, dtype=bool)
+    impostor_mask[rows, labels] = False
+    impostor = distances[impostor_mask]
+
+    best = distances.argmin(axis=1)
+    accepted = distances[rows, best] < matcher.threshold
+    # Threshold under which at most a `far` share of impostor pairs fall
+    suggested = float(np.quantile(impostor, far)) if len(impostor) else float("nan")
+    return {
+        "top1": float((best == labels).mean()),
+        # What the kiosk does: the closest user, if under the threshold
+        "correct": float((accepted & (best == labels)).mean()),
+        "wrong": float((accepted & (best != labels)).mean()),
+        "genuine": (float(np.median(genuine)), float(np.percentile(genuine, 95))),
+        "impostor": (float(np.percentile(impostor, 5)), float(np.median(impostor))),
+        "far": float((impostor < matcher.threshold).mean()),
+        "frr": float((genuine >= matcher.threshold).mean()),
+        "suggested": suggested,
+        "frr_at_suggested": float((genuine >= suggested).mean()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure face matcher accuracy")
+    parser.add_argument("--faces", default=None,
+                        help="directory with one sub-directory of face photos per person; synthetic if omitted")
+    parser.add_argument("--matchers", nargs="+", choices=["pixel", "dnn"], default=["pixel"])
+    parser.add_argument("--embedding-model", default=None, help="ONNX face embedding model for the dnn matcher")
+    parser.add_argument("--far", type=float, default=0.001,
+                        help="false accept rate the suggested threshold is chosen for (default: 0.001)")
+    parser.add_argument("--people", type=int, default=50, help="synthetic people")
+    parser.add_argument("--captures", type=int, default=5, help="synthetic photos per person")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    detect = create_detector()
+    if args.faces:
+        people, missed = load_people(args.faces, detect)
+        source = args.faces
+    else:
+        people, missed = synthetic_people(args.people, args.captures, detect, np.random.default_rng(args.seed))
+        source = "synthetic faces (run with --faces for real accuracy)"
+    gallery, probes, labels = split(people)
+    print(f"{source}: {len(gallery)} people enrolled, {len(probes)} probes, "
+          f"{missed} images without a detected face")
+
+    print(f"{'matcher':<26} | {'top-1':>6} | {'right':>6} | {'wrong':>6} | {'genuine p50/p95':>15} | "
+          f"{'impostor p5/p50':>15} | {'threshold':>9} | {'FAR':>6} | {'FRR':>6} | "
+          f"{'for FAR ' + str(args.far):>15} | {'FRR':>6}")
+    for name in args.matchers:
+        matcher = create_matcher(name, args.embedding_model)
+        result = evaluate(matcher, gallery, probes, labels, args.far)
+        print(f"{matcher.name:<26} | {result['top1']:>6.3f} | {result['correct']:>6.3f} | {result['wrong']:>6.3f} | "
+              f"{result['genuine'][0]:>7.3f}/{result['genuine'][1]:<7.3f} | "
+              f"{result['impostor'][0]:>7.3f}/{result['impostor'][1]:<7.3f} | {matcher.threshold:>9.3f} | "
+              f"{result['far']:>6.3f} | {result['frr']:>6.3f} | {result['suggested']:>15.3f} | "
+              f"{result['frr_at_suggested']:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
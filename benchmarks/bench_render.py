@@ -0,0 +1,96 @@
+"""Measure the per-frame cost of turning a camera frame into a Tk preview.
+
+Compares the old path (copy, draw, cvtColor, PIL LANCZOS resize, new
+PhotoImage) with FrameRenderer (resize into a preallocated buffer, draw at
+display scale, convert into a reused buffer, paste into one PhotoImage).
+The Tk stages are included only when a display is available.
+
+Usage: python benchmarks/bench_render.py [--resolution 1280x720] [--display 800x600]
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pipeline import FrameRenderer
+
+
+def legacy_render(frame, faces, display_size, photo_cls):
+    frame = frame.copy()
+    for (x, y, w, h) in faces:
+        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    image = Image.fromarray(frame).resize(display_size, Image.LANCZOS)
+    return photo_cls(image) if photo_cls else image
+
+
+def timed(render, frames):
+    samples = []
+    for frame, faces in frames:
+        start = time.perf_counter()
+        render(frame, faces)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return sum(samples) / len(samples), samples[len(samples) // 2], samples[int(len(samples) * 0.95)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--display", default="800x600")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--faces", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    display_size = tuple(int(v) for v in args.display.lower().split("x"))
+    rng = np.random.default_rng(args.seed)
+    base = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    frames = []
+    for _ in range(args.frames):
+        side = height // 4
+        faces = [(int(rng.integers(0, width - side)), int(rng.integers(0, height - side)), side, side)
+                 for _ in range(args.faces)]
+        frames.append((base, faces))
+
+    try:
+        import tkinter as tk
+        root = tk.Tk()
+        root.withdraw()
+    except Exception as e:
+        root = None
+        print(f"No display ({e.__class__.__name__}); timing the render thread only, without Tk")
+
+    renderer = FrameRenderer(display_size)
+    if root:
+        photo = ImageTk.PhotoImage(renderer.images[0].mode, display_size)
+
+        def zero_copy(frame, faces):
+            renderer.render(frame, faces)
+            renderer.paste_into(photo)
+    else:
+        zero_copy = renderer.render
+
+    results = {
+        "PIL LANCZOS + new PhotoImage" if root else "PIL LANCZOS":
+            timed(lambda f, b: legacy_render(f, b, display_size, ImageTk.PhotoImage if root else None), frames),
+        "FrameRenderer + paste" if root else "FrameRenderer": timed(zero_copy, frames),
+    }
+
+    print(f"{width}x{height} -> {display_size[0]}x{display_size[1]}, {args.frames} frames, {args.faces} faces")
+    print(f"{'path':<30} | {'mean':>8} | {'p50':>8} | {'p95':>8}")
+    for name, (mean, p50, p95) in results.items():
+        print(f"{name:<30} | {mean:>6.2f}ms | {p50:>6.2f}ms | {p95:>6.2f}ms")
+    if root:
+        root.destroy()
+
+
+if __name__ == "__main__":
+    main()
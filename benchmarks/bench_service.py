@@ -0,0 +1,151 @@
+"""Load-test the recognition service with many concurrent kiosk clients.
+
+Each client keeps one connection open and posts face crops (or whole frames
+with --mode frame) of enrolled users back to back. Without --port a service
+is started on a temporary database of synthetic users; run it twice with
+--max-batch 1 and the default to see what micro-batching buys.
+
+Usage: python benchmarks/bench_service.py [--clients 32] [--requests 2000] [--users 1000]
+                                          [--mode crop|frame] [--max-batch 64] [--port 8765]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database
+from fixtures import populate, synthetic_frames, synthetic_templates
+
+
+async def request(reader, writer, method, path, body=b"", content_type="application/octet-stream"):
+    """One request on a keep-alive connection; returns (status, parsed JSON)"""
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode().partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def client(host, port, payloads, path, content_type, count, latencies, errors, counts):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for i in range(count):
+            start = time.perf_counter()
+            status, result = await request(reader, writer, "POST", path, payloads[i % len(payloads)], content_type)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(result.get("error", status))
+                continue
+            counts["faces"] += len(result["faces"])
+            counts["recognized"] += sum(1 for face in result["faces"] if face["user_id"])
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, payloads, path, content_type, clients, requests):
+    latencies, errors = [], []
+    counts = {"faces": 0, "recognized": 0}
+    per_client = [requests // clients + (i < requests % clients) for i in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(host, port, payloads[i::clients] or payloads, path, content_type, count,
+                                  latencies, errors, counts)
+                           for i, count in enumerate(per_client)))
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, health = await request(reader, writer, "GET", "/health")
+    writer.close()
+    return elapsed, np.sort(latencies) * 1000, errors, counts, health
+
+
+def payloads_for(mode, users, count, rng):
+    """Encoded requests showing enrolled users: user i is synthetic identity i"""
+    identities = rng.integers(1, users + 1, count)
+    faces = synthetic_templates(identities, rng)
+    if mode == "crop":
+        return [face.tobytes() for face in faces], "/identify", "application/octet-stream"
+    frames = synthetic_frames(faces, count, 640, 480, 2, (120, 200), rng)
+    return [cv2.imencode(".jpg", frame)[1].tobytes() for frame, _ in frames], "/recognize", "image/jpeg"
+
+
+def start_service(tmp, users, max_batch):
+    """Run service.py on a fresh database of `users` synthetic users; returns (process, port)"""
+    db = Database(os.path.join(tmp, "service.db"))
+    populate(db, users, 0, synthetic_templates(range(1, users + 1), np.random.default_rng(0)))
+    db.close()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    # Run from the temporary directory so the service's ANN index lands there too
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "service.py"), "--db", "service.db",
+                                "--port", str(port), "--max-batch", str(max_batch)],
+                               cwd=tmp, stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith("Listening"):
+            return process, port
+    raise RuntimeError("The service exited before listening")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the recognition service")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent kiosk connections")
+    parser.add_argument("--requests", type=int, default=2000, help="requests sent in total")
+    parser.add_argument("--mode", choices=["crop", "frame"], default="crop",
+                        help="post 100x100 face crops to /identify or 640x480 JPEG frames to /recognize")
+    parser.add_argument("--users", type=int, default=1000, help="synthetic users enrolled in the started service")
+    parser.add_argument("--max-batch", type=int, default=64, help="--max-batch of the started service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="load an already running service instead of starting one")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    payloads, path, content_type = payloads_for(args.mode, args.users, min(args.requests, 200), rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        process = None
+        port = args.port
+        if port is None:
+            process, port = start_service(tmp, args.users, args.max_batch)
+        try:
+            elapsed, latencies, errors, counts, health = asyncio.run(
+                run_load(args.host, port, payloads, path, content_type, args.clients, args.requests))
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    print(f"{args.requests} {args.mode} requests from {args.clients} clients against {health['users']} users")
+    print(f"{args.requests / elapsed:.0f} requests/s | "
+          f"latency p50 {latencies[len(latencies) // 2]:.1f} ms, p95 {latencies[int(len(latencies) * 0.95)]:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)]:.1f} ms | errors {len(errors)}")
+    print(f"{counts['recognized']} of {counts['faces']} faces recognized | "
+          f"{health['batches']} match batches, {health['mean_batch']:.1f} faces per batch on average "
+          f"(largest {health['largest_batch']})")
+    if errors:
+        print(f"First error: {errors[0]}")
+
+
+if __name__ == "__main__":
+    main()
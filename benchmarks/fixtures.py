@@ -0,0 +1,146 @@
+"""Synthetic faces, video and databases for the benchmarks, generated offline.
+
+Faces are drawn (head, hair, eye sockets, brows, nose, mouth) so that the
+Haar cascade detects them; each identity has its own proportions and
+shading, fixed by its number, and every call adds fresh noise.
+"""
+import os
+import sys
+from datetime import date, timedelta
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recognition import TEMPLATE_SIZE, encode_vector
+from tracking import iou
+
+
+def face_identity(identity):
+    """Proportions and shading of one synthetic person"""
+    rng = np.random.default_rng(identity)
+    return {
+        "background": int(rng.integers(60, 120)),
+        "skin": int(rng.integers(165, 215)),
+        "hair": int(rng.integers(20, 60)),
+        "eye_spacing": float(rng.uniform(24, 32)),
+        "eye_height": float(rng.uniform(-22, -14)),
+        "brow_gap": float(rng.uniform(14, 20)),
+        "mouth_width": float(rng.uniform(16, 28)),
+        "mouth_height": float(rng.uniform(42, 54)),
+        "face_width": float(rng.uniform(60, 70)),
+    }
+
+
+def draw_face(identity, side, rng):
+    """A `side` x `side` grayscale face of `identity` with sensor-like noise"""
+    p = identity if isinstance(identity, dict) else face_identity(identity)
+    s = side / 200
+    skin = p["skin"]
+    image = np.full((side, side), p["background"], dtype=np.uint8)
+    cx, cy = side // 2, side // 2 + int(8 * s)
+
+    cv2.ellipse(image, (cx, cy - int(20 * s)), (int((p["face_width"] + 10) * s), int(92 * s)), 0, 180, 360,
+                p["hair"], -1)
+    cv2.ellipse(image, (cx, cy), (int(p["face_width"] * s), int(88 * s)), 0, 0, 360, skin, -1)
+    ex, ey = int(p["eye_spacing"] * s), int(p["eye_height"] * s)
+    for side_sign in (-1, 1):
+        x = cx + side_sign * ex
+        cv2.ellipse(image, (x, cy + ey), (int(20 * s), int(13 * s)), 0, 0, 360, skin - 60, -1)
+        cv2.ellipse(image, (x, cy + ey - int(p["brow_gap"] * s)), (int(18 * s), int(4 * s)), 0, 0, 360,
+                    skin - 130, -1)
+        cv2.ellipse(image, (x, cy + ey), (int(11 * s), int(6 * s)), 0, 0, 360, skin - 120, -1)
+        cv2.circle(image, (x, cy + ey), max(1, int(4 * s)), 15, -1)
+    cv2.rectangle(image, (cx - int(5 * s), cy - int(25 * s)), (cx + int(5 * s), cy + int(15 * s)),
+                  min(skin + 25, 255), -1)
+    cv2.ellipse(image, (cx, cy + int(22 * s)), (int(12 * s), int(5 * s)), 0, 0, 360, skin - 70, -1)
+    cv2.ellipse(image, (cx, cy + int(p["mouth_height"] * s)), (int(p["mouth_width"] * s), int(7 * s)), 0, 0, 360,
+                skin - 100, -1)
+
+    image = cv2.GaussianBlur(image, (0, 0), 2 * s)
+    return cv2.add(image, rng.integers(0, 10, image.shape, dtype=np.uint8))
+
+
+def synthetic_templates(identities, rng):
+    """(N, 100, 100) enrollment crops, one per identity number"""
+    return np.stack([draw_face(identity, TEMPLATE_SIZE[0], rng) for identity in identities])
+
+
+def synthetic_frames(faces, count, width, height, per_frame, sizes, rng):
+    """Frames with faces pasted on a noisy background, plus their true boxes"""
+    frames = []
+    for _ in range(count):
+        frame = cv2.GaussianBlur(rng.integers(60, 200, (height, width), dtype=np.uint8), (15, 15), 0)
+        boxes = []
+        for _ in range(per_frame * 10):
+            if len(boxes) == per_frame:
+                break
+            side = int(rng.integers(sizes[0], sizes[1] + 1))
+            x, y = int(rng.integers(0, width - side)), int(rng.integers(0, height - side))
+            if boxes and iou([(x, y, side, side)], boxes).max() > 0:
+                continue
+            face = faces[int(rng.integers(len(faces)))]
+            frame[y:y + side, x:x + side] = cv2.resize(face, (side, side))
+            boxes.append((x, y, side, side))
+        frames.append((frame, boxes))
+    return frames
+
+
+def write_video(path, frames, width, height, faces, rng, fps=30):
+    """An MJPG video of `faces` people drifting across a noisy background, like a doorway camera"""
+    side = height // 3
+    starts = [(int(rng.integers(0, width - side)), int(rng.integers(0, height - side))) for _ in range(faces)]
+    steps = [(int(rng.integers(-3, 4)), int(rng.integers(-2, 3))) for _ in range(faces)]
+    people = [draw_face(int(rng.integers(1 << 30)), side, rng) for _ in range(faces)]
+    background = cv2.GaussianBlur(rng.integers(60, 200, (height, width), dtype=np.uint8), (15, 15), 0)
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    for i in range(frames):
+        frame = background.copy()
+        for (x, y), (dx, dy), face in zip(starts, steps, people):
+            x = int(np.clip(x + dx * i, 0, width - side))
+            y = int(np.clip(y + dy * i, 0, height - side))
+            frame[y:y + side, x:x + side] = face
+        writer.write(cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR))
+    writer.release()
+    return path
+
+
+def populate(db, users, rows, templates=None):
+    """Fill users and attendance with `rows` records spread over consecutive days.
+
+    With `templates`, user i is enrolled with templates[i - 1] exactly as
+    registration stores it (JPEG plus raw vector); otherwise templates are empty.
+    Returns the first day without attendance.
+    """
+    def user_rows():
+        for i in range(1, users + 1):
+            if templates is not None:
+                template = templates[i - 1]
+                blob, vector = cv2.imencode('.jpg', template)[1].tobytes(), encode_vector(template)
+            else:
+                blob, vector = b'', None
+            yield (f"Student {i}", f"EN{i:07d}", f"College {i % 5}", f"Class {i % 40}", "ABCD"[i % 4],
+                   blob, vector)
+
+    days = -(-rows // users)
+    start = date(2020, 1, 1)
+
+    def records():
+        written = 0
+        for day in range(days):
+            day_str = (start + timedelta(days=day)).isoformat()
+            for user_id in range(1, users + 1):
+                if written == rows:
+                    return
+                yield user_id, day_str, f"09:{user_id % 60:02d}:00"
+                written += 1
+
+    with db.transaction() as cursor:
+        cursor.executemany('''
+                           INSERT INTO users (name, enrollment, college, class, section, face_template, face_vector)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)
+                           ''', user_rows())
+        cursor.executemany('INSERT INTO attendance (user_id, date, time) VALUES (?, ?, ?)', records())
+    return start + timedelta(days=days)
@@ -0,0 +1,295 @@
+"""Run every performance benchmark offline and record the results as JSON.
+
+Detection, tracking over a video, the quality gate, 1:N matching, the
+Database calls behind check-in and history, and the preview render path
+are timed on synthetic fixtures (see fixtures.py) generated from a fixed
+seed, so two runs on the same machine measure the same work. The suite
+runs --repeats times and every statistic is the median over the runs. With
+--compare the result is checked against an earlier JSON file; a case is
+reported as a regression (exit status 1) only when both its median and its
+mean slowed down by more than --tolerance.
+
+Usage: python benchmarks/suite.py [--scale small|medium|large] [--output results.json] [--repeats 5]
+                                  [--compare baseline.json] [--tolerance 0.25] [--only detect db]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+from detection import create_detector
+from fixtures import populate, synthetic_frames, synthetic_templates, write_video
+from pipeline import FrameRenderer
+from quality import QualityGate
+from recognition import FaceIdentifier
+from tracking import FaceTracker
+
+# Fixture sizes; --users, --rows and --samples override them
+SCALES = {
+    "small": {"users": 1_000, "rows": 1_000, "samples": 50},
+    "medium": {"users": 5_000, "rows": 100_000, "samples": 100},
+    "large": {"users": 20_000, "rows": 1_000_000, "samples": 200},
+}
+
+# Medians this much below the baseline in absolute terms are noise, not regressions
+MIN_REGRESSION_MS = 0.05
+
+# Runs of the whole suite per invocation. The medians of two single runs of
+# the same code can differ by 30% or more; the median over runs is steadier.
+REPEATS = 5
+
+
+def summarize(samples):
+    """Latency statistics in milliseconds from per-call samples in seconds"""
+    ms = np.sort(np.asarray(samples, dtype=np.float64)) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(ms[len(ms) // 2]),
+        "p95_ms": float(ms[int(len(ms) * 0.95)]),
+        "min_ms": float(ms[0]),
+    }
+
+
+def timed(fn, args_list, warmup=2):
+    """Call fn(*args) for every args tuple; the first `warmup` calls aren't counted"""
+    for args in args_list[:warmup]:
+        fn(*args)
+    samples = []
+    for args in args_list[warmup:]:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def bench_detection(config, rng, tmp):
+    faces = list(synthetic_templates(range(20), rng))
+    results = {}
+    for width, height in ((640, 480), (1280, 720)):
+        frames = synthetic_frames(faces, config["samples"] // 5 + 2, width, height, 2, (height // 6, height // 3), rng)
+        detect = create_detector()
+        results[f"detect.{width}x{height}"] = timed(detect, [(frame,) for frame, _ in frames])
+
+    # A fake doorway camera, tracked as headless mode does
+    path = write_video(os.path.join(tmp, "door.avi"), config["samples"] + 2, 640, 480, 2, rng)
+    cap = cv2.VideoCapture(path)
+    grays = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        grays.append((cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),))
+    cap.release()
+    tracker = FaceTracker(create_detector())
+    results["track.640x480"] = timed(tracker.update, grays)
+    return results
+
+
+def bench_recognition(config, rng, db, templates):
+    identifier = FaceIdentifier(db)
+    count = min(config["samples"], len(templates))
+    # Probes are fresh captures of enrolled identities; user i is identity i
+    identities = rng.choice(len(templates), count + 2, replace=False) + 1
+    probes = synthetic_templates(identities, rng)
+    boxes = [(0, 0, 100, 100)]
+    gate = QualityGate()
+
+    correct = sum(1 for probe, identity in zip(probes, identities)
+                  if (identifier.identify(probe) or [(None,)])[0][0] == identity)
+    results = {
+        "quality.assess": timed(gate.assess, [(probe[None], boxes) for probe in probes]),
+        f"match.identify.{len(templates)}": timed(identifier.identify_batch, [(probe[None],) for probe in probes]),
+        # Batches wrap around the probes so this case gets as many samples as the others
+        f"match.identify_batch8.{len(templates)}": timed(
+            identifier.identify_batch, [(probes[np.arange(8 * i, 8 * i + 8) % len(probes)],)
+                                        for i in range(len(probes))]),
+    }
+    results[f"match.identify.{len(templates)}"]["top1_accuracy"] = correct / len(probes)
+    return results
+
+
+def bench_database(config, rng, db, next_day):
+    users, samples = config["users"], config["samples"]
+    user_ids = [int(rng.integers(1, users + 1)) for _ in range(samples + 2)]
+    distinct = list(dict.fromkeys(user_ids))
+    day = next_day.isoformat()
+    # The cached lookups are timed through their uncached queries
+    return {
+        "db.verify_login": timed(db._verify_login, [(f"Student {u}", f"EN{u:07d}") for u in user_ids]),
+        "db.get_user_info": timed(db._get_user_info, [(u,) for u in user_ids]),
+        "db.mark_attendance": timed(db.mark_attendance, [(u, f"{day} 10:00:00") for u in distinct]),
+        "db.mark_attendance_bulk100": timed(
+            db.mark_attendance_bulk,
+            [([int(u) for u in rng.integers(1, users + 1, 100)], f"{next_day + timedelta(days=i + 1)} 10:00:00")
+             for i in range(max(samples // 5, 12))]),
+        "db.get_attendance": timed(db.get_attendance, [(u,) for u in user_ids]),
+        "db.get_attendance_page": timed(db.get_attendance_page, [(u,) for u in user_ids]),
+        "db.get_attendance_summary": timed(db.get_attendance_summary, [(u,) for u in user_ids]),
+        "db.get_group_report": timed(db.get_group_report, [(None, None, f"College {u % 5}") for u in user_ids]),
+    }
+
+
+def bench_render(config, rng):
+    frame = rng.integers(0, 256, (720, 1280, 3), dtype=np.uint8)
+    renderer = FrameRenderer((800, 600))
+    faces = [(100, 100, 240, 240), (600, 200, 200, 200)]
+    return {"render.1280x720": timed(renderer.render, [(frame, faces)] * (config["samples"] + 2))}
+
+
+BENCHMARKS = ("detect", "match", "db", "render")
+
+
+def run_suite(config, seed, only=None):
+    """Generate the fixtures and run the selected benchmark groups; returns {case: stats}"""
+    # One generator per group, so running a subset doesn't change the others' fixtures
+    rngs = {name: np.random.default_rng((seed, i)) for i, name in enumerate(("enroll",) + BENCHMARKS)}
+    only = only or BENCHMARKS
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        if "detect" in only:
+            results.update(bench_detection(config, rngs["detect"], tmp))
+        if "match" in only or "db" in only:
+            templates = synthetic_templates(range(1, config["users"] + 1), rngs["enroll"])
+            db = Database(os.path.join(tmp, "bench.db"))
+            start = time.perf_counter()
+            next_day = populate(db, config["users"], config["rows"], templates)
+            print(f"{config['rows']:,} attendance rows for {config['users']:,} users "
+                  f"loaded in {time.perf_counter() - start:.1f}s")
+            if "match" in only:
+                results.update(bench_recognition(config, rngs["match"], db, templates))
+            if "db" in only:
+                results.update(bench_database(config, rngs["db"], db, next_day))
+            db.close()
+        if "render" in only:
+            results.update(bench_render(config, rngs["render"]))
+    return results
+
+
+def combine(runs):
+    """Merge the results of repeated suite runs: each statistic is its median over the runs"""
+    combined = {}
+    for name, first in runs[0].items():
+        stats = [run[name] for run in runs]
+        merged = {key: float(np.median([run[key] for run in stats])) for key in first}
+        merged["n"] = sum(run["n"] for run in stats)
+        merged["min_ms"] = min(run["min_ms"] for run in stats)
+        merged["p50_runs_ms"] = [run["p50_ms"] for run in stats]
+        combined[name] = merged
+    return combined
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print each case against the baseline; returns the names of regressed cases"""
+    regressions = []
+    print(f"{'case':<36} | {'baseline':>10} | {'current':>10} | {'p50':>8} | {'mean':>8} |")
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print(f"{name:<36} | {'-':>10} | {stats['p50_ms']:>8.3f}ms | {'':>8} | {'':>8} | new")
+            continue
+        change = stats["p50_ms"] / max(before["p50_ms"], 1e-9) - 1
+        mean_change = stats["mean_ms"] / max(before["mean_ms"], 1e-9) - 1
+        status = ""
+        # A slow outlier moves only the mean and a shifted median only the p50; a real slowdown moves both
+        if (change > tolerance and mean_change > tolerance
+                and stats["p50_ms"] - before["p50_ms"] > MIN_REGRESSION_MS):
+            status = "REGRESSION"
+            regressions.append(name)
+        elif change < -tolerance and mean_change < -tolerance:
+            status = "faster"
+        print(f"{name:<36} | {before['p50_ms']:>8.3f}ms | {stats['p50_ms']:>8.3f}ms | {change:>+7.0%} | "
+              f"{mean_change:>+7.0%} | {status}")
+    for name in baseline:
+        if name not in results:
+            print(f"{name:<36} | {baseline[name]['p50_ms']:>8.3f}ms | {'-':>10} | {'':>8} | {'':>8} | not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--users", type=int, help="enrolled users (overrides --scale)")
+    parser.add_argument("--rows", type=int, help="attendance rows (overrides --scale)")
+    parser.add_argument("--samples", type=int, help="timed calls per case (overrides --scale)")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="run only these groups")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=REPEATS,
+                        help=f"runs of the whole suite; statistics are medians over them (default: {REPEATS})")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="slowdown of the median and the mean, as a fraction, that counts as a regression")
+    args = parser.parse_args()
+
+    config = dict(SCALES[args.scale])
+    for key in ("users", "rows", "samples"):
+        if getattr(args, key):
+            config[key] = getattr(args, key)
+    # Benchmarks are single-threaded so results don't depend on the core count
+    cv2.setNumThreads(1)
+
+    start = time.perf_counter()
+    runs = []
+    for i in range(args.repeats):
+        print(f"Run {i + 1} of {args.repeats}")
+        runs.append(run_suite(config, args.seed, args.only))
+    results = combine(runs)
+    report = {"environment": environment(), "config": dict(config, seed=args.seed, repeats=args.repeats),
+              "results": results}
+    print(f"Finished in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'case':<36} | {'p50':>10} | {'p95':>10} | {'n':>5} | p50 of each run")
+    for name, stats in results.items():
+        print(f"{name:<36} | {stats['p50_ms']:>8.3f}ms | {stats['p95_ms']:>8.3f}ms | {stats['n']:>5} | "
+              + " ".join(f"{p50:.3f}" for p50 in stats["p50_runs_ms"]))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get("config") != report["config"]:
+            print("\nWarning: the baseline was run with a different configuration")
+        print()
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nNo regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe bounded mapping that evicts the least recently used entry.
+
+    Counts hits and misses so callers can see whether the cache earns its
+    memory. Shared between the GUI and worker threads, hence the lock.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Bumped by every invalidation, so a load that raced one isn't stored
+        self.generation = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_or_load(self, key, load):
+        """Return the cached value for `key`, calling `load()` on a miss.
+
+        None results are not cached, so a lookup that found nothing is
+        retried next time instead of hiding a row written later.
+        """
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+            generation = self.generation
+
+        # Load outside the lock so a slow query doesn't stall other threads
+        value = load()
+        if value is not None:
+            with self.lock:
+                if generation == self.generation:
+                    self._store(key, value)
+        return value
+
+    def put(self, key, value):
+        with self.lock:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def pop(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def discard_where(self, predicate):
+        """Drop every entry for which predicate(key, value) is true"""
+        with self.lock:
+            self.generation += 1
+            for key in [key for key, value in self.entries.items() if predicate(key, value)]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,200 @@
+import csv
+import itertools
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+from detection import (BACKENDS, DETECTOR_CONFIG, LBP_CASCADE_PATH, YUNET_MODEL_PATH, create_detector,
+                       save_detector_options)
+from headless import open_source
+from tracking import iou
+
+# Share of the labelled faces a configuration must find to be chosen
+TARGET_RECALL = 0.95
+
+# Detections matching no labelled face, per frame, that are still acceptable
+MAX_FALSE_POSITIVES = 0.05
+
+# Overlap at which a detection counts as finding a labelled face
+MATCH_IOU = 0.5
+
+# Settings tried for each backend; every combination is measured
+SEARCH_SPACE = {
+    "haar": {"scale": (1.0, 0.75, 0.5), "scale_factor": (1.1, 1.2, 1.3), "min_neighbors": (3, 5)},
+    "lbp": {"scale": (1.0, 0.75, 0.5), "scale_factor": (1.1, 1.2, 1.3), "min_neighbors": (3, 5)},
+    "yunet": {"scale": (1.0, 0.75, 0.5), "score_threshold": (0.6, 0.75, 0.9)},
+}
+
+
+def read_labels(path):
+    """Labelled boxes by frame index from a CSV file with a frame,x,y,w,h header"""
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            labels.setdefault(int(row["frame"]), []).append(
+                (int(row["x"]), int(row["y"]), int(row["w"]), int(row["h"])))
+    return labels
+
+
+def write_labels(path, source, detect, max_frames=None):
+    """Write every detection of `detect` as a draft labels file, to be checked by hand"""
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(("frame", "x", "y", "w", "h"))
+        for index, gray in enumerate(gray_frames(source, max_frames)):
+            for box in detect(gray):
+                writer.writerow((index, *(int(v) for v in box)))
+                count += 1
+    return count
+
+
+def gray_frames(source, max_frames=None):
+    for index, frame in enumerate(open_source(source)):
+        if index == max_frames:
+            return
+        yield cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def candidates(backend_options):
+    """Every option set of the search space, for each backend with its fixed options"""
+    for backend, options in backend_options.items():
+        space = SEARCH_SPACE[backend]
+        for values in itertools.product(*space.values()):
+            yield dict(options, backend=backend, **dict(zip(space, values)))
+
+
+def measure(detect, source, labels, max_frames=None):
+    """Run a detector over the clip; returns fps, recall and false positives per frame"""
+    frames, found, false_positives, elapsed = 0, 0, 0, 0.0
+    for index, gray in enumerate(gray_frames(source, max_frames)):
+        if index == 0:
+            # Lazy initialization (DNN graphs, cascade buffers) isn't part of the steady state
+            detect(gray)
+        start = time.perf_counter()
+        detections = np.asarray(detect(gray), dtype=np.int32).reshape(-1, 4)
+        elapsed += time.perf_counter() - start
+        frames += 1
+
+        boxes = labels.get(index, [])
+        if len(detections) == 0:
+            continue
+        if not boxes:
+            false_positives += len(detections)
+            continue
+        matched = iou(boxes, detections) >= MATCH_IOU
+        found += int(matched.any(axis=1).sum())
+        false_positives += int((~matched.any(axis=0)).sum())
+
+    labelled = sum(len(labels.get(index, [])) for index in range(frames))
+    return {"frames": frames, "fps": frames / max(elapsed, 1e-9), "recall": found / max(labelled, 1),
+            "false_positives_per_frame": false_positives / max(frames, 1)}
+
+
+def calibrate(source, labels, backend_options, target_recall=TARGET_RECALL,
+              max_false_positives=MAX_FALSE_POSITIVES, max_frames=None):
+    """Measure every candidate; returns (all results, fastest one meeting the targets or None)"""
+    results = []
+    for options in candidates(backend_options):
+        result = measure(create_detector(**options), source, labels, max_frames)
+        result["options"] = options
+        result["meets_target"] = (result["recall"] >= target_recall
+                                  and result["false_positives_per_frame"] <= max_false_positives)
+        results.append(result)
+        print(f"{describe(options):<54} | {result['fps']:>7.1f} | {result['recall']:>6.3f} | "
+              f"{result['false_positives_per_frame']:>6.3f} | {'yes' if result['meets_target'] else ''}")
+    passing = [result for result in results if result["meets_target"]]
+    return results, max(passing, key=lambda result: result["fps"]) if passing else None
+
+
+def save_calibration(best, source, target_recall=TARGET_RECALL, max_false_positives=MAX_FALSE_POSITIVES,
+                     path=DETECTOR_CONFIG):
+    """Save the chosen calibrate() result with what it was measured on, for load_detector_options()"""
+    calibration = {key: best[key] for key in ("fps", "recall", "false_positives_per_frame", "frames")}
+    calibration.update(source=source, target_recall=target_recall, max_false_positives=max_false_positives,
+                       calibrated=datetime.now().isoformat(timespec="seconds"))
+    save_detector_options(best["options"], calibration, path)
+
+
+def describe(options):
+    tuned = {key: value for key, value in options.items() if key in SEARCH_SPACE[options["backend"]]}
+    return options["backend"] + " " + " ".join(f"{key}={value}" for key, value in tuned.items())
+
+
+def available_backends(backend_options):
+    """The backends whose cascade or model can be loaded; the rest are reported and skipped"""
+    usable = {}
+    for backend, options in backend_options.items():
+        try:
+            create_detector(backend, **options)
+        except IOError as e:
+            print(f"Skipping {backend}: {e}")
+            continue
+        usable[backend] = options
+    return usable
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Pick the fastest face detector setting that finds enough of the faces in a labelled clip")
+    parser.add_argument("source", help="video file or image directory recorded at this site")
+    parser.add_argument("labels", help="CSV of frame,x,y,w,h face boxes for the clip")
+    parser.add_argument("--write-labels", action="store_true",
+                        help="instead of calibrating, write a draft labels file from a thorough "
+                             "detector, to be corrected by hand")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL,
+                        help=f"share of the labelled faces that must be found (default: {TARGET_RECALL})")
+    parser.add_argument("--max-false-positives", type=float, default=MAX_FALSE_POSITIVES,
+                        help=f"false detections allowed per frame (default: {MAX_FALSE_POSITIVES})")
+    parser.add_argument("--max-frames", type=int, default=None, help="only use the first frames of the clip")
+    parser.add_argument("--min-face", type=int, default=None,
+                        help="smallest face side to detect, in full-resolution pixels")
+    parser.add_argument("--max-face", type=int, default=None,
+                        help="largest face side to detect, in full-resolution pixels")
+    parser.add_argument("--lbp-cascade", default=LBP_CASCADE_PATH, help="LBP face cascade XML file")
+    parser.add_argument("--yunet-model", default=YUNET_MODEL_PATH, help="YuNet face detection ONNX model")
+    parser.add_argument("--output", default=DETECTOR_CONFIG,
+                        help=f"where to save the chosen setting (default: {DETECTOR_CONFIG})")
+    args = parser.parse_args()
+
+    base_options = {}
+    if args.min_face:
+        base_options["min_size"] = (args.min_face, args.min_face)
+    if args.max_face:
+        base_options["max_size"] = (args.max_face, args.max_face)
+
+    if args.write_labels:
+        # Small steps and a full-resolution pass find faces the fast settings may miss
+        detect = create_detector("haar", scale_factor=1.05, min_neighbors=5, **base_options)
+        count = write_labels(args.labels, args.source, detect, args.max_frames)
+        print(f"Wrote {count} face boxes to {args.labels}; check them before calibrating")
+        raise SystemExit
+
+    # Options every candidate of a backend shares: face size limits and model files
+    backend_options = {backend: dict(base_options) for backend in args.backends}
+    if "lbp" in backend_options:
+        backend_options["lbp"]["model_path"] = args.lbp_cascade
+    if "yunet" in backend_options:
+        backend_options["yunet"]["model_path"] = args.yunet_model
+    backend_options = available_backends(backend_options)
+    if not backend_options:
+        raise SystemExit("No detector backend could be loaded")
+
+    labels = read_labels(args.labels)
+    print(f"{'setting':<54} | {'fps':>7} | {'recall':>6} | {'fp/frm':>6} | target met")
+    results, best = calibrate(args.source, labels, backend_options, args.target_recall,
+                              args.max_false_positives, args.max_frames)
+    if best is None:
+        closest = max(results, key=lambda result: result["recall"])
+        raise SystemExit(f"\nNo setting reached recall {args.target_recall} with at most "
+                         f"{args.max_false_positives} false positives per frame; the best recall was "
+                         f"{closest['recall']:.3f} ({describe(closest['options'])}). Nothing was saved.")
+
+    save_calibration(best, args.source, args.target_recall, args.max_false_positives, args.output)
+    print(f"\nSaved {describe(best['options'])} ({best['fps']:.1f} fps, recall {best['recall']:.3f}) "
+          f"to {args.output}")
@@ -0,0 +1,95 @@
+import threading
+import time
+
+# Seconds between attempts to open a camera that could not be opened
+RETRY_INTERVAL = 2.0
+
+
+class CameraManager:
+    """One camera opened once and shared by every window that shows video.
+
+    Opening a webcam and waiting for its exposure to settle takes seconds, so
+    warm() opens the device on a background thread at startup and it stays
+    open for the life of the app. Pipelines read through read() exactly as
+    they would from a cv2.VideoCapture; only release() closes the device.
+    A camera that failed to open (unplugged, busy) is tried again by warm(),
+    at most every `retry_interval` seconds.
+    """
+
+    def __init__(self, source=0, warmup_frames=5, retry_interval=RETRY_INTERVAL):
+        self.source = source
+        self.warmup_frames = warmup_frames
+        self.retry_interval = retry_interval
+        self.cap = None
+        self.error = None
+        # perf_counter() when opening started and finished, for startup profiling
+        self.open_started = None
+        self.open_finished = None
+        self.opened = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.released = False
+
+    def warm(self):
+        """Start opening the camera in the background, unless it is open or being opened"""
+        with self.lock:
+            if self.thread is None or self._retry_due():
+                self.opened.clear()
+                self.thread = threading.Thread(target=self._open, daemon=True)
+                self.thread.start()
+        return self
+
+    def _retry_due(self):
+        # The last attempt finished without a camera and the retry interval has passed
+        return (self.cap is None and not self.released and self.opened.is_set()
+                and time.perf_counter() - self.open_finished >= self.retry_interval)
+
+    def wait(self, timeout=None):
+        """Block until the camera is open; True if it delivered frames"""
+        self.warm()
+        self.opened.wait(timeout)
+        return self.cap is not None
+
+    def _open(self):
+        import cv2
+
+        self.open_started = time.perf_counter()
+        try:
+            cap = cv2.VideoCapture(self.source)
+            if not cap.isOpened():
+                raise IOError(f"Could not open camera {self.source}")
+            # Keep the driver queue short so a reader never sees stale frames
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            for _ in range(self.warmup_frames):
+                cap.read()
+            with self.lock:
+                if self.released:
+                    # release() ran while the device was opening
+                    cap.release()
+                else:
+                    self.cap = cap
+                    self.error = None
+        except Exception as e:
+            self.error = e
+        finally:
+            self.open_finished = time.perf_counter()
+            self.opened.set()
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        """Read the next frame; (False, None) while the camera is still opening"""
+        if not self.wait(timeout=0.1):
+            return False, None
+        with self.lock:
+            if self.cap is None:
+                return False, None
+            return self.cap.read()
+
+    def release(self):
+        with self.lock:
+            self.released = True
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
@@ -1,122 +1,505 @@
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 
+from cache import LRUCache
+from metrics import METRICS
+from presence import PresenceSet
+
+DB_PATH = 'data/attendance.db'
+
+# Rows fetched per page of attendance history
+ATTENDANCE_PAGE_SIZE = 100
+
+# Users whose details and login rows are kept in memory
+USER_CACHE_SIZE = 1024
+
+
+def _create_tables(cursor):
+    # Create users table
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS users
+                   (
+                       id
+                       INTEGER
+                       PRIMARY
+                       KEY
+                       AUTOINCREMENT,
+                       name
+                       TEXT
+                       NOT
+                       NULL,
+                       enrollment
+                       TEXT
+                       UNIQUE
+                       NOT
+                       NULL,
+                       college
+                       TEXT
+                       NOT
+                       NULL,
+                       class
+                       TEXT
+                       NOT
+                       NULL,
+                       section
+                       TEXT
+                       NOT
+                       NULL,
+                       face_template
+                       BLOB
+                       NOT
+                       NULL,
+                       registration_date
+                       TEXT
+                       DEFAULT
+                       CURRENT_TIMESTAMP
+                   )
+                   ''')
+
+    # Create attendance table
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS attendance
+                   (
+                       id
+                       INTEGER
+                       PRIMARY
+                       KEY
+                       AUTOINCREMENT,
+                       user_id
+                       INTEGER
+                       NOT
+                       NULL,
+                       date
+                       TEXT
+                       NOT
+                       NULL,
+                       time
+                       TEXT
+                       NOT
+                       NULL,
+                       status
+                       TEXT
+                       DEFAULT
+                       'Present',
+                       FOREIGN
+                       KEY
+                   (
+                       user_id
+                   ) REFERENCES users
+                   (
+                       id
+                   )
+                       )
+                   ''')
+
+
+def _add_face_vector(cursor):
+    # Precomputed feature vectors live next to the legacy JPEG templates
+    cursor.execute('PRAGMA table_info(users)')
+    if 'face_vector' not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute('ALTER TABLE users ADD COLUMN face_vector BLOB')
+
+
+def _add_unique_attendance(cursor):
+    # One attendance record per user per day, enforced by the database.
+    # Older databases may hold duplicates from the old check-then-insert race.
+    cursor.execute('''
+                   DELETE FROM attendance
+                   WHERE id NOT IN (SELECT MIN(id) FROM attendance GROUP BY user_id, date)
+                   ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_user_date ON attendance (user_id, date)')
+
+
+def _add_history_index(cursor):
+    # Covers get_attendance: filter on user_id, sort on date and time, read status
+    cursor.execute('''
+                   CREATE INDEX IF NOT EXISTS idx_attendance_history
+                       ON attendance (user_id, date, time, status)
+                   ''')
+
+
+def _rebuild_rollups(cursor):
+    # Recompute every rollup row from the attendance table
+    cursor.execute('DELETE FROM attendance_daily')
+    cursor.execute('DELETE FROM attendance_monthly')
+    cursor.execute('''
+                   INSERT INTO attendance_daily (date, college, class, section, present)
+                   SELECT a.date, u.college, u.class, u.section, COUNT(*)
+                   FROM attendance a
+                            JOIN users u ON a.user_id = u.id
+                   WHERE a.status = 'Present'
+                   GROUP BY a.date, u.college, u.class, u.section
+                   ''')
+    cursor.execute('''
+                   INSERT INTO attendance_monthly (month, user_id, present)
+                   SELECT substr(date, 1, 7), user_id, COUNT(*)
+                   FROM attendance
+                   WHERE status = 'Present'
+                   GROUP BY substr(date, 1, 7), user_id
+                   ''')
+
+
+def _add_rollups(cursor):
+    # Materialized attendance counts for reports: present students per day per
+    # class/section, and present days per month per user. Triggers keep them
+    # current as attendance rows are written, so reports never scan attendance.
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS attendance_daily
+                   (
+                       date    TEXT    NOT NULL,
+                       college TEXT    NOT NULL,
+                       class   TEXT    NOT NULL,
+                       section TEXT    NOT NULL,
+                       present INTEGER NOT NULL,
+                       PRIMARY KEY (date, college, class, section)
+                   ) WITHOUT ROWID
+                   ''')
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS attendance_monthly
+                   (
+                       month   TEXT    NOT NULL,
+                       user_id INTEGER NOT NULL,
+                       present INTEGER NOT NULL,
+                       PRIMARY KEY (month, user_id)
+                   ) WITHOUT ROWID
+                   ''')
+    # Class sizes for report denominators, read straight from the index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_group ON users (college, class, section)')
+
+    cursor.execute('''
+                   CREATE TRIGGER IF NOT EXISTS attendance_rollup_insert
+                       AFTER INSERT ON attendance
+                       WHEN NEW.status = 'Present'
+                   BEGIN
+                       INSERT INTO attendance_daily (date, college, class, section, present)
+                       SELECT NEW.date, college, class, section, 1
+                       FROM users
+                       WHERE id = NEW.user_id
+                       ON CONFLICT (date, college, class, section) DO UPDATE SET present = present + 1;
+                       INSERT INTO attendance_monthly (month, user_id, present)
+                       VALUES (substr(NEW.date, 1, 7), NEW.user_id, 1)
+                       ON CONFLICT (month, user_id) DO UPDATE SET present = present + 1;
+                   END
+                   ''')
+    cursor.execute('''
+                   CREATE TRIGGER IF NOT EXISTS attendance_rollup_delete
+                       AFTER DELETE ON attendance
+                       WHEN OLD.status = 'Present'
+                   BEGIN
+                       UPDATE attendance_daily
+                       SET present = present - 1
+                       WHERE date = OLD.date
+                         AND (college, class, section) =
+                             (SELECT college, class, section FROM users WHERE id = OLD.user_id);
+                       UPDATE attendance_monthly
+                       SET present = present - 1
+                       WHERE month = substr(OLD.date, 1, 7)
+                         AND user_id = OLD.user_id;
+                   END
+                   ''')
+    _rebuild_rollups(cursor)
+
+
+def _add_rollup_update_triggers(cursor):
+    # Keep the rollups current when attendance rows or users' groups are edited
+    # in place: the old counts are taken back and the new ones added
+    cursor.execute('''
+                   CREATE TRIGGER IF NOT EXISTS attendance_rollup_update
+                       AFTER UPDATE OF user_id, date, status ON attendance
+                   BEGIN
+                       UPDATE attendance_daily
+                       SET present = present - 1
+                       WHERE OLD.status = 'Present'
+                         AND date = OLD.date
+                         AND (college, class, section) =
+                             (SELECT college, class, section FROM users WHERE id = OLD.user_id);
+                       UPDATE attendance_monthly
+                       SET present = present - 1
+                       WHERE OLD.status = 'Present'
+                         AND month = substr(OLD.date, 1, 7)
+                         AND user_id = OLD.user_id;
+                       INSERT INTO attendance_daily (date, college, class, section, present)
+                       SELECT NEW.date, college, class, section, 1
+                       FROM users
+                       WHERE id = NEW.user_id
+                         AND NEW.status = 'Present'
+                       ON CONFLICT (date, college, class, section) DO UPDATE SET present = present + 1;
+                       INSERT INTO attendance_monthly (month, user_id, present)
+                       SELECT substr(NEW.date, 1, 7), NEW.user_id, 1
+                       WHERE NEW.status = 'Present'
+                       ON CONFLICT (month, user_id) DO UPDATE SET present = present + 1;
+                   END
+                   ''')
+    cursor.execute('''
+                   CREATE TRIGGER IF NOT EXISTS users_rollup_group_update
+                       AFTER UPDATE OF college, class, section ON users
+                       WHEN (OLD.college, OLD.class, OLD.section) IS NOT (NEW.college, NEW.class, NEW.section)
+                   BEGIN
+                       UPDATE attendance_daily
+                       SET present = present - (SELECT COUNT(*)
+                                                FROM attendance
+                                                WHERE user_id = NEW.id
+                                                  AND date = attendance_daily.date
+                                                  AND status = 'Present')
+                       WHERE (college, class, section) = (OLD.college, OLD.class, OLD.section)
+                         AND date IN (SELECT date FROM attendance WHERE user_id = NEW.id AND status = 'Present');
+                       INSERT INTO attendance_daily (date, college, class, section, present)
+                       SELECT date, NEW.college, NEW.class, NEW.section, COUNT(*)
+                       FROM attendance
+                       WHERE user_id = NEW.id
+                         AND status = 'Present'
+                       GROUP BY date
+                       ON CONFLICT (date, college, class, section) DO UPDATE SET present = present + excluded.present;
+                   END
+                   ''')
+    # Databases edited before these triggers existed may have drifted
+    _rebuild_rollups(cursor)
+
+
+def _add_face_embeddings(cursor):
+    # Vectors of matchers that can't derive them from the template for free,
+    # e.g. DNN embeddings, keyed by matcher name. Delete a user's rows here
+    # whenever their template changes.
+    cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS face_embeddings
+                   (
+                       model   TEXT    NOT NULL,
+                       user_id INTEGER NOT NULL,
+                       vector  BLOB    NOT NULL,
+                       PRIMARY KEY (model, user_id)
+                   ) WITHOUT ROWID
+                   ''')
+
+
+# Schema migrations in order. PRAGMA user_version records how many have been
+# applied, so each runs exactly once per database. Only ever append.
+MIGRATIONS = [
+    _create_tables,
+    _add_face_vector,
+    _add_unique_attendance,
+    _add_history_index,
+    _add_rollups,
+    _add_face_embeddings,
+    _add_rollup_update_triggers,
+]
+
+# Connection settings: WAL lets readers run alongside the writer and, with
+# synchronous=NORMAL, commits no longer fsync on every transaction
+PRAGMAS = [
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+]
+
 
 class Database:
-    def __init__(self):
+    """Connection manager for the attendance database.
+
+    Every thread gets its own SQLite connection on first use, so GUI code,
+    detection workers, exporters and report builders can all read in
+    parallel (WAL keeps readers from blocking on the writer). Writes go
+    through transaction(), which serializes writers across threads.
+    """
+
+    def __init__(self, path=DB_PATH):
         # Create database directory if it doesn't exist
-        if not os.path.exists('data'):
-            os.makedirs('data')
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
 
-        self.conn = sqlite3.connect('data/attendance.db')
-        self.create_tables()
+        self.path = path
+        self.local = threading.local()
+        self.connections = []
+        self.connections_lock = threading.Lock()
+        self.write_lock = threading.RLock()
+        self.migrate_schema()
 
-    def create_tables(self):
-        cursor = self.conn.cursor()
+        # Callbacks run with (user_id, face_template, face_vector) after a user registers
+        self.register_hooks = []
+        # Callbacks run with a user_id whenever that user's row is written
+        self.invalidate_hooks = []
 
-        # Create users table
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS users
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           name
-                           TEXT
-                           NOT
-                           NULL,
-                           enrollment
-                           TEXT
-                           UNIQUE
-                           NOT
-                           NULL,
-                           college
-                           TEXT
-                           NOT
-                           NULL,
-                           class
-                           TEXT
-                           NOT
-                           NULL,
-                           section
-                           TEXT
-                           NOT
-                           NULL,
-                           face_template
-                           BLOB
-                           NOT
-                           NULL,
-                           registration_date
-                           TEXT
-                           DEFAULT
-                           CURRENT_TIMESTAMP
-                       )
-                       ''')
+        # Read-through caches for the per-user lookups repeated on every visit
+        self.user_info_cache = LRUCache(USER_CACHE_SIZE)
+        self.login_cache = LRUCache(USER_CACHE_SIZE)
 
-        # Create attendance table
-        cursor.execute('''
-                       CREATE TABLE IF NOT EXISTS attendance
-                       (
-                           id
-                           INTEGER
-                           PRIMARY
-                           KEY
-                           AUTOINCREMENT,
-                           user_id
-                           INTEGER
-                           NOT
-                           NULL,
-                           date
-                           TEXT
-                           NOT
-                           NULL,
-                           time
-                           TEXT
-                           NOT
-                           NULL,
-                           status
-                           TEXT
-                           DEFAULT
-                           'Present',
-                           FOREIGN
-                           KEY
-                       (
-                           user_id
-                       ) REFERENCES users
-                       (
-                           id
-                       )
-                           )
-                       ''')
+        # Users marked today, so a duplicate check-in is rejected without SQL
+        self.presence = PresenceSet(self._present_on)
+
+    @property
+    def conn(self):
+        """This thread's connection, opened on first use"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            # Every query uses constant SQL text, so the statement cache keeps them all prepared.
+            # Connections never leave their thread; the check is off only so close() can reach them.
+            conn = sqlite3.connect(self.path, cached_statements=256, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self.local.conn = conn
+            with self.connections_lock:
+                self.connections.append(conn)
+        return conn
 
-        self.conn.commit()
+    @contextmanager
+    def transaction(self):
+        """Run a block as one write transaction and yield its cursor.
 
-    def register_user(self, name, enrollment, college, class_, section, face_template):
+        Writers from different threads are serialized, and the write lock is
+        taken in SQLite up front (BEGIN IMMEDIATE) so checks made inside the
+        block can't go stale. A block nested in another on the same thread
+        joins the enclosing transaction; after_commit() defers work until
+        the outermost block has committed.
+        """
+        with self.write_lock:
+            conn = self.conn
+            # Nesting is counted per thread rather than read off conn.in_transaction,
+            # which is also true after a raw write that was never committed
+            depth = getattr(self.local, 'depth', 0)
+            if depth == 0 and conn.in_transaction:
+                raise sqlite3.OperationalError("Uncommitted write outside transaction() on this connection")
+            self.local.depth = depth + 1
+            try:
+                if depth:
+                    yield conn.cursor()
+                    return
+
+                self.local.on_commit = []
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    yield conn.cursor()
+                    with METRICS.timer("db.commit"):
+                        conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            finally:
+                self.local.depth = depth
+            callbacks, self.local.on_commit = self.local.on_commit, []
+            for callback in callbacks:
+                callback()
+
+    def after_commit(self, callback):
+        """Call callback() once the calling thread's transaction commits; at once outside a transaction"""
+        if getattr(self.local, 'depth', 0):
+            self.local.on_commit.append(callback)
+        else:
+            callback()
+
+    def migrate_schema(self):
+        """Apply pending schema migrations, each in its own transaction"""
+        version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            with self.transaction() as cursor:
+                migration(cursor)
+                cursor.execute(f'PRAGMA user_version = {number}')
+
+    def register_user(self, name, enrollment, college, class_, section, face_template, face_vector=None):
         try:
-            cursor = self.conn.cursor()
-            cursor.execute('''
-                           INSERT INTO users (name, enrollment, college, class, section, face_template)
-                           VALUES (?, ?, ?, ?, ?, ?)
-                           ''', (name, enrollment, college, class_, section, face_template))
-            self.conn.commit()
-            return True
+            with self.transaction() as cursor:
+                cursor.execute('''
+                               INSERT INTO users (name, enrollment, college, class, section, face_template, face_vector)
+                               VALUES (?, ?, ?, ?, ?, ?, ?)
+                               ''', (name, enrollment, college, class_, section, face_template, face_vector))
+
+            self.invalidate_user(cursor.lastrowid)
+            for hook in self.register_hooks:
+                hook(cursor.lastrowid, face_template, face_vector)
+            return cursor.lastrowid
         except sqlite3.IntegrityError:
             return False
 
+    def invalidate_user(self, user_id):
+        """Drop cached data of a user; call after any write to their row"""
+        self.user_info_cache.pop(user_id)
+        self.login_cache.discard_where(lambda key, row: row[0] == user_id)
+        for hook in self.invalidate_hooks:
+            hook(user_id)
+
+    def cache_stats(self):
+        return {"user_info": self.user_info_cache.stats(), "login": self.login_cache.stats()}
+
+    @METRICS.timed("db.verify_login")
     def verify_login(self, name, enrollment):
+        return self.login_cache.get_or_load((name, enrollment),
+                                            lambda: self._verify_login(name, enrollment))
+
+    def _verify_login(self, name, enrollment):
         cursor = self.conn.cursor()
         cursor.execute('''
-                       SELECT id, face_template
+                       SELECT id, face_template, face_vector
                        FROM users
                        WHERE name = ?
                          AND enrollment = ?
                        ''', (name, enrollment))
         return cursor.fetchone()
 
+    @METRICS.timed("db.get_face_templates")
+    def get_face_templates(self):
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       SELECT id, face_template, face_vector
+                       FROM users
+                       ORDER BY id
+                       ''')
+        return cursor.fetchall()
+
+    def get_face_embeddings(self, model):
+        """Stored vectors of a matcher, by user id"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       SELECT user_id, vector
+                       FROM face_embeddings
+                       WHERE model = ?
+                       ''', (model,))
+        return dict(cursor.fetchall())
+
+    def save_face_embeddings(self, model, rows):
+        """Store (user_id, vector) pairs computed by a matcher"""
+        with self.transaction() as cursor:
+            cursor.executemany('''
+                               INSERT OR REPLACE INTO face_embeddings (model, user_id, vector)
+                               VALUES (?, ?, ?)
+                               ''', [(model, user_id, vector) for user_id, vector in rows])
+
+    def migrate_face_vectors(self):
+        """Convert JPEG templates of users without a feature vector"""
+        from recognition import decode_template, encode_vector
+
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       SELECT id, face_template
+                       FROM users
+                       WHERE face_vector IS NULL
+                       ''')
+        updates = [(encode_vector(decode_template(blob)), user_id) for user_id, blob in cursor.fetchall()]
+
+        with self.transaction() as cursor:
+            cursor.executemany('''
+                               UPDATE users
+                               SET face_vector = ?
+                               WHERE id = ?
+                               ''', updates)
+        for _, user_id in updates:
+            self.invalidate_user(user_id)
+        return len(updates)
+
+    def _present_on(self, day):
+        """Ids of the users with attendance on the YYYY-MM-DD `day`"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT user_id FROM attendance WHERE date = ?', (day,))
+        return [user_id for user_id, in cursor.fetchall()]
+
+    @METRICS.timed("db.get_user_info")
     def get_user_info(self, user_id):
+        return self.user_info_cache.get_or_load(user_id, lambda: self._get_user_info(user_id))
+
+    def _get_user_info(self, user_id):
         cursor = self.conn.cursor()
         cursor.execute('''
                        SELECT name, enrollment, college, class, section
@@ -125,36 +508,95 @@ class Database:
                        ''', (user_id,))
         return cursor.fetchone()
 
+    @METRICS.timed("db.mark_attendance")
     def mark_attendance(self, user_id, datetime_str):
+        # A face that stays in front of the camera is answered from memory
+        if self.presence.contains(user_id, datetime_str[:10]):
+            return False, "Attendance already marked for today"
         try:
             # Split datetime into date and time components
             dt = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
             date = dt.strftime("%Y-%m-%d")
             time = dt.strftime("%H:%M:%S")
 
-            cursor = self.conn.cursor()
-
-            # Check if attendance already marked for today
-            cursor.execute('''
-                           SELECT id
-                           FROM attendance
-                           WHERE user_id = ? AND date = ?
-                           ''', (user_id, date))
+            # Insert new attendance record unless one already exists for today
+            with self.transaction() as cursor:
+                cursor.execute('''
+                               INSERT INTO attendance (user_id, date, time)
+                               VALUES (?, ?, ?)
+                               ON CONFLICT (user_id, date) DO NOTHING
+                               ''', (user_id, date, time))
+                # Marked either way: now, or earlier by another connection
+                self.after_commit(lambda: self.presence.add(user_id, date))
 
-            if cursor.fetchone():
+            if cursor.rowcount == 0:
                 return False, "Attendance already marked for today"
-
-            # Insert new attendance record
-            cursor.execute('''
-                           INSERT INTO attendance (user_id, date, time)
-                           VALUES (?, ?, ?)
-                           ''', (user_id, date, time))
-
-            self.conn.commit()
             return True, "Attendance marked successfully"
         except Exception as e:
             return False, str(e)
 
+    @METRICS.timed("db.mark_attendance_bulk")
+    def mark_attendance_bulk(self, user_ids, datetime_str):
+        """Mark attendance for several users in one transaction"""
+        user_ids = list(dict.fromkeys(user_ids))
+        day = datetime_str[:10]
+        if all(self.presence.contains(user_id, day) for user_id in user_ids):
+            return [(user_id, False, "Attendance already marked for today") for user_id in user_ids]
+        try:
+            dt = datetime.strptime(datetime_str, "%Y-%m-%d %H:%M:%S")
+            date = dt.strftime("%Y-%m-%d")
+            time = dt.strftime("%H:%M:%S")
+
+            marked = set(self.insert_attendance([(user_id, date, time) for user_id in user_ids]))
+        except Exception as e:
+            return [(user_id, False, str(e)) for user_id in user_ids]
+
+        return [(user_id, True, "Attendance marked successfully") if (user_id, date) in marked
+                else (user_id, False, "Attendance already marked for today")
+                for user_id in user_ids]
+
+    @METRICS.timed("db.insert_attendance")
+    def insert_attendance(self, rows):
+        """Insert (user_id, date, time) rows in one transaction.
+
+        Returns the (user_id, date) pairs that were newly marked. Rows for a
+        user who already has a record that day are skipped.
+        """
+        rows = [row for row in rows if not self.presence.contains(row[0], row[1])]
+        if not rows:
+            return []
+
+        # First event per user and day wins
+        unique = {}
+        users_by_date = {}
+        for user_id, date, time in rows:
+            if (user_id, date) not in unique:
+                unique[(user_id, date)] = time
+                users_by_date.setdefault(date, []).append(user_id)
+
+        with self.transaction() as cursor:
+            existing = set()
+            for date, user_ids in users_by_date.items():
+                for i in range(0, len(user_ids), 500):
+                    chunk = user_ids[i:i + 500]
+                    cursor.execute(f'''
+                                   SELECT user_id, date
+                                   FROM attendance
+                                   WHERE date = ? AND user_id IN ({', '.join('?' * len(chunk))})
+                                   ''', [date] + chunk)
+                    existing.update(cursor.fetchall())
+
+            new_rows = [(user_id, date, time) for (user_id, date), time in unique.items()
+                        if (user_id, date) not in existing]
+            cursor.executemany('''
+                               INSERT INTO attendance (user_id, date, time)
+                               VALUES (?, ?, ?)
+                               ON CONFLICT (user_id, date) DO NOTHING
+                               ''', new_rows)
+            self.after_commit(lambda: self.presence.update(unique))
+
+        return [(user_id, date) for user_id, date, _ in new_rows]
+
     def get_attendance(self, user_id):
         cursor = self.conn.cursor()
         cursor.execute('''
@@ -173,5 +615,285 @@ class Database:
                        ''', (user_id,))
         return cursor.fetchall()
 
+    @METRICS.timed("db.get_attendance_page")
+    def get_attendance_page(self, user_id, after=None, limit=ATTENDANCE_PAGE_SIZE):
+        """One page of a user's (date, time, status) records, newest first.
+
+        Pass the (date, time) of the last row already shown as `after` to get
+        the next page. Seeking on the history index keeps every page as cheap
+        as the first, however far back the user scrolls.
+        """
+        cursor = self.conn.cursor()
+        if after is None:
+            cursor.execute('''
+                           SELECT date, time, status
+                           FROM attendance
+                           WHERE user_id = ?
+                           ORDER BY date DESC, time DESC
+                           LIMIT ?
+                           ''', (user_id, limit))
+        else:
+            cursor.execute('''
+                           SELECT date, time, status
+                           FROM attendance
+                           WHERE user_id = ? AND (date, time) < (?, ?)
+                           ORDER BY date DESC, time DESC
+                           LIMIT ?
+                           ''', (user_id, after[0], after[1], limit))
+        return cursor.fetchall()
+
+    @METRICS.timed("db.get_attendance_summary")
+    def get_attendance_summary(self, user_id):
+        """(total days, present days) of a user's attendance"""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       SELECT COUNT(*), COALESCE(SUM(status = 'Present'), 0)
+                       FROM attendance
+                       WHERE user_id = ?
+                       ''', (user_id,))
+        return cursor.fetchone()
+
+    def rebuild_rollups(self):
+        """Recompute the report tables from the attendance table"""
+        with self.transaction() as cursor:
+            _rebuild_rollups(cursor)
+
+    @METRICS.timed("db.get_group_report")
+    def get_group_report(self, start=None, end=None, college=None):
+        """Attendance per class and section between two dates, inclusive.
+
+        Returns (college, class, section, students, days, present, percentage)
+        rows. `days` counts the days the college took any attendance, and the
+        percentage is present / (students * days). Reads only the rollup
+        tables and the users index, never the attendance table.
+        """
+        start, end = start or '0000-00-00', end or '9999-99-99'
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       WITH enrolled AS (SELECT college, class, section, COUNT(*) AS students
+                                         FROM users
+                                         WHERE ?3 IS NULL OR college = ?3
+                                         GROUP BY college, class, section),
+                            present AS (SELECT college, class, section, SUM(present) AS present
+                                        FROM attendance_daily
+                                        WHERE date BETWEEN ?1 AND ?2
+                                          AND (?3 IS NULL OR college = ?3)
+                                        GROUP BY college, class, section),
+                            days AS (SELECT college, COUNT(DISTINCT date) AS days
+                                     FROM attendance_daily
+                                     WHERE date BETWEEN ?1 AND ?2
+                                       AND (?3 IS NULL OR college = ?3)
+                                     GROUP BY college)
+                       SELECT e.college,
+                              e.class,
+                              e.section,
+                              e.students,
+                              COALESCE(d.days, 0),
+                              COALESCE(p.present, 0),
+                              COALESCE(100.0 * p.present / (e.students * d.days), 0)
+                       FROM enrolled e
+                                LEFT JOIN present p USING (college, class, section)
+                                LEFT JOIN days d USING (college)
+                       ORDER BY e.college, e.class, e.section
+                       ''', (start, end, college))
+        return cursor.fetchall()
+
+    @METRICS.timed("db.get_monthly_report")
+    def get_monthly_report(self, month, college=None, class_=None, section=None):
+        """Present days of each student in a month ('YYYY-MM'), optionally for one class.
+
+        Returns (user_id, name, enrollment, class, section, present, days,
+        percentage) rows, where `days` counts the days the student's college
+        took any attendance that month.
+        """
+        cursor = self.conn.cursor()
+        cursor.execute('''
+                       WITH days AS (SELECT college, COUNT(DISTINCT date) AS days
+                                     FROM attendance_daily
+                                     WHERE date BETWEEN ?1 || '-01' AND ?1 || '-31'
+                                     GROUP BY college)
+                       SELECT u.id,
+                              u.name,
+                              u.enrollment,
+                              u.class,
+                              u.section,
+                              COALESCE(m.present, 0),
+                              COALESCE(d.days, 0),
+                              COALESCE(100.0 * m.present / d.days, 0)
+                       FROM users u
+                                LEFT JOIN attendance_monthly m ON m.month = ?1 AND m.user_id = u.id
+                                LEFT JOIN days d ON d.college = u.college
+                       WHERE (?2 IS NULL OR u.college = ?2)
+                         AND (?3 IS NULL OR u.class = ?3)
+                         AND (?4 IS NULL OR u.section = ?4)
+                       ORDER BY u.college, u.class, u.section, u.name
+                       ''', (month, college, class_, section))
+        return cursor.fetchall()
+
+    def _export_filter(self, user_id, college):
+        if user_id is not None:
+            return 'WHERE a.user_id = ?', (user_id,)
+        if college is not None:
+            return 'WHERE u.college = ?', (college,)
+        return '', ()
+
+    def count_export_rows(self, user_id=None, college=None):
+        """Number of attendance records iter_attendance_rows() will yield"""
+        where, params = self._export_filter(user_id, college)
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+                       SELECT COUNT(*)
+                       FROM attendance a
+                                JOIN users u ON a.user_id = u.id
+                       {where}
+                       ''', params)
+        return cursor.fetchone()[0]
+
+    def iter_attendance_rows(self, user_id=None, college=None, batch_size=5000):
+        """Yield lists of attendance records with user details, `batch_size` rows at a time.
+
+        Records of one user, one college or everyone. Rows are read off the
+        open cursor batch by batch and never collected, so memory stays flat
+        however large the table is. Call from the thread that consumes them.
+        """
+        where, params = self._export_filter(user_id, college)
+        # Rowid order needs no sort, so the first batch arrives immediately
+        cursor = self.conn.cursor()
+        cursor.execute(f'''
+                       SELECT u.name,
+                              u.enrollment,
+                              u.college,
+                              u.class,
+                              u.section,
+                              a.date,
+                              a.time,
+                              a.status
+                       FROM attendance a
+                                JOIN users u ON a.user_id = u.id
+                       {where}
+                       ORDER BY a.id
+                       ''', params)
+        try:
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+
+    def release(self):
+        """Close the calling thread's connection, for threads that are about to exit"""
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            with self.connections_lock:
+                self.connections.remove(conn)
+            conn.close()
+            self.local.conn = None
+
     def close(self):
-        self.conn.close()
\ No newline at end of file
+        """Close the connections of every thread, at shutdown.
+
+        Only call this once no other thread will use the database again;
+        a thread that finishes while others carry on calls release().
+        """
+        with self.connections_lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+        self.local = threading.local()
+
+
+class AttendanceWriter:
+    """Background thread that batches attendance events into bulk inserts.
+
+    Recognition code calls submit() and never waits on SQLite. The writer
+    drains whatever has queued up (up to `batch_size` events) and writes it
+    with one insert_attendance() transaction on its own connection from
+    the shared `db`.
+    `on_result` is called from the writer thread with the list of
+    (user_id, date) pairs newly marked by each batch. A batch that fails to
+    write is counted in `failed` and its error kept in `last_error` (both in
+    stats()) for the caller to show; the writer keeps going.
+    """
+
+    def __init__(self, db, batch_size=500, on_result=None):
+        self.db = db
+        self.batch_size = batch_size
+        self.on_result = on_result
+        self.events = queue.Queue()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.last_error = None
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def submit(self, user_id, when=None):
+        """Queue an attendance event, timestamped now unless `when` is given"""
+        when = when or datetime.now()
+        self.events.put((user_id, when.strftime("%Y-%m-%d"), when.strftime("%H:%M:%S")))
+
+    def stats(self):
+        """Backlog and totals, for metrics, and the error of the last failed batch"""
+        return {"queued": self.events.qsize(), "written": self.written, "batches": self.batches,
+                "failed": self.failed, "last_error": self.last_error}
+
+    def flush(self):
+        """Block until every queued event has been written"""
+        self.events.join()
+
+    def stop(self):
+        """Write the remaining events and stop the thread"""
+        self.events.put(None)
+        self.thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            batch = [self.events.get()]
+            # Take everything that is already waiting, without blocking
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            rows = [event for event in batch if event is not None]
+            running = len(rows) == len(batch)
+            try:
+                if rows:
+                    marked = self.db.insert_attendance(rows)
+                    self.written += len(marked)
+                    self.batches += 1
+                    if self.on_result:
+                        self.on_result(marked)
+            except Exception as e:
+                # Dropping one batch beats losing every later event with the thread
+                self.failed += len(rows)
+                self.last_error = f"Could not write {len(rows)} attendance events: {e}"
+            finally:
+                for _ in batch:
+                    self.events.task_done()
+        self.db.release()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Attendance database maintenance")
+    parser.add_argument("command", choices=["migrate", "rebuild-rollups"],
+                        help="migrate: convert stored JPEG face templates to feature vectors; "
+                             "rebuild-rollups: recompute the report tables from attendance")
+    args = parser.parse_args()
+
+    db = Database()
+    if args.command == "migrate":
+        print(f"Converted {db.migrate_face_vectors()} face templates")
+    elif args.command == "rebuild-rollups":
+        db.rebuild_rollups()
+        print("Rebuilt attendance rollups")
+    db.close()
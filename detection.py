@@ -0,0 +1,141 @@
+import json
+import os
+
+import cv2
+import numpy as np
+
+# Face detector backends: OpenCV's Haar and LBP cascades, and its YuNet CNN
+BACKENDS = ("haar", "lbp", "yunet")
+
+# Haar cascade shipped with OpenCV and the default cascade parameters
+CASCADE_PATH = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+SCALE_FACTOR = 1.3
+MIN_NEIGHBORS = 5
+
+# The LBP cascade isn't in the opencv-python wheel; it is in OpenCV's
+# data/lbpcascades directory
+LBP_CASCADE_PATH = os.path.join('models', 'lbpcascade_frontalface_improved.xml')
+
+# YuNet model from OpenCV Zoo and its detection thresholds
+YUNET_MODEL_PATH = os.path.join('models', 'face_detection_yunet_2023mar.onnx')
+YUNET_SCORE_THRESHOLD = 0.9
+YUNET_NMS_THRESHOLD = 0.3
+YUNET_TOP_K = 5000
+
+# Detector settings chosen for this site by calibrate.py
+DETECTOR_CONFIG = os.path.join('data', 'detector.json')
+
+# Saved options that only make sense for the backend they were calibrated for
+BACKEND_OPTIONS = ("model_path", "scale_factor", "min_neighbors", "score_threshold")
+
+
+def create_detector(backend="haar", scale=1.0, min_size=None, max_size=None, scale_factor=SCALE_FACTOR,
+                    min_neighbors=MIN_NEIGHBORS, model_path=None, score_threshold=YUNET_SCORE_THRESHOLD):
+    """Create a face detection function with its own detector.
+
+    `backend` is "haar", "lbp" (a cascade, tuned with `scale_factor` and
+    `min_neighbors`) or "yunet" (a CNN run with cv2.dnn, tuned with
+    `score_threshold`). `model_path` replaces the backend's cascade XML or
+    ONNX file. The function takes a grayscale frame and returns (x, y, w, h)
+    boxes.
+
+    With `scale` below 1 detection runs on a downscaled copy of the frame and
+    the boxes are mapped back to full resolution, so crops for recognition
+    still come from the original pixels. `min_size` and `max_size` are
+    (width, height) limits in full-resolution pixels.
+
+    Detectors are not safe to share between threads, so every worker should
+    call this once and keep the returned function.
+    """
+    min_size = (int(min_size[0] * scale), int(min_size[1] * scale)) if min_size else None
+    max_size = (int(max_size[0] * scale), int(max_size[1] * scale)) if max_size else None
+    if backend in ("haar", "lbp"):
+        path = model_path or (CASCADE_PATH if backend == "haar" else LBP_CASCADE_PATH)
+        detect = _cascade_detector(path, scale_factor, min_neighbors, min_size, max_size)
+    elif backend == "yunet":
+        detect = _yunet_detector(model_path or YUNET_MODEL_PATH, score_threshold, min_size, max_size)
+    else:
+        raise ValueError(f"Unknown face detector: {backend}")
+
+    if scale == 1.0:
+        return detect
+
+    def detect_scaled(gray):
+        small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        faces = detect(small)
+        if len(faces) == 0:
+            return faces
+        return (faces / scale).round().astype(int)
+
+    return detect_scaled
+
+
+def _cascade_detector(path, scale_factor, min_neighbors, min_size, max_size):
+    if not os.path.exists(path):
+        raise IOError(f"Face cascade not found: {path}")
+    cascade = cv2.CascadeClassifier(path)
+    if cascade.empty():
+        raise IOError(f"Could not load the face cascade {path}")
+    options = {}
+    if min_size:
+        options['minSize'] = min_size
+    if max_size:
+        options['maxSize'] = max_size
+    return lambda gray: cascade.detectMultiScale(gray, scale_factor, min_neighbors, **options)
+
+
+def _yunet_detector(model_path, score_threshold, min_size, max_size):
+    if not os.path.exists(model_path):
+        raise IOError(f"YuNet model not found: {model_path}")
+    net = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, YUNET_NMS_THRESHOLD, YUNET_TOP_K)
+    input_size = [None]
+
+    def detect(gray):
+        height, width = gray.shape[:2]
+        if input_size[0] != (width, height):
+            net.setInputSize((width, height))
+            input_size[0] = (width, height)
+        _, faces = net.detect(cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR))
+        if faces is None:
+            return np.empty((0, 4), dtype=np.int32)
+
+        # Boxes can reach past the frame edge; crops need them inside it
+        x0 = np.clip(faces[:, 0], 0, width)
+        y0 = np.clip(faces[:, 1], 0, height)
+        x1 = np.clip(faces[:, 0] + faces[:, 2], 0, width)
+        y1 = np.clip(faces[:, 1] + faces[:, 3], 0, height)
+        boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).round().astype(np.int32)
+        keep = (boxes[:, 2] > 0) & (boxes[:, 3] > 0)
+        if min_size:
+            keep &= (boxes[:, 2] >= min_size[0]) & (boxes[:, 3] >= min_size[1])
+        if max_size:
+            keep &= (boxes[:, 2] <= max_size[0]) & (boxes[:, 3] <= max_size[1])
+        return boxes[keep]
+
+    return detect
+
+
+def load_detector_options(path=DETECTOR_CONFIG, **overrides):
+    """The calibrated detector options saved at `path`, if any, with the non-None `overrides` on top"""
+    options = {}
+    if path and os.path.exists(path):
+        try:
+            with open(path) as f:
+                options = dict(json.load(f)["options"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Malformed detector settings in {path} ({e}): run calibrate.py again or delete it")
+    backend = overrides.get("backend")
+    if backend is not None and backend != options.get("backend", "haar"):
+        # The saved model and thresholds belong to the saved backend
+        options = {key: value for key, value in options.items() if key not in BACKEND_OPTIONS}
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+
+def save_detector_options(options, calibration=None, path=DETECTOR_CONFIG):
+    """Save detector options, with the measurements they were chosen on, for load_detector_options()"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'w') as f:
+        json.dump({"options": options, "calibration": calibration or {}}, f, indent=2)
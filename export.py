@@ -0,0 +1,167 @@
+import csv
+import os
+import threading
+
+from database import Database
+
+EXPORT_HEADER = ("Name", "Enrollment", "College", "Class", "Section", "Date", "Time", "Status")
+
+# Rows read from SQLite and written out per step
+EXPORT_BATCH_SIZE = 5000
+
+# Excel opens at most 1,048,576 rows per sheet; one of them is the header
+XLSX_SHEET_ROWS = 1048575
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+# A sink is (write rows, finish the file, abandon it)
+def _csv_sink(path):
+    """Write rows to a CSV file as they arrive"""
+    output = open(path, 'w', newline='', encoding='utf-8')
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_HEADER)
+    return writer.writerows, output.close, output.close
+
+
+def _xlsx_sink(path):
+    """Write rows to an XLSX file in openpyxl's constant-memory write-only mode.
+
+    Rows that don't fit on one Excel sheet continue on further sheets, each
+    starting with the header.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError("Excel export needs openpyxl (pip install openpyxl); export to .csv instead")
+
+    workbook = Workbook(write_only=True)
+    sheets = []
+    # Rows left on the current sheet
+    room = 0
+
+    def write(rows):
+        nonlocal room
+        for row in rows:
+            if room == 0:
+                # Full sheets continue on "Attendance (2)", "Attendance (3)", ...
+                name = "Attendance" if not sheets else f"Attendance ({len(sheets) + 1})"
+                sheets.append(workbook.create_sheet(name))
+                sheets[-1].append(EXPORT_HEADER)
+                room = XLSX_SHEET_ROWS
+            sheets[-1].append(row)
+            room -= 1
+
+    def finish():
+        if not sheets:
+            workbook.create_sheet("Attendance").append(EXPORT_HEADER)
+        workbook.save(path)
+
+    def discard():
+        # Rows are spooled to openpyxl temporary files until the save; end the
+        # spools so the files are closed (openpyxl deletes them at exit)
+        for sheet in sheets:
+            if not sheet.closed:
+                sheet.close()
+    return write, finish, discard
+
+
+def export_attendance(db, path, user_id=None, college=None, progress=None, cancelled=None,
+                      batch_size=EXPORT_BATCH_SIZE):
+    """Stream attendance records to a .csv or .xlsx file and return the row count.
+
+    Exports one user, one college or everyone. `progress` is called with
+    (rows written, total rows) after every batch; `cancelled` is polled
+    between batches and stops the export, leaving no partial file behind.
+    """
+    total = db.count_export_rows(user_id, college)
+    sink = _xlsx_sink if path.lower().endswith('.xlsx') else _csv_sink
+    # Write next to the target and move into place only once complete
+    tmp_path = path + '.part'
+    write, finish, discard = sink(tmp_path)
+
+    written = 0
+    try:
+        for rows in db.iter_attendance_rows(user_id, college, batch_size):
+            if cancelled and cancelled():
+                raise ExportCancelled()
+            write(rows)
+            written += len(rows)
+            if progress:
+                progress(written, total)
+        finish()
+        os.replace(tmp_path, path)
+    except BaseException:
+        discard()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return written
+
+
+class AttendanceExporter:
+    """Runs export_attendance() on a background thread.
+
+    The GUI starts it and polls `written`, `total`, `done` and `error`
+    from its own event loop, so a long export never blocks the window.
+    """
+
+    def __init__(self, db, path, user_id=None, college=None):
+        self.db = db
+        self.path = path
+        self.user_id = user_id
+        self.college = college
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.written = 0
+        self.total = 0
+        self.done = False
+        self.error = None
+        self.cancel_requested = False
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancel_requested = True
+
+    @property
+    def fraction(self):
+        return self.written / self.total if self.total else float(self.done)
+
+    def _progress(self, written, total):
+        self.written, self.total = written, total
+
+    def _run(self):
+        try:
+            export_attendance(self.db, self.path, self.user_id, self.college,
+                              progress=self._progress, cancelled=lambda: self.cancel_requested)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.db.release()
+            self.done = True
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Export attendance records to CSV or Excel")
+    parser.add_argument("output", help="file to write, .csv or .xlsx")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--user-id", type=int, help="only this user's records")
+    scope.add_argument("--college", help="only records of users from this college")
+    args = parser.parse_args()
+
+    db = Database()
+    start = time.perf_counter()
+
+    def report(written, total):
+        print(f"\r{written:,} / {total:,} rows", end="", flush=True)
+
+    count = export_attendance(db, args.output, args.user_id, args.college, progress=report)
+    print(f"\nExported {count:,} rows to {args.output} in {time.perf_counter() - start:.1f}s")
+    db.close()
@@ -0,0 +1,167 @@
+import os
+import time
+import cv2
+
+from database import AttendanceWriter, Database
+from detection import create_detector, load_detector_options
+from matchers import create_matcher, index_path_for
+from metrics import METRICS
+from presence import PresenceSet
+from quality import QualityGate
+from recognition import FaceIdentifier
+from tracking import FaceTracker
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def open_source(source):
+    """Yield BGR frames from an image directory, video file, stream URL or camera index"""
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            if name.lower().endswith(IMAGE_EXTENSIONS):
+                frame = cv2.imread(os.path.join(source, name))
+                if frame is not None:
+                    yield frame
+        return
+
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video source: {source}")
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+
+class RecognitionStats:
+    """Running counters and stage timings for a headless session"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.frames = 0
+        self.faces = 0
+        self.rejected = 0
+        self.tracks = 0
+        self.recognized = 0
+        self.marked = 0
+        self.detect_time = 0.0
+        self.match_time = 0.0
+
+    def values(self):
+        """Counters and overall frame rate, for metrics"""
+        elapsed = time.perf_counter() - self.started
+        return {"frames": self.frames, "fps": self.frames / max(elapsed, 1e-9), "faces": self.faces,
+                "rejected": self.rejected, "tracks": self.tracks, "recognized": self.recognized, "marked": self.marked}
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        frames = max(self.frames, 1)
+        faces = max(self.faces, 1)
+        return (f"{self.frames} frames in {elapsed:.1f}s ({self.frames / max(elapsed, 1e-9):.1f} fps) | "
+                f"detect {self.detect_time / frames * 1000:.1f} ms/frame | "
+                f"match {self.match_time / faces * 1000:.2f} ms/face | "
+                f"faces {self.faces} | low quality {self.rejected} | tracks {self.tracks} | "
+                f"recognized {self.recognized} | marked {self.marked}")
+
+
+def run_headless(source, db=None, max_frames=None, report_interval=5.0, detect_every=10, detector_options=None,
+                 matcher_options=None):
+    """Recognize every face in a stream and mark attendance for each person found.
+
+    Without `db` the default database is opened, and closed again at the end.
+    """
+    if db is not None:
+        return _recognize(source, db, max_frames, report_interval, detect_every, detector_options, matcher_options)
+    db = Database()
+    try:
+        return _recognize(source, db, max_frames, report_interval, detect_every, detector_options, matcher_options)
+    finally:
+        db.close()
+
+
+def _recognize(source, db, max_frames, report_interval, detect_every, detector_options, matcher_options):
+    matcher = create_matcher(**(matcher_options or {}))
+    identifier = FaceIdentifier(db, index_path=index_path_for(matcher, os.path.dirname(db.path)), matcher=matcher)
+    # Consecutive frames of a stream are tracked; an image directory is a set of stills
+    stills = os.path.isdir(source)
+    tracker = FaceTracker(create_detector(**load_detector_options(**(detector_options or {}))),
+                          detect_every=detect_every)
+    gate = QualityGate()
+    stats = RecognitionStats()
+
+    # Attendance is written in batches on a background thread so recognition never waits on disk
+    def on_written(marked):
+        stats.marked += len(marked)
+    writer = AttendanceWriter(db, on_result=on_written).start()
+    METRICS.add_source("headless", stats.values)
+    METRICS.add_source("writer", writer.stats)
+    METRICS.add_source("cache", db.cache_stats, label="cache")
+
+    # Users already handled today, so a face that stays in view is only marked
+    # once; unlike a plain set it starts over at midnight
+    seen = PresenceSet()
+    next_report = time.perf_counter() + report_interval
+
+    try:
+        print(f"Headless recognition on {source} against {identifier.count} enrolled users")
+        for frame in open_source(source):
+            start = time.perf_counter()
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if stills:
+                tracker.reset()
+            tracks = tracker.update(gray)
+            detected = time.perf_counter()
+            stats.detect_time += detected - start
+            METRICS.observe("detect", detected - start)
+
+            # Recognize each tracked face once instead of on every frame, all
+            # new faces of a frame in one batch
+            pending = [track for track in tracks if track.needs_recognition]
+            if pending:
+                # A blurry, tiny or turned-away crop waits for a better frame of the
+                # same track instead of using up one of its recognition attempts
+                faces, quality = gate.crop(gray, [track.box for track in pending])
+                stats.rejected += len(pending) - int(quality.passed.sum())
+                pending = [track for track, passed in zip(pending, quality.passed) if passed]
+                faces = faces[quality.passed]
+            if pending:
+                matches = identifier.best_matches(faces)
+                stats.faces += len(pending)
+
+                for track, match in zip(pending, matches):
+                    track.recognized(match)
+                    if not match:
+                        continue
+                    stats.recognized += 1
+
+                    user_id = match[0]
+                    if user_id not in seen:
+                        seen.add(user_id)
+                        # Marked earlier today, by a previous run or another kiosk
+                        already = user_id in db.presence
+                        if not already:
+                            writer.submit(user_id)
+                        print(f"Recognized {db.get_user_info(user_id)[0]} (id {user_id}, distance {match[1]:.3g})"
+                              + (", already marked today" if already else ""))
+            stats.match_time += time.perf_counter() - detected
+
+            stats.frames += 1
+            stats.tracks = tracker.last_id
+            if stats.frames == max_frames:
+                break
+            if time.perf_counter() >= next_report:
+                print(stats.report())
+                next_report += report_interval
+    finally:
+        writer.stop()
+        METRICS.remove_source("headless", stats.values)
+        METRICS.remove_source("writer", writer.stats)
+        METRICS.remove_source("cache", db.cache_stats)
+    print(stats.report())
+    if writer.failed:
+        print(f"{writer.failed} attendance events were not written; last error: {writer.last_error}")
+    return stats
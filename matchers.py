@@ -0,0 +1,150 @@
+import abc
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from recognition import (COARSE_BLOCK, MATCH_THRESHOLD, TEMPLATE_LENGTH, TEMPLATE_SIZE,
+                         coarse_descriptor)
+
+# Faces per forward pass of an embedding network
+EMBEDDING_BATCH_SIZE = 32
+
+# Cosine distance (1 - cosine similarity) under which two SFace embeddings
+# are the same person; OpenCV's reference threshold is similarity 0.363
+EMBEDDING_THRESHOLD = 1 - 0.363
+
+
+class Matcher(abc.ABC):
+    """Turns 100x100 grayscale faces into feature vectors and compares them.
+
+    FaceIdentifier and 1:1 verification work only through this interface:
+    embed() maps a stack of faces to vectors, shortlist_descriptors() maps
+    vectors to the float32 descriptors ranked by matrix product (and by the
+    IVF index), and distances() scores probes against gallery vectors
+    exactly. Smaller distances are better; `threshold` separates matches.
+    Matchers whose vectors can't be derived from the stored template for
+    free set `cache_vectors` so they are computed once and kept in the
+    database under `name`.
+    """
+
+    name = None
+    dim = None
+    dtype = None
+    shortlist_dim = None
+    threshold = None
+    cache_vectors = False
+
+    @abc.abstractmethod
+    def embed(self, faces):
+        pass
+
+    @abc.abstractmethod
+    def shortlist_descriptors(self, vectors):
+        pass
+
+    @abc.abstractmethod
+    def distances(self, probes, gallery):
+        pass
+
+
+class PixelDiffMatcher(Matcher):
+    """Mean absolute difference of the raw 100x100 pixels"""
+
+    name = "pixel"
+    dim = TEMPLATE_LENGTH
+    dtype = np.dtype(np.uint8)
+    shortlist_dim = (TEMPLATE_SIZE[0] // COARSE_BLOCK) ** 2
+    threshold = MATCH_THRESHOLD
+
+    def embed(self, faces):
+        return np.asarray(faces, dtype=np.uint8).reshape(-1, TEMPLATE_LENGTH)
+
+    def shortlist_descriptors(self, vectors):
+        return coarse_descriptor(vectors)
+
+    def distances(self, probes, gallery):
+        probes = np.asarray(probes, dtype=np.uint8).reshape(-1, TEMPLATE_LENGTH)
+        gallery = np.asarray(gallery, dtype=np.uint8).reshape(-1, TEMPLATE_LENGTH)
+        distances = np.empty((len(probes), len(gallery)), dtype=np.float64)
+        for p, probe in enumerate(probes):
+            diff = cv2.absdiff(gallery, np.broadcast_to(probe, gallery.shape))
+            distances[p] = cv2.reduce(diff, 1, cv2.REDUCE_SUM, dtype=cv2.CV_32S).ravel() / TEMPLATE_LENGTH
+        return distances
+
+
+class EmbeddingMatcher(Matcher):
+    """Face embeddings from an ONNX model run on the CPU with cv2.dnn, compared by cosine.
+
+    Defaults suit OpenCV Zoo's SFace (112x112 RGB in, 128-d out). All faces
+    of a frame go through the network in batches of `batch_size`. `threads`
+    sets OpenCV's thread count, which the detector shares. The network is
+    shared between threads, so forward passes are serialized.
+    """
+
+    cache_vectors = True
+    dtype = np.dtype(np.float32)
+    threshold = EMBEDDING_THRESHOLD
+
+    def __init__(self, model_path, input_size=(112, 112), scale=1.0, mean=(0, 0, 0), swap_rb=True,
+                 threads=None, batch_size=EMBEDDING_BATCH_SIZE, threshold=None):
+        if threads:
+            cv2.setNumThreads(threads)
+        self.net = cv2.dnn.readNet(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.lock = threading.Lock()
+        self.name = "dnn:" + os.path.splitext(os.path.basename(model_path))[0]
+        self.input_size = input_size
+        self.scale = scale
+        self.mean = mean
+        self.swap_rb = swap_rb
+        self.batch_size = batch_size
+        if threshold is not None:
+            self.threshold = threshold
+        self.dim = self.shortlist_dim = self.embed(np.zeros((1,) + TEMPLATE_SIZE, dtype=np.uint8)).shape[1]
+
+    def embed(self, faces):
+        faces = np.asarray(faces, dtype=np.uint8).reshape((-1,) + TEMPLATE_SIZE)
+        if len(faces) == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+
+        outputs = []
+        for i in range(0, len(faces), self.batch_size):
+            images = [cv2.cvtColor(face, cv2.COLOR_GRAY2BGR) for face in faces[i:i + self.batch_size]]
+            blob = cv2.dnn.blobFromImages(images, self.scale, self.input_size, self.mean, self.swap_rb, False)
+            with self.lock:
+                self.net.setInput(blob)
+                outputs.append(self.net.forward().reshape(len(images), -1))
+        vectors = np.concatenate(outputs).astype(np.float32, copy=False)
+
+        # Unit length, so cosine similarity is a dot product and L2 ranking is cosine ranking
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors
+
+    def shortlist_descriptors(self, vectors):
+        return np.ascontiguousarray(vectors, dtype=np.float32)
+
+    def distances(self, probes, gallery):
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, self.dim)
+        gallery = np.asarray(gallery, dtype=np.float32).reshape(-1, self.dim)
+        return 1.0 - (probes @ gallery.T).astype(np.float64)
+
+
+def create_matcher(name="pixel", model_path=None, threads=None):
+    """Build a matcher by name: 'pixel', or 'dnn' with the path of an ONNX embedding model"""
+    if name == "pixel":
+        return PixelDiffMatcher()
+    if name == "dnn":
+        if not model_path:
+            raise ValueError("The dnn matcher needs an embedding model (--embedding-model)")
+        return EmbeddingMatcher(model_path, threads=threads)
+    raise ValueError(f"Unknown matcher: {name}")
+
+
+def index_path_for(matcher, directory='data'):
+    """Where a matcher's IVF index is saved; the pixel matcher keeps the original file"""
+    if matcher.name == "pixel":
+        return os.path.join(directory, 'face_index.npz')
+    return os.path.join(directory, f"face_index_{matcher.name.replace(':', '_')}.npz")
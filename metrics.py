@@ -0,0 +1,245 @@
+import bisect
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets in seconds: 10us to about a minute,
+# each 1.5x the last, so any quantile is estimated within one bucket width
+LATENCY_BUCKETS = tuple(1e-5 * 1.5 ** i for i in range(39))
+
+# Quantiles reported for every stage
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "attendance"
+
+
+class Histogram:
+    """Latency distribution in fixed log-spaced buckets.
+
+    Recording is a bisect and a few additions under a lock, cheap enough to
+    sit on every frame. Quantiles are interpolated inside their bucket and
+    never exceed the largest value seen.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bounds = buckets
+        # One count per bucket plus one for values above the last bound
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum, self.max
+
+    def quantile(self, q, snapshot=None):
+        counts, count, _, largest = snapshot or self.snapshot()
+        if count == 0:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                if index == len(self.bounds):
+                    return largest
+                lower = self.bounds[index - 1] if index else 0.0
+                return min(lower + (self.bounds[index] - lower) * (rank - seen) / bucket_count, largest)
+            seen += bucket_count
+        return largest
+
+
+class MetricsRegistry:
+    """Per-stage latency histograms plus gauges read from registered sources.
+
+    Code records latencies with timer(), timed() or observe() under a stage
+    name such as "detect" or "db.mark_attendance". Components that already
+    keep counters (pipeline FPS and queue depths, cache hit rates, writer
+    backlog) are added as sources: callables returning a dict of numbers,
+    read only when the metrics are rendered. A source returning a dict of
+    dicts is rendered with the outer key as the `label` label.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.sources = {}
+        self.lock = threading.Lock()
+        self.started = time.time()
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block under `stage`, whether it returns or raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(stage).observe(time.perf_counter() - start)
+
+    def timed(self, stage):
+        """Decorator timing every call of a function under `stage`"""
+        def decorate(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.histogram(stage).observe(time.perf_counter() - start)
+            return wrapper
+        return decorate
+
+    def add_source(self, name, read, label=None):
+        """Publish the numbers returned by read() as gauges named after `name`"""
+        with self.lock:
+            self.sources[name] = (read, label)
+
+    def remove_source(self, name, read=None):
+        """Stop publishing a source; with `read`, only if it is still that callable"""
+        with self.lock:
+            if name in self.sources and (read is None or self.sources[name][0] == read):
+                del self.sources[name]
+
+    def gauges(self):
+        """Current value of every source gauge as (name, labels, value)"""
+        with self.lock:
+            sources = list(self.sources.items())
+        gauges = []
+        for name, (read, label) in sources:
+            try:
+                values = read()
+            except Exception:
+                # A source whose component was torn down must not break the endpoint
+                continue
+            for key, value in values.items():
+                if isinstance(value, dict):
+                    for inner, number in value.items():
+                        if isinstance(number, (int, float)):
+                            gauges.append((f"{name}_{inner}", {label or "name": key}, number))
+                elif isinstance(value, (int, float)):
+                    gauges.append((f"{name}_{key}", {}, value))
+        return gauges
+
+    def render(self):
+        """Every metric in the Prometheus text exposition format"""
+        lines = []
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+
+        if histograms:
+            lines.append(f"# HELP {name} Latency of each recognition, display and database stage")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, histogram in histograms:
+                counts, count, total, _ = histogram.snapshot()
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.9g}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+
+            lines.append(f"# HELP {name}_quantile Estimated latency quantiles of each stage")
+            lines.append(f"# TYPE {name}_quantile gauge")
+            for stage, histogram in histograms:
+                snapshot = histogram.snapshot()
+                for q in QUANTILES:
+                    lines.append(f'{name}_quantile{{stage="{stage}",quantile="{q}"}} '
+                                 f'{histogram.quantile(q, snapshot):.9g}')
+
+        for gauge, labels, value in self.gauges():
+            label_text = ",".join(f'{key}="{text}"' for key, text in labels.items())
+            lines.append(f"{METRIC_PREFIX}_{gauge}{{{label_text}}} {value:.9g}" if label_text
+                         else f"{METRIC_PREFIX}_{gauge} {value:.9g}")
+
+        lines.append(f"{METRIC_PREFIX}_uptime_seconds {time.time() - self.started:.3f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Human-readable table of stage latencies and gauges, for logs"""
+        with self.lock:
+            histograms = sorted(self.histograms.items())
+        lines = [f"{'stage':<28} | {'count':>8} | {'p50':>9} | {'p95':>9} | {'p99':>9}"]
+        for stage, histogram in histograms:
+            snapshot = histogram.snapshot()
+            p50, p95, p99 = (histogram.quantile(q, snapshot) * 1000 for q in QUANTILES)
+            lines.append(f"{stage:<28} | {snapshot[1]:>8} | {p50:>7.2f}ms | {p95:>7.2f}ms | {p99:>7.2f}ms")
+        gauges = [f"{gauge}{{{','.join(f'{k}={v}' for k, v in labels.items())}}}={value:.3g}" if labels
+                  else f"{gauge}={value:.3g}" for gauge, labels, value in self.gauges()]
+        if gauges:
+            lines.append(" | ".join(gauges))
+        return "\n".join(lines)
+
+
+# The registry every module records into
+METRICS = MetricsRegistry()
+
+
+def serve_metrics(port, host="127.0.0.1", registry=METRICS):
+    """Serve the registry at http://host:port/metrics on a daemon thread; returns the server"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would drown the console
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class MetricsLog:
+    """Background thread printing the registry summary every `interval` seconds"""
+
+    def __init__(self, interval, registry=METRICS, write=print):
+        self.interval = interval
+        self.registry = registry
+        self.write = write
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.write(self.registry.summary())
@@ -0,0 +1,385 @@
+import multiprocessing as mp
+import os
+import queue
+import signal
+import threading
+import time
+from datetime import datetime
+from itertools import chain
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+from database import DB_PATH, AttendanceWriter, Database
+from detection import create_detector, load_detector_options
+from headless import open_source
+from matchers import create_matcher, index_path_for
+from metrics import METRICS, MetricsLog, serve_metrics
+from presence import PresenceSet
+from quality import QualityGate
+from recognition import FaceIdentifier
+from tracking import FaceTracker
+
+# Frames of one camera that can be in flight between capture and recognition
+RING_SLOTS = 4
+
+# Counters each worker reports, summed over workers by the server
+WORKER_COUNTERS = ("frames", "faces", "rejected", "recognized", "detect_time", "match_time")
+
+
+class FrameRing:
+    """Fixed-size grayscale frames in shared memory, handed between processes by slot number.
+
+    The capture side takes a free slot, writes the frame into it and sends
+    only (camera, slot) to a worker, which releases the slot once it has
+    cropped the faces it needs. Frames of one camera are consumed in order
+    by a single worker, so slots are reused round-robin. Pickling a ring
+    (to pass it to a worker process) attaches to the same memory.
+    """
+
+    def __init__(self, shape, slots=RING_SLOTS, context=mp):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.memory = shared_memory.SharedMemory(create=True, size=slots * int(np.prod(self.shape)))
+        self.free = context.Semaphore(slots)
+        self.owner = True
+        self._map()
+
+    def _map(self):
+        self.frames = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self.memory.buf)
+
+    def __getstate__(self):
+        return {"shape": self.shape, "slots": self.slots, "name": self.memory.name, "free": self.free}
+
+    def __setstate__(self, state):
+        self.shape = state["shape"]
+        self.slots = state["slots"]
+        self.free = state["free"]
+        self.memory = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self._map()
+
+    def acquire(self, block=True, timeout=None):
+        """Wait for a free slot; False if none freed up (or, with block=False, none is free)"""
+        return self.free.acquire(block, timeout)
+
+    def release(self):
+        self.free.release()
+
+    def close(self):
+        """Detach from the memory, and free it if this ring created it"""
+        self.frames = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+
+def is_live(source):
+    """Whether a source is a camera or stream that can't wait for slow workers"""
+    return source.isdigit() or "://" in source
+
+
+def _recognize_worker(db_path, rings, cameras, tasks, results, matcher_options, detector_options, detect_every,
+                      report_interval):
+    """Recognition process: detect, track and identify faces of the cameras assigned to it"""
+    # The server stops the workers; one OpenCV thread each so processes don't fight over cores
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    cv2.setNumThreads(1)
+
+    db = Database(db_path)
+    matcher = create_matcher(**matcher_options)
+    identifier = FaceIdentifier(db, index_path=index_path_for(matcher, os.path.dirname(db_path)), matcher=matcher)
+    trackers = {camera: FaceTracker(create_detector(**detector_options), detect_every=detect_every)
+                for camera in cameras}
+    gate = QualityGate()
+    counters = dict.fromkeys(WORKER_COUNTERS, 0)
+    results.put(("ready", os.getpid()))
+
+    running = set(cameras)
+    next_report = time.perf_counter() + report_interval
+    while running:
+        try:
+            camera, slot, captured, stills = tasks.get(timeout=report_interval)
+        except queue.Empty:
+            camera = None
+        if camera is not None and slot is None:
+            running.discard(camera)
+        elif camera is not None:
+            start = time.perf_counter()
+            ring, tracker = rings[camera], trackers[camera]
+            gray = ring.frames[slot]
+            if stills:
+                tracker.reset()
+            tracks = tracker.update(gray)
+            detected = time.perf_counter()
+            # Recognize each tracked face once, all new faces of a frame in one batch
+            pending = [track for track in tracks if track.needs_recognition]
+            if pending:
+                # Poor crops wait for a better frame of the same track
+                faces, quality = gate.crop(gray, [track.box for track in pending])
+                counters["rejected"] += len(pending) - int(quality.passed.sum())
+                pending = [track for track, passed in zip(pending, quality.passed) if passed]
+                faces = faces[quality.passed]
+            # The crops are copies, so the capture side may overwrite the slot now
+            ring.release()
+
+            if pending:
+                matches = identifier.best_matches(faces)
+                counters["match_time"] += time.perf_counter() - detected
+                counters["faces"] += len(pending)
+                for track, match in zip(pending, matches):
+                    track.recognized(match)
+                    if match:
+                        counters["recognized"] += 1
+                        results.put(("match", camera, match[0], match[1], captured))
+            counters["frames"] += 1
+            counters["detect_time"] += detected - start
+
+        if time.perf_counter() >= next_report:
+            results.put(("stats", os.getpid(), dict(counters)))
+            next_report += report_interval
+
+    results.put(("done", os.getpid(), dict(counters)))
+    db.close()
+
+
+class MultiCameraServer:
+    """Several cameras recognized in parallel by a pool of worker processes.
+
+    Capture threads in this process decode each source, convert it to
+    grayscale and write it into that camera's shared-memory FrameRing; only
+    the slot number crosses to the worker. Every camera is owned by one
+    worker (cameras are dealt round-robin) so its tracker sees frames in
+    order, and workers detect, track and identify with their own detector,
+    matcher and database connection. Recognized ids come back on one queue to
+    a single AttendanceWriter, which marks each person once per session.
+
+    Live cameras drop a frame when all their slots are busy; files and
+    image directories wait for the workers instead, so runs over recorded
+    video are repeatable.
+    """
+
+    def __init__(self, sources, workers=None, db_path=DB_PATH, matcher_options=None, detector_options=None,
+                 detect_every=10, max_frames=None, report_interval=5.0, slots=RING_SLOTS):
+        self.sources = list(sources)
+        self.workers = max(1, min(workers or os.cpu_count() or 1, len(self.sources)))
+        self.db_path = db_path
+        self.matcher_options = matcher_options or {}
+        self.detector_options = detector_options or {}
+        self.detect_every = detect_every
+        self.max_frames = max_frames
+        self.report_interval = report_interval
+        self.slots = slots
+        self.context = mp.get_context("spawn")
+        self.stop_event = threading.Event()
+        self.captured = [0] * len(self.sources)
+        self.dropped = [0] * len(self.sources)
+        self.counters = {}
+        self.marked = 0
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        """Recognize until every source ends (or stop() is called); returns the totals"""
+        db = Database(self.db_path)
+        # Build the index and any cached embeddings once, before the workers load them
+        matcher = create_matcher(**self.matcher_options)
+        identifier = FaceIdentifier(db, index_path=index_path_for(matcher, os.path.dirname(self.db_path)),
+                                    matcher=matcher)
+        print(f"Recognizing {len(self.sources)} cameras with {self.workers} workers "
+              f"against {identifier.count} enrolled users")
+        del identifier, matcher
+
+        streams, firsts, rings = [], [], []
+        try:
+            for source in self.sources:
+                streams.append(open_source(source))
+                firsts.append(next(streams[-1], None))
+                if firsts[-1] is None:
+                    raise IOError(f"No frames in video source: {source}")
+                rings.append(FrameRing(firsts[-1].shape[:2], self.slots, self.context))
+            return self._serve(db, [chain([first], stream) for first, stream in zip(firsts, streams)], rings)
+        finally:
+            for stream in streams:
+                stream.close()
+            for ring in rings:
+                ring.close()
+
+    def _serve(self, db, streams, rings):
+        assignments = [list(range(w, len(streams), self.workers)) for w in range(self.workers)]
+        tasks = [self.context.Queue() for _ in range(self.workers)]
+        owner = {camera: tasks[w] for w, cameras in enumerate(assignments) for camera in cameras}
+        results = self.context.Queue()
+        processes = [self.context.Process(
+            target=_recognize_worker, daemon=True,
+            args=(self.db_path, {camera: rings[camera] for camera in cameras}, cameras, tasks[w], results,
+                  self.matcher_options, self.detector_options, self.detect_every, self.report_interval))
+            for w, cameras in enumerate(assignments)]
+        for process in processes:
+            process.start()
+
+        # Start capturing once every worker has loaded its templates
+        ready = 0
+        while ready < len(processes):
+            try:
+                if results.get(timeout=1)[0] == "ready":
+                    ready += 1
+            except queue.Empty:
+                if not all(process.is_alive() for process in processes):
+                    raise RuntimeError("A recognition worker failed to start")
+
+        def on_written(marked):
+            self.marked += len(marked)
+        writer = AttendanceWriter(db, on_result=on_written).start()
+
+        started = time.perf_counter()
+        # Stage latencies stay in the workers; the server publishes totals and per-camera counts
+        METRICS.add_source("multicam", lambda: self.totals(time.perf_counter() - started))
+        METRICS.add_source("camera", lambda: {str(camera): {"captured": self.captured[camera],
+                                                            "dropped": self.dropped[camera]}
+                                              for camera in range(len(self.sources))}, label="camera")
+        METRICS.add_source("writer", writer.stats)
+        threads = [threading.Thread(target=self._capture_loop, daemon=True,
+                                    args=(camera, stream, rings[camera], owner[camera]))
+                   for camera, stream in enumerate(streams)]
+        for thread in threads:
+            thread.start()
+
+        # Users handled today across all cameras; starts over at midnight
+        seen = PresenceSet()
+        done = 0
+        next_report = started + self.report_interval
+        try:
+            while done < len(processes):
+                try:
+                    message = results.get(timeout=1)
+                except queue.Empty:
+                    # A worker whose cameras have all ended exits cleanly before the others
+                    if any(process.exitcode not in (None, 0) for process in processes):
+                        raise RuntimeError("A recognition worker exited unexpectedly")
+                    continue
+
+                kind = message[0]
+                if kind == "match":
+                    _, camera, user_id, distance, captured = message
+                    if user_id not in seen:
+                        seen.add(user_id)
+                        already = user_id in db.presence
+                        if not already:
+                            writer.submit(user_id, datetime.fromtimestamp(captured))
+                        print(f"Camera {camera}: recognized {db.get_user_info(user_id)[0]} "
+                              f"(id {user_id}, distance {distance:.3g})"
+                              + (", already marked today" if already else ""))
+                elif kind in ("stats", "done"):
+                    self.counters[message[1]] = message[2]
+                    done += kind == "done"
+
+                if time.perf_counter() >= next_report:
+                    print(self.report(time.perf_counter() - started))
+                    next_report += self.report_interval
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join(timeout=1)
+            for process in processes:
+                process.join(timeout=5)
+            writer.stop()
+            db.close()
+
+        elapsed = time.perf_counter() - started
+        print(self.report(elapsed))
+        if writer.failed:
+            print(f"{writer.failed} attendance events were not written; last error: {writer.last_error}")
+        return self.totals(elapsed)
+
+    def _capture_loop(self, camera, stream, ring, tasks):
+        live = is_live(self.sources[camera])
+        stills = os.path.isdir(self.sources[camera])
+        slot = 0
+        try:
+            for frame in stream:
+                if self.stop_event.is_set():
+                    break
+                if live:
+                    if not ring.acquire(block=False):
+                        self.dropped[camera] += 1
+                        continue
+                else:
+                    while not ring.acquire(timeout=0.1):
+                        if self.stop_event.is_set():
+                            return
+                gray = ring.frames[slot]
+                if frame.shape[:2] == ring.shape:
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+                else:
+                    # Image directories may mix sizes; the ring holds the first frame's
+                    gray[:] = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), ring.shape[::-1])
+                tasks.put((camera, slot, time.time(), stills))
+                slot = (slot + 1) % ring.slots
+                self.captured[camera] += 1
+                if self.captured[camera] == self.max_frames:
+                    break
+        finally:
+            tasks.put((camera, None, None, None))
+
+    def totals(self, elapsed):
+        totals = {name: sum(counters[name] for counters in self.counters.values()) for name in WORKER_COUNTERS}
+        totals.update(elapsed=elapsed, captured=sum(self.captured), dropped=sum(self.dropped), marked=self.marked)
+        return totals
+
+    def report(self, elapsed):
+        totals = self.totals(elapsed)
+        frames = max(totals["frames"], 1)
+        faces = max(totals["faces"], 1)
+        return (f"{totals['frames']} frames in {elapsed:.1f}s ({totals['frames'] / max(elapsed, 1e-9):.1f} fps) | "
+                f"dropped {totals['dropped']} | "
+                f"detect {totals['detect_time'] / frames * 1000:.1f} ms/frame | "
+                f"match {totals['match_time'] / faces * 1000:.2f} ms/face | "
+                f"faces {totals['faces']} | low quality {totals['rejected']} | "
+                f"recognized {totals['recognized']} | marked {totals['marked']}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recognize faces from several cameras with a pool of processes")
+    parser.add_argument("sources", nargs="+",
+                        help="camera indexes, video files, image directories or stream URLs, one per camera")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="recognition processes (default: one per core, at most one per camera)")
+    parser.add_argument("--db", default=DB_PATH, help=f"attendance database (default: {DB_PATH})")
+    parser.add_argument("--max-frames", type=int, default=None, help="stop each camera after this many frames")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between throughput reports")
+    parser.add_argument("--detector", choices=["haar", "lbp", "yunet"], default=None,
+                        help="face detector backend (default: the calibrated one, else haar)")
+    parser.add_argument("--detector-model", default=None, help="cascade XML or YuNet ONNX file for --detector")
+    parser.add_argument("--detect-scale", type=float, default=None,
+                        help="run face detection on a frame downscaled by this factor")
+    parser.add_argument("--matcher", choices=["pixel", "dnn"], default="pixel", help="face matcher")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve throughput and per-camera counts at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-log", type=float, default=None,
+                        help="print the metrics every this many seconds")
+    parser.add_argument("--embedding-model", default=None, help="ONNX face embedding model for --matcher dnn")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        serve_metrics(args.metrics_port)
+    if args.metrics_log:
+        MetricsLog(args.metrics_log).start()
+    server = MultiCameraServer(args.sources, workers=args.workers, db_path=args.db,
+                               matcher_options={"name": args.matcher, "model_path": args.embedding_model,
+                                                "threads": 1},
+                               detector_options=load_detector_options(backend=args.detector,
+                                                                      model_path=args.detector_model,
+                                                                      scale=args.detect_scale),
+                               max_frames=args.max_frames, report_interval=args.report_interval)
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        print("\nStopped")
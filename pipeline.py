@@ -0,0 +1,286 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from metrics import METRICS
+from quality import QUALITY_WINDOW, BestFaceWindow
+
+
+# Display buffers are RGBA: PIL can wrap 4-byte pixels in place, and a
+# PhotoImage of the same mode takes them without another conversion
+DISPLAY_MODE = "RGBA"
+
+# Shrink factor from which previews are resized with INTER_AREA. Below it
+# bilinear shows no aliasing and is several times cheaper.
+AREA_RESIZE_FACTOR = 2.0
+
+
+class DropOldestQueue:
+    """Bounded queue that discards its oldest item instead of blocking the producer"""
+
+    def __init__(self, maxsize=2):
+        self.items = deque(maxlen=maxsize)
+        self.cond = threading.Condition()
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, item):
+        with self.cond:
+            if len(self.items) == self.items.maxlen:
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        """Return the oldest item, or None once the queue is closed or the timeout expires"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items or self.closed, timeout):
+                return None
+            return self.items.popleft() if self.items else None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FPSCounter:
+    """Event rate over a sliding time window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self.ticks = deque()
+        self.lock = threading.Lock()
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            self.ticks.append(now)
+            while self.ticks[0] < now - self.window:
+                self.ticks.popleft()
+
+    @property
+    def fps(self):
+        now = time.monotonic()
+        with self.lock:
+            while self.ticks and self.ticks[0] < now - self.window:
+                self.ticks.popleft()
+            return len(self.ticks) / self.window
+
+
+class FrameResult:
+    """A captured frame with its detections"""
+
+    def __init__(self, seq, frame):
+        self.seq = seq
+        self.frame = frame
+        self.gray = None
+        self.faces = ()
+
+
+class FrameRenderer:
+    """Scales annotated frames into reused RGB buffers for a Tk PhotoImage.
+
+    Each frame is resized straight into a preallocated buffer (INTER_AREA
+    when shrinking a lot, bilinear otherwise), boxes are drawn at display
+    scale, and the colour conversion writes into one of three output
+    buffers that PIL images permanently wrap, so nothing is allocated per
+    frame on the render thread. One buffer can be in the display's hands,
+    one holds the newest rendered frame and the third is rendered into;
+    a frame the display didn't take in time is replaced by the next one,
+    so the display always gets the newest frame.
+    """
+
+    def __init__(self, display_size):
+        width, height = display_size
+        self.display_size = display_size
+        self.scaled = np.empty((height, width, 3), dtype=np.uint8)
+        self.buffers = [np.empty((height, width, 4), dtype=np.uint8) for _ in range(3)]
+        self.images = [Image.frombuffer(DISPLAY_MODE, display_size, buffer, "raw", DISPLAY_MODE, 0, 1)
+                       for buffer in self.buffers]
+        self.lock = threading.Lock()
+        # Buffer holding a rendered frame the display hasn't taken yet, if any
+        self.ready = None
+        # Buffer the display is pasting from, if any
+        self.pasting = None
+        # Rendered frames replaced by a newer one before the display took them
+        self.replaced = 0
+
+    def render(self, frame, faces):
+        """Render a BGR frame and its face boxes, replacing any frame the display hasn't taken"""
+        with self.lock:
+            index = next(i for i in range(len(self.buffers)) if i not in (self.ready, self.pasting))
+
+        height, width = frame.shape[:2]
+        display_width, display_height = self.display_size
+        shrink = min(width / display_width, height / display_height)
+        interpolation = cv2.INTER_AREA if shrink >= AREA_RESIZE_FACTOR else cv2.INTER_LINEAR
+        cv2.resize(frame, self.display_size, dst=self.scaled, interpolation=interpolation)
+
+        sx, sy = display_width / width, display_height / height
+        for (x, y, w, h) in faces:
+            cv2.rectangle(self.scaled, (int(x * sx), int(y * sy)), (int((x + w) * sx), int((y + h) * sy)),
+                          (0, 255, 0), 2)
+        cv2.cvtColor(self.scaled, cv2.COLOR_BGR2RGBA, dst=self.buffers[index])
+
+        with self.lock:
+            if self.ready is not None:
+                self.replaced += 1
+            self.ready = index
+
+    def paste_into(self, photo):
+        """Copy the newest rendered frame into a create_photo() PhotoImage; False if there is none"""
+        with self.lock:
+            index = self.ready
+            if index is None:
+                return False
+            # The renderer keeps off this buffer until the paste is done
+            self.ready = None
+            self.pasting = index
+        photo.paste(self.images[index])
+        with self.lock:
+            self.pasting = None
+        return True
+
+
+class FramePipeline:
+    """Capture, face detection and rendering running on their own threads.
+
+    A capture thread reads the camera into a bounded drop-oldest queue, a pool
+    of detection workers (each with its own detector, since cascades are not
+    safe to share) annotate frames, and a render thread draws the newest
+    result into a FrameRenderer buffer. The Tk thread only calls display()
+    to paste it into its PhotoImage, and latest() to read detections.
+
+    With a `quality` gate the workers also score every detected face and
+    best_face() returns the best usable crop of the last `quality_window`
+    seconds.
+    """
+
+    def __init__(self, cap, make_detector, display_size=(800, 600), workers=2, queue_size=2,
+                 release_capture=True, quality=None, quality_window=QUALITY_WINDOW):
+        self.cap = cap
+        # A shared camera stays open after the pipeline stops
+        self.release_capture = release_capture
+        self.display_size = display_size
+        self.frames = DropOldestQueue(queue_size)
+        self.detected = DropOldestQueue(queue_size)
+        self.fps = {stage: FPSCounter() for stage in ("capture", "detect", "render")}
+        self.stop_event = threading.Event()
+        self.lock = threading.Lock()
+        self.result = None
+        self.renderer = FrameRenderer(display_size)
+        self.quality = quality
+        self.best_faces = BestFaceWindow(quality_window)
+
+        self.threads = [threading.Thread(target=self._capture_loop, daemon=True),
+                        threading.Thread(target=self._render_loop, daemon=True)]
+        for _ in range(workers):
+            self.threads.append(threading.Thread(target=self._detect_loop, args=(make_detector(),), daemon=True))
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        METRICS.add_source("pipeline", self.stats)
+        return self
+
+    def stop(self):
+        """Stop every stage and release the camera unless it is shared"""
+        self.stop_event.set()
+        METRICS.remove_source("pipeline", self.stats)
+        self.frames.close()
+        self.detected.close()
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1)
+        if self.release_capture:
+            self.cap.release()
+
+    def latest(self):
+        """Return the newest FrameResult with detections, or None before the first frame"""
+        with self.lock:
+            return self.result
+
+    def best_face(self):
+        """(face, box, score) of the best crop that passed the quality gate recently, or None"""
+        return self.best_faces.best()
+
+    def good_faces(self):
+        """(face, box, score) of the best recent crop of each person in view, best first"""
+        return self.best_faces.faces()
+
+    @property
+    def rejection(self):
+        """Why the faces in view were last rejected by the quality gate, e.g. 'too blurry'"""
+        return self.best_faces.rejection
+
+    def create_photo(self):
+        """An ImageTk.PhotoImage of the display size and mode, to reuse for every frame"""
+        return ImageTk.PhotoImage(DISPLAY_MODE, self.display_size)
+
+    def display(self, photo):
+        """Paste the newest rendered frame into `photo`; False if nothing new was rendered"""
+        return self.renderer.paste_into(photo)
+
+    def stats(self):
+        """Per-stage FPS and queue state"""
+        stats = {f"{stage}_fps": counter.fps for stage, counter in self.fps.items()}
+        stats["frames_dropped"] = self.frames.dropped
+        stats["detections_dropped"] = self.detected.dropped
+        stats["renders_replaced"] = self.renderer.replaced
+        stats["frames_queued"] = len(self.frames)
+        stats["detections_queued"] = len(self.detected)
+        return stats
+
+    def _capture_loop(self):
+        seq = 0
+        while not self.stop_event.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                time.sleep(0.01)
+                continue
+            seq += 1
+            self.frames.put(FrameResult(seq, frame))
+            self.fps["capture"].tick()
+
+    def _detect_loop(self, detect):
+        while not self.stop_event.is_set():
+            result = self.frames.get(timeout=0.1)
+            if result is None:
+                continue
+            with METRICS.timer("detect"):
+                result.gray = cv2.cvtColor(result.frame, cv2.COLOR_BGR2GRAY)
+                result.faces = detect(result.gray)
+            if self.quality is not None and len(result.faces):
+                with METRICS.timer("quality"):
+                    faces, quality = self.quality.crop(result.gray, result.faces)
+                self.best_faces.add(faces, result.faces, quality)
+            self.detected.put(result)
+            self.fps["detect"].tick()
+
+    def _render_loop(self):
+        rendered = 0
+        while not self.stop_event.is_set():
+            result = self.detected.get(timeout=0.1)
+            # Workers can finish out of order; never show an older frame
+            if result is None or result.seq <= rendered:
+                continue
+
+            with self.lock:
+                self.result = result
+            rendered = result.seq
+            start = time.perf_counter()
+            self.renderer.render(result.frame, result.faces)
+            METRICS.observe("render", time.perf_counter() - start)
+            self.fps["render"].tick()
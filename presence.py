@@ -0,0 +1,118 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Seconds during which the same user isn't shown another popup
+NOTIFY_COOLDOWN = 60.0
+
+
+class PresenceSet:
+    """Users marked present today, as a bitset indexed by user id.
+
+    Check-in code asks this before touching SQLite: a user already marked
+    today is rejected with one float comparison (has midnight passed?) and
+    one bit lookup, with no query and no date parsing. Today's users are
+    read with load(day) on first use and again after every midnight, so a
+    kiosk left running overnight starts the new day empty.
+
+    Bits are only ever set. A user missing from the set (marked by another
+    process, say) is checked against the database as before and added then.
+    """
+
+    def __init__(self, load=None, clock=time.time):
+        self.load = load
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.bits = bytearray()
+        self.count = 0
+        self.day = None
+        # Timestamp at which `day` ends
+        self.midnight = float("-inf")
+
+    def today(self):
+        """Today's date as YYYY-MM-DD, starting a fresh set once midnight has passed"""
+        if self.clock() >= self.midnight:
+            self._roll_over()
+        return self.day
+
+    def __contains__(self, user_id):
+        """Whether `user_id` is marked today"""
+        self.today()
+        bits = self.bits
+        index = user_id >> 3
+        return index < len(bits) and (bits[index] >> (user_id & 7)) & 1 == 1
+
+    def __len__(self):
+        self.today()
+        return self.count
+
+    def contains(self, user_id, day):
+        """Whether `user_id` is marked on the YYYY-MM-DD `day`, as far as is known; only today is tracked"""
+        return day == self.today() and user_id in self
+
+    def add(self, user_id, day=None):
+        """Record that `user_id` is marked on `day` (default today); other days are ignored"""
+        self.update([(user_id, day or self.today())])
+
+    def update(self, marked):
+        """Record (user_id, day) pairs that are marked"""
+        # Roll over first if midnight has passed, then compare under the lock so
+        # a roll-over can't slip between reading the day and setting its bits
+        self.today()
+        with self.lock:
+            for user_id, day in marked:
+                if day == self.day:
+                    self._set(user_id)
+
+    def stats(self):
+        return {"present": len(self)}
+
+    def _set(self, user_id):
+        index = user_id >> 3
+        bits = self.bits
+        if index >= len(bits):
+            # Grow geometrically; readers index the old or the new array, both valid
+            bits.extend(bytes(max(index + 1, 2 * len(bits)) - len(bits)))
+        bit = 1 << (user_id & 7)
+        if not bits[index] & bit:
+            bits[index] |= bit
+            self.count += 1
+
+    def _roll_over(self):
+        with self.lock:
+            now = self.clock()
+            if now < self.midnight:
+                # Another thread got here first
+                return
+            start = datetime.fromtimestamp(now).replace(hour=0, minute=0, second=0, microsecond=0)
+            day = start.strftime("%Y-%m-%d")
+            self.bits = bytearray()
+            self.count = 0
+            for user_id in (self.load(day) if self.load else ()):
+                self._set(user_id)
+            # Publish the new day last, so a reader never pairs it with yesterday's bits
+            self.day = day
+            self.midnight = (start + timedelta(days=1)).timestamp()
+
+
+class Cooldown:
+    """Remembers when each user was last shown a popup, so the same face doesn't raise one per click"""
+
+    def __init__(self, seconds=NOTIFY_COOLDOWN, clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+        self.last = {}
+        self.lock = threading.Lock()
+
+    def ready(self, user_id):
+        """True unless `user_id` was shown within the cooldown; a True answer starts a new one"""
+        now = self.clock()
+        with self.lock:
+            last = self.last.get(user_id)
+            if last is not None and now - last < self.seconds:
+                return False
+            self.last[user_id] = now
+            if len(self.last) > 1024:
+                # Forget users whose cooldown is over
+                self.last = {key: shown for key, shown in self.last.items() if now - shown < self.seconds}
+            return True
@@ -0,0 +1,41 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall-clock timings of the startup stages, relative to launch.
+
+    Stages may run on different threads; each is recorded with its
+    duration and the time since launch at which it finished.
+    """
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.stages = []
+        self.lock = threading.Lock()
+
+    def record(self, name, start, end=None):
+        end = end if end is not None else time.perf_counter()
+        with self.lock:
+            self.stages.append((name, end - start, end - self.started))
+
+    def mark(self, name):
+        """Record a point in time, e.g. the first window appearing"""
+        self.record(name, time.perf_counter())
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start)
+
+    def report(self):
+        with self.lock:
+            stages = sorted(self.stages, key=lambda stage: stage[2])
+        lines = [f"{'stage':<28} | {'took':>9} | {'done at':>9}"]
+        for name, took, done in stages:
+            lines.append(f"{name:<28} | {took * 1000:>7.1f}ms | {done * 1000:>7.1f}ms")
+        return "\n".join(lines)
@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from recognition import extract_faces
+from tracking import iou
+
+# Gates a face must pass before it is matched or enrolled. Sharpness and
+# symmetry are measured on the normalized 100x100 crop, which is what the
+# matcher sees: blur that disappears when a large face is downscaled
+# doesn't matter. Tuned on 640x480 webcam footage, where sharp faces score
+# 30-70 and faces with motion blur in any direction below 13.
+MIN_FACE_SIZE = 60        # shorter side of the detection box, frame pixels
+MIN_SHARPNESS = 20        # Laplacian variance of the crop along its blurrier axis
+MIN_BRIGHTNESS = 40       # mean grey level of the crop
+MAX_BRIGHTNESS = 215
+MIN_CONTRAST = 15         # standard deviation of the crop
+MAX_ASYMMETRY = 40        # mean |crop - mirrored crop|; frontal faces are ~20
+
+# Values from which a larger face or a sharper crop no longer ranks higher
+GOOD_FACE_SIZE = 100
+GOOD_SHARPNESS = 50
+
+# Seconds over which the best crop is chosen
+QUALITY_WINDOW = 1.0
+
+# Overlap above which crops of the window are taken to show the same person
+SAME_FACE_IOU = 0.3
+
+
+class FaceQuality:
+    """Quality measurements of a stack of face crops, one entry per face"""
+
+    REASONS = ("too small", "too blurry", "too dark", "too bright", "low contrast", "not facing the camera")
+
+    def __init__(self, size, sharpness, brightness, contrast, asymmetry, gate):
+        self.size = size
+        self.sharpness = sharpness
+        self.brightness = brightness
+        self.contrast = contrast
+        self.asymmetry = asymmetry
+        # One row per gate in REASONS order, True where the face fails it
+        self.failures = np.stack([size < gate.min_size, sharpness < gate.min_sharpness,
+                                  brightness < gate.min_brightness, brightness > gate.max_brightness,
+                                  contrast < gate.min_contrast, asymmetry > gate.max_asymmetry])
+        self.passed = ~self.failures.any(axis=0)
+        self.score = (np.minimum(sharpness / GOOD_SHARPNESS, 1.0) * np.minimum(size / GOOD_FACE_SIZE, 1.0)
+                      * (1.0 - np.minimum(asymmetry / gate.max_asymmetry, 1.0)))
+
+    def __len__(self):
+        return len(self.passed)
+
+    def reason(self, i):
+        """Why face `i` was rejected, or None if it passed"""
+        failed = np.flatnonzero(self.failures[:, i])
+        return self.REASONS[failed[0]] if len(failed) else None
+
+
+class QualityGate:
+    """Scores face crops in one vectorized pass and rejects unusable ones.
+
+    Sharpness is the variance of the Laplacian taken along the weaker of
+    its two axes (twice the smaller of the variances of the horizontal and
+    vertical second derivatives), since motion blur along one direction
+    leaves the edges across it sharp. Size is the shorter side of the
+    detection box, brightness and contrast the mean and standard deviation,
+    and frontalness the difference between the crop and its mirror image
+    (a turned head is lopsided). Every measurement runs on the whole
+    (N, 100, 100) stack at once.
+    """
+
+    def __init__(self, min_size=MIN_FACE_SIZE, min_sharpness=MIN_SHARPNESS, min_brightness=MIN_BRIGHTNESS,
+                 max_brightness=MAX_BRIGHTNESS, min_contrast=MIN_CONTRAST, max_asymmetry=MAX_ASYMMETRY):
+        self.min_size = min_size
+        self.min_sharpness = min_sharpness
+        self.min_brightness = min_brightness
+        self.max_brightness = max_brightness
+        self.min_contrast = min_contrast
+        self.max_asymmetry = max_asymmetry
+
+    def assess(self, faces, boxes):
+        """FaceQuality of (N, 100, 100) crops cut from the (x, y, w, h) `boxes`"""
+        faces = np.asarray(faces, dtype=np.uint8)
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        n = len(faces)
+        pixels = faces.reshape(n, -1).astype(np.float32)
+        signed = faces.astype(np.int16)
+
+        # The two halves of the 4-neighbour Laplacian
+        dxx = 2 * signed[:, 1:-1, 1:-1] - signed[:, 1:-1, :-2] - signed[:, 1:-1, 2:]
+        dyy = 2 * signed[:, 1:-1, 1:-1] - signed[:, :-2, 1:-1] - signed[:, 2:, 1:-1]
+        sharpness = 2 * np.minimum(dxx.reshape(n, -1).astype(np.float32).var(axis=1),
+                                   dyy.reshape(n, -1).astype(np.float32).var(axis=1))
+        asymmetry = np.abs(signed - signed[:, :, ::-1]).reshape(n, -1).mean(axis=1)
+        return FaceQuality(np.minimum(boxes[:, 2], boxes[:, 3]), sharpness, pixels.mean(axis=1),
+                           pixels.std(axis=1), asymmetry, self)
+
+    def crop(self, gray, boxes):
+        """Crop the faces of a frame and assess them; returns (faces, quality)"""
+        faces = extract_faces(gray, boxes)
+        return faces, self.assess(faces, boxes)
+
+
+class BestFaceWindow:
+    """The best crop that passed the gate within the last `window` seconds.
+
+    A click on Capture or Mark Attendance uses this instead of whatever the
+    newest frame holds, so a blink or a motion-blurred frame at the moment
+    of the click doesn't cost a retry. The reason the newest faces were
+    rejected is kept for feedback to the user.
+    """
+
+    def __init__(self, window=QUALITY_WINDOW):
+        self.window = window
+        self.entries = deque()
+        self.lock = threading.Lock()
+        self.rejection = None
+
+    def add(self, faces, boxes, quality, now=None):
+        """Offer the crops of one frame"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            for i in np.flatnonzero(quality.passed):
+                self.entries.append((now, float(quality.score[i]), faces[i], tuple(int(v) for v in boxes[i])))
+            rejected = [quality.reason(i) for i in range(len(quality)) if not quality.passed[i]]
+            self.rejection = rejected[0] if rejected and not quality.passed.any() else None
+
+    def best(self, now=None):
+        """(face, box, score) of the best crop in the window, or None"""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            if not self.entries:
+                return None
+            _, score, face, box = max(self.entries, key=lambda entry: entry[1])
+            return face, box, score
+
+    def faces(self, now=None):
+        """(face, box, score) of the best crop at each place in the frame within the window, best first.
+
+        Crops whose boxes overlap count as one person, so when several
+        people are in view each of them gets their best crop.
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._expire(now)
+            entries = sorted(self.entries, key=lambda entry: entry[1], reverse=True)
+        chosen = []
+        for _, score, face, box in entries:
+            if chosen and iou([box], [other[1] for other in chosen]).max() >= SAME_FACE_IOU:
+                continue
+            chosen.append((face, box, score))
+        return chosen
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.rejection = None
+
+    def _expire(self, now):
+        while self.entries and self.entries[0][0] < now - self.window:
+            self.entries.popleft()
@@ -0,0 +1,297 @@
+import os
+import struct
+import time
+
+import cv2
+import numpy as np
+
+from ann_index import IVFIndex
+from cache import LRUCache
+from metrics import METRICS
+
+# Size of the grayscale face crop every template is normalized to
+TEMPLATE_SIZE = (100, 100)
+TEMPLATE_LENGTH = TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1]
+
+# Mean absolute pixel difference below which two faces are the same person
+MATCH_THRESHOLD = 50
+
+# Stored feature vector layout: magic, format version, dtype code, padding, length.
+# The header is 12 bytes so float32 payloads stay 4-byte aligned.
+VECTOR_HEADER = struct.Struct('<4sBBxxI')
+VECTOR_MAGIC = b'FVEC'
+VECTOR_VERSION = 1
+VECTOR_DTYPES = {1: np.dtype(np.uint8), 2: np.dtype(np.float32)}
+
+# Side of the square blocks averaged together for the coarse shortlist descriptor
+COARSE_BLOCK = 4
+
+# Decoded templates kept for returning users
+TEMPLATE_CACHE_SIZE = 1024
+
+
+def extract_face(gray, box):
+    """Crop a detected face from a grayscale frame and resize it to the template size"""
+    x, y, w, h = box
+    return cv2.resize(gray[y:y + h, x:x + w], TEMPLATE_SIZE)
+
+
+def decode_template(blob):
+    """Decode a stored JPEG face template into a 100x100 grayscale array"""
+    face = cv2.imdecode(np.frombuffer(blob, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    return cv2.resize(face, TEMPLATE_SIZE)
+
+
+def encode_vector(vector):
+    """Serialize a uint8 or float32 feature vector with a versioned header"""
+    vector = np.ascontiguousarray(vector).reshape(-1)
+    for code, dtype in VECTOR_DTYPES.items():
+        if vector.dtype == dtype:
+            break
+    else:
+        raise ValueError(f"Unsupported feature vector dtype: {vector.dtype}")
+    return VECTOR_HEADER.pack(VECTOR_MAGIC, VECTOR_VERSION, code, vector.size) + vector.tobytes()
+
+
+def decode_vector(blob):
+    """Map a stored feature vector onto a read-only NumPy array without copying"""
+    if len(blob) < VECTOR_HEADER.size:
+        raise ValueError("Unrecognized face vector format")
+    magic, version, code, length = VECTOR_HEADER.unpack_from(blob)
+    if magic != VECTOR_MAGIC or version != VECTOR_VERSION or code not in VECTOR_DTYPES:
+        raise ValueError("Unrecognized face vector format")
+    return np.frombuffer(blob, dtype=VECTOR_DTYPES[code], count=length, offset=VECTOR_HEADER.size)
+
+
+def load_template(face_template, face_vector):
+    """Return a user's template from its feature vector, falling back to the legacy JPEG"""
+    if face_vector is not None:
+        return decode_vector(face_vector)
+    return decode_template(face_template).reshape(-1)
+
+
+def extract_faces(gray, boxes):
+    """Crop every detected face and stack them into an (N, 100, 100) array"""
+    faces = np.empty((len(boxes),) + TEMPLATE_SIZE, dtype=np.uint8)
+    for i, box in enumerate(boxes):
+        faces[i] = extract_face(gray, box)
+    return faces
+
+
+def coarse_descriptor(templates):
+    """Block-average flattened templates into small float32 vectors for shortlisting"""
+    templates = np.asarray(templates, dtype=np.float32).reshape(-1, TEMPLATE_LENGTH)
+    side = TEMPLATE_SIZE[0] // COARSE_BLOCK
+    blocks = templates.reshape(-1, side, COARSE_BLOCK, side, COARSE_BLOCK)
+    return np.ascontiguousarray(blocks.mean(axis=(2, 4)).reshape(-1, side * side))
+
+
+def default_matcher(matcher=None):
+    """The given matcher, or the pixel-difference matcher"""
+    if matcher is None:
+        # Imported here because matchers builds on this module
+        from matchers import PixelDiffMatcher
+        matcher = PixelDiffMatcher()
+    return matcher
+
+
+class TemplateCache:
+    """Matcher vectors of stored templates by user id, so a returning user is decoded only once.
+
+    Entries are dropped through the database's invalidate hooks whenever the
+    user's row is written. Cached arrays are read-only.
+    """
+
+    def __init__(self, db, matcher=None, maxsize=TEMPLATE_CACHE_SIZE):
+        self.matcher = default_matcher(matcher)
+        self.cache = LRUCache(maxsize)
+        db.invalidate_hooks.append(self.cache.pop)
+
+    def get(self, user_id, face_template, face_vector):
+        return self.cache.get_or_load(user_id, lambda: self._load(face_template, face_vector))
+
+    def _load(self, face_template, face_vector):
+        vector = self.matcher.embed(load_template(face_template, face_vector))[0]
+        vector.setflags(write=False)
+        return vector
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class FaceIdentifier:
+    """1:N identification of a face against every enrolled template held in memory.
+
+    Each user's matcher vector (the raw pixels for the pixel matcher, an
+    embedding for a DNN matcher) lives in one contiguous matrix next to a
+    matrix of shortlist descriptors. A probe is ranked against all users
+    with a single matrix-vector product on the descriptors, and only the
+    shortlist is re-scored with the matcher's exact distance. Vectors a
+    matcher can't derive for free are computed once and cached in the
+    database.
+
+    Once enough users are enrolled for its centroids to be trained, the
+    shortlist comes from an IVF index over the coarse descriptors instead of a
+    full scan. The index is saved to `index_path` and caught up with users
+    registered since, so startup doesn't re-cluster.
+    """
+
+    def __init__(self, db, shortlist=32, index_path=None, matcher=None):
+        self.db = db
+        self.shortlist = shortlist
+        self.index_path = index_path
+        self.matcher = default_matcher(matcher)
+        self.count = 0
+        self.rows = {}
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, self.matcher.dim), dtype=self.matcher.dtype)
+        self.coarse = np.empty((0, self.matcher.shortlist_dim), dtype=np.float32)
+        self.coarse_norms = np.empty(0, dtype=np.float32)
+        self.reload()
+
+        # Keep the matrix and index current as users register
+        db.register_hooks.append(self._on_register)
+
+    def reload(self):
+        """Load every enrolled template from the database"""
+        rows = self.db.get_face_templates()
+        self.count = 0
+        self.rows = {}
+        self._reserve(len(rows))
+        if self.matcher.cache_vectors:
+            cached = self._cached_vectors(rows)
+            for user_id, _, _ in rows:
+                self._append(user_id, decode_vector(cached[user_id]))
+        else:
+            for user_id, face_template, face_vector in rows:
+                self._append(user_id, self.matcher.embed(load_template(face_template, face_vector))[0])
+        self._load_index()
+
+    def _cached_vectors(self, rows, chunk=256):
+        """Stored matcher vectors by user id, computing and saving any that are missing"""
+        cached = self.db.get_face_embeddings(self.matcher.name)
+        missing = [row for row in rows if row[0] not in cached]
+        for i in range(0, len(missing), chunk):
+            batch = missing[i:i + chunk]
+            vectors = self.matcher.embed(np.stack([load_template(face_template, face_vector)
+                                                   for _, face_template, face_vector in batch]))
+            encoded = [(user_id, encode_vector(vector)) for (user_id, _, _), vector in zip(batch, vectors)]
+            self.db.save_face_embeddings(self.matcher.name, encoded)
+            cached.update(encoded)
+        return cached
+
+    def _load_index(self):
+        """Load the saved ANN index and add any users it doesn't know about yet"""
+        self.index = None
+        if self.index_path and os.path.exists(self.index_path):
+            self.index = IVFIndex.load(self.index_path)
+            if self.index.dim != self.coarse.shape[1] or not np.isin(self.index.ids(), self.user_ids[:self.count]).all():
+                # Stale or for another database, rebuild from scratch
+                self.index = None
+        if self.index is None:
+            self.index = IVFIndex(self.coarse.shape[1])
+
+        missing = np.setdiff1d(self.user_ids[:self.count], self.index.ids())
+        if len(missing):
+            self.index.add(missing, self.coarse[[self.rows[user_id] for user_id in missing]])
+            self.save_index()
+
+    def save_index(self):
+        """Persist the ANN index so the next startup can reuse it"""
+        if self.index_path:
+            self.index.save(self.index_path)
+
+    def _on_register(self, user_id, face_template, face_vector):
+        self.add(user_id, load_template(face_template, face_vector))
+
+    def add(self, user_id, template):
+        """Add a newly registered user's template"""
+        vector = self.matcher.embed(template)[0]
+        if self.matcher.cache_vectors:
+            self.db.save_face_embeddings(self.matcher.name, [(user_id, encode_vector(vector))])
+        self._reserve(self.count + 1)
+        self._append(user_id, vector)
+        self.index.add([user_id], self.coarse[self.count - 1])
+
+    def _reserve(self, capacity):
+        """Grow the matrices geometrically so appends stay amortized O(1)"""
+        if capacity <= len(self.user_ids):
+            return
+        capacity = max(capacity, 2 * len(self.user_ids), 16)
+        n = self.count
+        user_ids = np.empty(capacity, dtype=self.user_ids.dtype)
+        vectors = np.empty((capacity, self.vectors.shape[1]), dtype=self.vectors.dtype)
+        coarse = np.empty((capacity, self.coarse.shape[1]), dtype=self.coarse.dtype)
+        norms = np.empty(capacity, dtype=self.coarse_norms.dtype)
+        user_ids[:n] = self.user_ids[:n]
+        vectors[:n] = self.vectors[:n]
+        coarse[:n] = self.coarse[:n]
+        norms[:n] = self.coarse_norms[:n]
+        self.user_ids, self.vectors, self.coarse, self.coarse_norms = user_ids, vectors, coarse, norms
+
+    def _append(self, user_id, vector):
+        i = self.count
+        self.rows[user_id] = i
+        self.user_ids[i] = user_id
+        self.vectors[i] = np.asarray(vector).reshape(-1)
+        self.coarse[i] = self.matcher.shortlist_descriptors(self.vectors[i:i + 1])[0]
+        self.coarse_norms[i] = self.coarse[i] @ self.coarse[i]
+        self.count += 1
+
+    def identify(self, face, top_k=1):
+        """Return up to top_k (user_id, distance) pairs for a face, best match first"""
+        return self.identify_batch([face], top_k)[0]
+
+    def identify_batch(self, faces, top_k=1):
+        """Identify a stack of faces at once; returns one identify() result per face"""
+        faces = np.asarray(faces, dtype=np.uint8).reshape((-1,) + TEMPLATE_SIZE)
+        n = self.count
+        if n == 0 or len(faces) == 0:
+            return [[] for _ in range(len(faces))]
+
+        # Every face of the frame goes through the matcher in one batch
+        with METRICS.timer("embed"):
+            probes = self.matcher.embed(faces)
+        start = time.perf_counter()
+        probes_coarse = self.matcher.shortlist_descriptors(probes)
+        k = min(max(self.shortlist, top_k), n)
+
+        if self.index.trained:
+            # Only scan the index buckets nearest to each probe; -1 pads short results
+            candidates = np.full((len(probes), k), -1, dtype=np.int64)
+            for p, probe_coarse in enumerate(probes_coarse):
+                ids, _ = self.index.search(probe_coarse, k)
+                candidates[p, :len(ids)] = [self.rows[user_id] for user_id in ids]
+        else:
+            # Squared L2 distance from every probe to every user on the coarse
+            # descriptors in one matrix product, minus the probes' own norms,
+            # which don't change the ranking
+            scores = self.coarse_norms[:n] - 2.0 * (probes_coarse @ self.coarse[:n].T)
+            if k < n:
+                candidates = np.argpartition(scores, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(n), (len(probes), n))
+
+        # Exact matcher distance on the shortlists only
+        distances = np.empty(candidates.shape, dtype=np.float64)
+        for p, probe in enumerate(probes):
+            distances[p] = self.matcher.distances(probe, self.vectors[np.maximum(candidates[p], 0)])[0]
+        distances[candidates < 0] = np.inf
+
+        results = []
+        for p, order in enumerate(np.argsort(distances, axis=1)[:, :top_k]):
+            results.append([(int(self.user_ids[candidates[p, i]]), float(distances[p, i]))
+                            for i in order if candidates[p, i] >= 0])
+        METRICS.observe("match", time.perf_counter() - start)
+        return results
+
+    def best_match(self, face, threshold=None):
+        """Return the (user_id, distance) of the closest user under the threshold, or None"""
+        return self.best_matches([face], threshold)[0]
+
+    def best_matches(self, faces, threshold=None):
+        """best_match() for a stack of faces in one vectorized pass"""
+        if threshold is None:
+            threshold = self.matcher.threshold
+        return [matches[0] if matches and matches[0][1] < threshold else None
+                for matches in self.identify_batch(faces)]
@@ -0,0 +1,451 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from database import DB_PATH, Database
+from detection import create_detector, load_detector_options
+from matchers import create_matcher, index_path_for
+from metrics import METRICS
+from quality import QualityGate
+from recognition import TEMPLATE_LENGTH, TEMPLATE_SIZE, FaceIdentifier
+
+SERVICE_PORT = 8765
+
+# Faces matched in one call at most, and how long the first face of a batch
+# waits for others to join it. Under load the next batch also collects
+# everything that arrived while the previous one was being matched.
+MAX_BATCH = 64
+BATCH_WAIT = 0.002
+
+# Seconds between checks for users enrolled through another process, e.g. the app
+REFRESH_INTERVAL = 1.0
+
+# Largest request body accepted (a 1080p JPEG is well under this)
+MAX_BODY = 16 * 1024 * 1024
+
+# Most header lines accepted in one request; each line is limited by the stream's 64 KiB buffer
+MAX_HEADERS = 100
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MatchBatcher:
+    """Groups the faces of concurrent requests into one identification call.
+
+    Requests hand their crops to match() and await the result. A single
+    loop takes the first waiting request, lets others join it for up to
+    `max_wait` seconds or until `max_batch` faces are queued, and identifies
+    all of them with one identify_batch() on the match thread. Attendance of
+    the whole batch is then marked in one transaction on the database
+    thread while the next batch is already being matched.
+
+    Before matching, the match thread checks at most every
+    `refresh_interval` seconds whether users were enrolled through another
+    connection (the app, another process) and reloads the identifier if so.
+    """
+
+    def __init__(self, identifier, db, max_batch=MAX_BATCH, max_wait=BATCH_WAIT, refresh_interval=REFRESH_INTERVAL):
+        self.identifier = identifier
+        self.db = db
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.refresh_interval = refresh_interval
+        self.next_refresh = 0.0
+        self.data_version = None
+        self.enrolled = self._enrolled()
+        # FaceIdentifier is used from one thread only; database writes get their own
+        self.match_executor = ThreadPoolExecutor(1, thread_name_prefix="match")
+        self.db_executor = ThreadPoolExecutor(1, thread_name_prefix="db")
+        self.queue = None
+        self.task = None
+        self.finishing = set()
+        self.batches = 0
+        self.requests = 0
+        self.faces = 0
+        self.largest = 0
+
+    def start(self):
+        """Start the batching loop; call from inside the event loop"""
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        self.task.cancel()
+        if self.finishing:
+            await asyncio.gather(*self.finishing, return_exceptions=True)
+        self.match_executor.shutdown()
+        self.db_executor.shutdown()
+
+    async def match(self, faces, mark):
+        """Identify (N, 100, 100) crops; returns one result dict per face"""
+        if len(faces) == 0:
+            return []
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((faces, mark, future))
+        return await future
+
+    def stats(self):
+        """Batch counters, for metrics"""
+        return {"batches": self.batches, "requests": self.requests, "faces": self.faces,
+                "mean_batch": self.faces / max(self.batches, 1), "largest_batch": self.largest,
+                "queued": self.queue.qsize() if self.queue else 0}
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            try:
+                count = len(batch[0][0])
+                deadline = loop.time() + self.max_wait
+                while count < self.max_batch:
+                    if self.queue.empty():
+                        timeout = deadline - loop.time()
+                        if timeout <= 0:
+                            break
+                        try:
+                            batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                        except asyncio.TimeoutError:
+                            break
+                    else:
+                        batch.append(self.queue.get_nowait())
+                    count += len(batch[-1][0])
+
+                faces = np.concatenate([faces for faces, _, _ in batch])
+                matches = await loop.run_in_executor(self.match_executor, self._best_matches, faces)
+                self.batches += 1
+                self.requests += len(batch)
+                self.faces += len(faces)
+                self.largest = max(self.largest, len(faces))
+
+                task = asyncio.create_task(self._finish(batch, matches))
+                self.finishing.add(task)
+                task.add_done_callback(self.finishing.discard)
+            except Exception as e:
+                # Fail this batch's requests; the loop must survive to serve the next ones
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _best_matches(self, faces):
+        # On the match thread, which owns the identifier
+        self._refresh()
+        return self.identifier.best_matches(faces)
+
+    def _refresh(self):
+        """Reload the identifier if users were enrolled through another connection"""
+        now = time.monotonic()
+        if now < self.next_refresh:
+            return
+        self.next_refresh = now + self.refresh_interval
+        # data_version changes whenever another connection commits, attendance included,
+        # so the users are only counted when it has moved
+        version = self.db.conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self.data_version:
+            return
+        self.data_version = version
+        enrolled = self._enrolled()
+        if enrolled != self.enrolled:
+            self.identifier.reload()
+            self.enrolled = enrolled
+
+    def _enrolled(self):
+        return self.db.conn.execute('SELECT COUNT(*), MAX(id) FROM users').fetchone()
+
+    async def _finish(self, batch, matches):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.db_executor, self._results, batch, matches)
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            # A client that disconnected has cancelled its future
+            if not future.done():
+                future.set_result(result)
+
+    def _results(self, batch, matches):
+        """Split the batch's matches back into per-request results, marking attendance in one go"""
+        to_mark = []
+        start = 0
+        for faces, mark, _ in batch:
+            if mark:
+                to_mark += [match[0] for match in matches[start:start + len(faces)] if match]
+            start += len(faces)
+        marked = {}
+        if to_mark:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            marked = {user_id: (success, message)
+                      for user_id, success, message in self.db.mark_attendance_bulk(to_mark, now)}
+
+        results = []
+        start = 0
+        for faces, mark, _ in batch:
+            request = []
+            for match in matches[start:start + len(faces)]:
+                if match is None:
+                    request.append({"user_id": None})
+                    continue
+                user_id, distance = match
+                info = self.db.get_user_info(user_id)
+                result = {"user_id": user_id, "name": info[0] if info else None,
+                          "enrollment": info[1] if info else None, "distance": distance}
+                if mark:
+                    success, message = marked[user_id]
+                    result["attendance"] = {"marked": success, "message": message}
+                request.append(result)
+            results.append(request)
+            start += len(faces)
+        return results
+
+
+class RecognitionService:
+    """Local HTTP service identifying faces for thin kiosk clients.
+
+    POST /identify takes one face crop (an encoded image, or the raw
+    100x100 grayscale bytes as application/octet-stream); POST /recognize
+    takes a whole frame, detects every face in it and identifies them.
+    Both gate crops on quality, mark attendance for recognized users unless
+    called with ?mark=0, and answer with JSON. GET /health reports the
+    enrolled users and batch counters, GET /metrics the stage latencies.
+
+    Decoding and detection run on a thread pool (OpenCV releases the GIL),
+    matching goes through a MatchBatcher, and connections are kept alive,
+    so one event loop serves many kiosks. Users enrolled through the app
+    while the service runs are matched from the next second on.
+    """
+
+    def __init__(self, db_path=DB_PATH, matcher_options=None, detector_options=None, max_batch=MAX_BATCH,
+                 max_wait=BATCH_WAIT, detect_threads=None):
+        self.db = Database(db_path)
+        matcher = create_matcher(**(matcher_options or {}))
+        self.identifier = FaceIdentifier(self.db, index_path=index_path_for(matcher, os.path.dirname(db_path)),
+                                         matcher=matcher)
+        self.batcher = MatchBatcher(self.identifier, self.db, max_batch, max_wait)
+        self.detector_options = detector_options or {}
+        self.detect_executor = ThreadPoolExecutor(detect_threads or os.cpu_count() or 1,
+                                                  thread_name_prefix="detect")
+        # Cascades can't be shared between threads, so each detection thread builds its own
+        self.local = threading.local()
+        self.gate = QualityGate()
+        self.routes = {("POST", "/identify"): self.identify, ("POST", "/recognize"): self.recognize,
+                       ("GET", "/health"): self.health, ("GET", "/metrics"): self.metrics}
+
+    async def serve(self, host="127.0.0.1", port=SERVICE_PORT, ready=None):
+        """Serve until cancelled; `ready` is called with the bound (host, port)"""
+        self.batcher.start()
+        METRICS.add_source("service", self.batcher.stats)
+        server = await asyncio.start_server(self.handle, host, port)
+        try:
+            if ready:
+                ready(server.sockets[0].getsockname()[:2])
+            async with server:
+                await server.serve_forever()
+        finally:
+            METRICS.remove_source("service", self.batcher.stats)
+            await self.batcher.stop()
+            self.detect_executor.shutdown()
+            self.db.close()
+
+    async def handle(self, reader, writer):
+        """Answer requests on one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HTTPError as e:
+                    await send_response(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, path, query, headers, body = request
+                start = time.perf_counter()
+                route = self.routes.get((method, path))
+                try:
+                    if route is None:
+                        known = any(route_path == path for _, route_path in self.routes)
+                        raise HTTPError(405 if known else 404, f"{method} {path} is not supported")
+                    status, payload = 200, await route(query, headers, body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await send_response(writer, status, payload, keep_alive)
+                # Unknown paths share one histogram, so arbitrary URLs can't grow the registry
+                name = f"service{path.replace('/', '.')}" if route is not None else "service.unmatched"
+                METRICS.observe(name, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def identify(self, query, headers, body):
+        loop = asyncio.get_running_loop()
+        faces, quality = await loop.run_in_executor(self.detect_executor, self._decode_crop,
+                                                    headers.get("content-type", ""), body)
+        return {"faces": await self._match(faces, [None], quality, wants_mark(query))}
+
+    async def recognize(self, query, headers, body):
+        loop = asyncio.get_running_loop()
+        faces, boxes, quality = await loop.run_in_executor(self.detect_executor, self._detect, body)
+        return {"faces": await self._match(faces, boxes, quality, wants_mark(query))}
+
+    async def health(self, query, headers, body):
+        return dict(self.batcher.stats(), users=self.identifier.count)
+
+    async def metrics(self, query, headers, body):
+        return METRICS.render()
+
+    async def _match(self, faces, boxes, quality, mark):
+        """Identify the crops that passed the gate; rejected ones get the reason instead"""
+        matches = iter(await self.batcher.match(faces[quality.passed], mark))
+        results = []
+        for i, box in enumerate(boxes):
+            result = next(matches) if quality.passed[i] else {"user_id": None, "rejected": quality.reason(i)}
+            if box is not None:
+                result["box"] = [int(v) for v in box]
+            results.append(result)
+        return results
+
+    def _decode_crop(self, content_type, body):
+        if content_type.startswith("application/octet-stream"):
+            if len(body) != TEMPLATE_LENGTH:
+                raise HTTPError(400, f"A raw face crop must be {TEMPLATE_SIZE[0]}x{TEMPLATE_SIZE[1]} grayscale bytes")
+            gray = np.frombuffer(body, dtype=np.uint8).reshape(TEMPLATE_SIZE)
+        else:
+            gray = decode_image(body)
+        # The whole image is the face, so its size is the box the gate checks
+        box = [(0, 0, gray.shape[1], gray.shape[0])]
+        return self.gate.crop(gray, box)
+
+    def _detect(self, body):
+        gray = decode_image(body)
+        detect = getattr(self.local, "detect", None)
+        if detect is None:
+            detect = self.local.detect = create_detector(**self.detector_options)
+        with METRICS.timer("detect"):
+            boxes = detect(gray)
+        faces, quality = self.gate.crop(gray, boxes)
+        return faces, boxes, quality
+
+
+def decode_image(body):
+    """Decode an encoded image request body to grayscale"""
+    gray = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        raise HTTPError(400, "The request body is not a supported image")
+    return gray
+
+
+def wants_mark(query):
+    return query.get("mark", ["1"])[0].lower() not in ("0", "false", "no")
+
+
+async def read_line(reader):
+    """One line of the request head; a line longer than the stream buffer is an HTTPError"""
+    try:
+        return await reader.readline()
+    except ValueError:
+        # readline() reports a line over the StreamReader limit as ValueError
+        raise HTTPError(431, "Request line or header too long")
+
+
+async def read_request(reader):
+    """Read one HTTP/1.1 request; returns (method, path, query, headers, body), or None at EOF"""
+    line = await read_line(reader)
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+    headers = {}
+    for count in range(MAX_HEADERS + 1):
+        line = await read_line(reader)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if count == MAX_HEADERS:
+            raise HTTPError(431, f"Requests are limited to {MAX_HEADERS} headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"Request bodies are limited to {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    url = urlsplit(target)
+    return method.upper(), url.path, parse_qs(url.query), headers, body
+
+
+async def send_response(writer, status, payload, keep_alive=True):
+    if isinstance(payload, str):
+        body, content_type = payload.encode(), "text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    writer.write(f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                 f"Content-Type: {content_type}\r\n"
+                 f"Content-Length: {len(body)}\r\n"
+                 f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local face recognition service for kiosk clients")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: localhost only)")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"port to listen on (default: {SERVICE_PORT})")
+    parser.add_argument("--db", default=DB_PATH, help=f"attendance database (default: {DB_PATH})")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help="faces matched in one batch at most")
+    parser.add_argument("--batch-wait", type=float, default=BATCH_WAIT * 1000,
+                        help="milliseconds a face waits for others to join its batch")
+    parser.add_argument("--detect-threads", type=int, default=None,
+                        help="threads decoding and detecting frames (default: one per core)")
+    parser.add_argument("--detector", choices=["haar", "lbp", "yunet"], default=None,
+                        help="face detector backend (default: the calibrated one, else haar)")
+    parser.add_argument("--detector-model", default=None, help="cascade XML or YuNet ONNX file for --detector")
+    parser.add_argument("--detect-scale", type=float, default=None,
+                        help="run face detection on a frame downscaled by this factor")
+    parser.add_argument("--matcher", choices=["pixel", "dnn"], default="pixel", help="face matcher")
+    parser.add_argument("--embedding-model", default=None, help="ONNX face embedding model for --matcher dnn")
+    args = parser.parse_args()
+
+    service = RecognitionService(args.db, matcher_options={"name": args.matcher, "model_path": args.embedding_model},
+                                 detector_options=load_detector_options(backend=args.detector,
+                                                                        model_path=args.detector_model,
+                                                                        scale=args.detect_scale),
+                                 max_batch=args.max_batch,
+                                 max_wait=args.batch_wait / 1000, detect_threads=args.detect_threads)
+    print(f"{service.identifier.count} enrolled users")
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  ready=lambda address: print(f"Listening on http://{address[0]}:{address[1]}")))
+    except KeyboardInterrupt:
+        print("\nStopped")
@@ -0,0 +1,65 @@
+import numpy as np
+
+from ann_index import IVFIndex
+
+
+def clustered(rng, count, dim=32, clusters=50):
+    """Vectors drawn around a few centres, like templates of people photographed repeatedly"""
+    centres = rng.normal(size=(clusters, dim)).astype(np.float32)
+    return centres[rng.integers(0, clusters, count)] + 0.3 * rng.normal(size=(count, dim)).astype(np.float32)
+
+
+def exact_neighbours(vectors, query, k):
+    return np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]
+
+
+def test_ivf_recall():
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, 5000)
+    index = IVFIndex(32, n_lists=32, nprobe=4)
+    index.add(np.arange(len(vectors)), vectors)
+    assert index.trained
+
+    queries = vectors[rng.choice(len(vectors), 100, replace=False)] + 0.05 * rng.normal(size=(100, 32))
+    found = 0
+    for query in queries:
+        ids, _ = index.search(query, k=10)
+        found += len(set(ids) & set(exact_neighbours(vectors, query, 10)))
+    assert found / (10 * len(queries)) >= 0.9
+
+
+def test_untrained_search_is_exact():
+    rng = np.random.default_rng(1)
+    vectors = clustered(rng, 200)
+    index = IVFIndex(32, n_lists=32)
+    index.add(np.arange(len(vectors)), vectors)
+    assert not index.trained
+
+    ids, distances = index.search(vectors[7], k=5)
+    assert list(ids) == list(exact_neighbours(vectors, vectors[7], 5))
+    assert abs(distances[0]) < 1e-3
+
+
+def test_save_load_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = clustered(rng, 3000)
+    index = IVFIndex(32, n_lists=16, nprobe=3)
+    index.add(np.arange(100, 100 + len(vectors)), vectors)
+    path = str(tmp_path / "index" / "ann.npz")
+    index.save(path)
+
+    loaded = IVFIndex.load(path)
+    assert (loaded.dim, loaded.n_lists, loaded.nprobe, loaded.train_size) == \
+        (index.dim, index.n_lists, index.nprobe, index.train_size)
+    assert loaded.count == index.count
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert sorted(loaded.ids()) == sorted(index.ids())
+    for query in vectors[:20]:
+        ids, distances = index.search(query, k=5)
+        loaded_ids, loaded_distances = loaded.search(query, k=5)
+        assert np.array_equal(ids, loaded_ids)
+        assert np.allclose(distances, loaded_distances)
+
+    # Vectors added after loading are bucketed with the saved centroids
+    loaded.add([1], vectors[:1])
+    assert 1 in loaded.search(vectors[0], k=2)[0]
@@ -0,0 +1,73 @@
+from cache import LRUCache
+from database import Database
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache(maxsize=3)
+    for key in "abc":
+        cache.put(key, key.upper())
+    # Reading "a" makes "b" the oldest entry
+    assert cache.get_or_load("a", lambda: None) == "A"
+    cache.put("d", "D")
+
+    assert len(cache) == 3
+    assert list(cache.entries) == ["c", "a", "d"]
+    assert cache.get_or_load("b", lambda: "reloaded") == "reloaded"
+    assert "c" not in cache.entries
+
+
+def test_hits_misses_and_none_results():
+    cache = LRUCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return None if len(loads) == 1 else "row"
+
+    # A lookup that found nothing is not cached
+    assert cache.get_or_load("key", load) is None
+    assert cache.get_or_load("key", load) == "row"
+    assert cache.get_or_load("key", load) == "row"
+    assert len(loads) == 2
+    assert cache.stats() == {"size": 1, "hits": 1, "misses": 2, "hit_rate": 1 / 3}
+
+
+def test_invalidation():
+    cache = LRUCache()
+    for i in range(6):
+        cache.put(i, ("row", i))
+    cache.pop(0)
+    cache.discard_where(lambda key, value: value[1] % 2 == 1)
+    assert sorted(cache.entries) == [2, 4]
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_load_racing_an_invalidation_is_not_stored():
+    cache = LRUCache()
+
+    def load():
+        # The row is rewritten while it is being read
+        cache.pop("key")
+        return "stale"
+
+    assert cache.get_or_load("key", load) == "stale"
+    assert "key" not in cache.entries
+    assert cache.get_or_load("key", lambda: "fresh") == "fresh"
+    assert cache.entries["key"] == "fresh"
+
+
+def test_database_invalidates_a_rewritten_user(tmp_path):
+    db = Database(str(tmp_path / "attendance.db"))
+    user_id = db.register_user("Asha", "E001", "College", "BCA", "A", b"template")
+    assert db.get_user_info(user_id)[3] == "BCA"
+    assert db.verify_login("Asha", "E001")[0] == user_id
+
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET class = 'BSc' WHERE id = ?", (user_id,))
+    # Stale until the writer invalidates the row
+    assert db.get_user_info(user_id)[3] == "BCA"
+    db.invalidate_user(user_id)
+    assert db.get_user_info(user_id)[3] == "BSc"
+    assert len(db.login_cache) == 0
+    db.close()
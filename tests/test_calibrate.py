@@ -0,0 +1,112 @@
+import json
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+import calibrate
+from calibrate import calibrate as run_calibration
+from calibrate import read_labels, save_calibration, write_labels
+from detection import create_detector, load_detector_options
+
+FACES = {0: [(20, 30, 40, 40)], 1: [(60, 20, 40, 40), (110, 60, 30, 30)], 2: [], 3: [(30, 40, 50, 50)]}
+
+
+def detect_blobs(gray):
+    """Stand-in face detector: the bounding boxes of the bright blobs in the image"""
+    contours, _ = cv2.findContours((gray > 127).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [cv2.boundingRect(contour) for contour in contours]
+
+
+@pytest.fixture
+def clip(tmp_path):
+    """A directory of frames with bright squares where FACES puts them"""
+    directory = tmp_path / "clip"
+    directory.mkdir()
+    for index, boxes in FACES.items():
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        for x, y, w, h in boxes:
+            frame[y:y + h, x:x + w] = 255
+        cv2.imwrite(str(directory / f"{index}.png"), frame)
+    return str(directory)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def fake_detectors(clock):
+    """create_detector() stand-in whose settings trade speed for accuracy.
+
+    Each call advances `clock` by less at smaller scales and larger steps,
+    but half scale misses every face and three neighbours add a false
+    detection. YuNet finds every face at a fixed, slower cost.
+    """
+    def create(backend="haar", scale=1.0, scale_factor=1.3, min_neighbors=5, score_threshold=0.9, **options):
+        def detect(gray):
+            clock.now += 0.01 * scale / scale_factor if backend != "yunet" else 0.02
+            if scale == 0.5:
+                return []
+            boxes = detect_blobs(gray)
+            if backend != "yunet" and min_neighbors == 3:
+                boxes.append((0, 0, 5, 5))
+            return boxes
+        return detect
+    return create
+
+
+def test_calibration_saves_the_fastest_setting_that_meets_the_targets(clip, tmp_path, monkeypatch):
+    labels_path = str(tmp_path / "labels.csv")
+    assert write_labels(labels_path, clip, detect_blobs) == 4
+    labels = read_labels(labels_path)
+    assert {index: sorted(boxes) for index, boxes in labels.items()} == {
+        index: sorted(boxes) for index, boxes in FACES.items() if boxes}
+
+    clock = Clock()
+    monkeypatch.setattr(calibrate, "time", SimpleNamespace(perf_counter=clock))
+    monkeypatch.setattr(calibrate, "create_detector", fake_detectors(clock))
+    results, best = run_calibration(clip, labels, {"haar": {"min_size": (20, 20)},
+                                                   "yunet": {"model_path": "models/yunet.onnx"}})
+    assert len(results) == 18 + 9
+    assert {result["recall"] for result in results} == {0.0, 1.0}
+    assert best["options"] == {"min_size": (20, 20), "backend": "haar", "scale": 0.75, "scale_factor": 1.3,
+                               "min_neighbors": 5}
+    assert best["fps"] == pytest.approx(1 / (0.01 * 0.75 / 1.3))
+    assert (best["frames"], best["false_positives_per_frame"]) == (4, 0.0)
+
+    path = str(tmp_path / "data" / "detector.json")
+    save_calibration(best, clip, path=path)
+    with open(path) as f:
+        saved = json.load(f)
+    assert saved["calibration"]["source"] == clip
+    assert saved["calibration"]["recall"] == 1.0
+
+    # Read back the way the app and the service start their detector
+    options = load_detector_options(path)
+    assert options == {"min_size": [20, 20], "backend": "haar", "scale": 0.75, "scale_factor": 1.3,
+                       "min_neighbors": 5}
+    detect = create_detector(**options)
+    assert len(detect(np.zeros((120, 160), dtype=np.uint8))) == 0
+
+    # A file cut short, e.g. by a full disk, is reported instead of crashing startup
+    with open(path, 'w') as f:
+        f.write('{"options": {"backend": "ha')
+    with pytest.raises(ValueError, match="calibrate.py"):
+        load_detector_options(path)
+
+
+def test_no_setting_meets_the_targets(clip, monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(calibrate, "time", SimpleNamespace(perf_counter=clock))
+    monkeypatch.setattr(calibrate, "create_detector", fake_detectors(clock))
+    # A face labelled where the detector can't see it
+    labels = dict(FACES)
+    labels[2] = [(0, 100, 20, 20)]
+    results, best = run_calibration(clip, labels, {"haar": {}}, target_recall=1.0)
+    assert best is None
+    assert max(result["recall"] for result in results) == pytest.approx(4 / 5)
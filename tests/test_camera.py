@@ -0,0 +1,43 @@
+import cv2
+import numpy as np
+
+from camera import CameraManager
+
+
+def write_video(path, frames=10):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    for i in range(frames):
+        writer.write(np.full((48, 64, 3), i * 20, dtype=np.uint8))
+    writer.release()
+
+
+def test_failed_open_is_retried(tmp_path):
+    path = str(tmp_path / "camera.avi")
+    camera = CameraManager(path, warmup_frames=1, retry_interval=0)
+    assert not camera.wait(timeout=10)
+    assert isinstance(camera.error, IOError)
+
+    # The device shows up later; the next warm() opens it
+    write_video(path)
+    camera.warm()
+    assert camera.wait(timeout=10)
+    assert camera.error is None
+    ok, frame = camera.read()
+    assert ok and frame.shape == (48, 64, 3)
+
+    camera.release()
+    assert camera.read() == (False, None)
+    # A released camera stays closed
+    camera.warm()
+    assert not camera.wait(timeout=1)
+
+
+def test_retry_waits_for_the_interval(tmp_path):
+    path = str(tmp_path / "camera.avi")
+    camera = CameraManager(path, retry_interval=60)
+    assert not camera.wait(timeout=10)
+    first = camera.thread
+    write_video(path)
+    camera.warm()
+    assert camera.thread is first
+    assert not camera.wait(timeout=1)
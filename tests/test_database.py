@@ -0,0 +1,234 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+from database import AttendanceWriter, Database
+
+
+def make_db(tmp_path, users=3):
+    db = Database(str(tmp_path / "attendance.db"))
+    for i in range(1, users + 1):
+        db.register_user(f"User {i}", f"E{i:03d}", "College", "BCA", "A", b"template")
+    return db
+
+
+class FailingOnce:
+    """Wraps a Database so that its first insert_attendance() call fails"""
+
+    def __init__(self, db):
+        self.db = db
+        self.calls = 0
+
+    def insert_attendance(self, rows):
+        self.calls += 1
+        if self.calls == 1:
+            raise RuntimeError("disk I/O error")
+        return self.db.insert_attendance(rows)
+
+    def release(self):
+        self.db.release()
+
+
+def test_writer_survives_a_failed_batch(tmp_path, capsys):
+    db = make_db(tmp_path)
+    writer = AttendanceWriter(FailingOnce(db)).start()
+    when = datetime(2024, 3, 4, 9, 30)
+
+    writer.submit(1, when)
+    writer.flush()
+    assert writer.stats()["failed"] == 1
+    assert writer.stats()["last_error"] == "Could not write 1 attendance events: disk I/O error"
+    # Left to the caller to show; nothing is printed from the writer thread
+    assert capsys.readouterr().out == ""
+
+    # Events after the failure are still written and flush() still returns
+    writer.submit(2, when)
+    writer.submit(3, when)
+    writer.flush()
+    writer.stop()
+    assert writer.stats()["written"] == 2
+    assert sorted(row[0] for row in db.conn.execute("SELECT user_id FROM attendance")) == [2, 3]
+    db.close()
+
+
+def test_nested_transaction_joins_the_outer_one(tmp_path):
+    db = make_db(tmp_path)
+    with pytest.raises(RuntimeError):
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO attendance (user_id, date, time) VALUES (1, '2024-03-04', '09:00:00')")
+            with db.transaction() as inner:
+                inner.execute("INSERT INTO attendance (user_id, date, time) VALUES (2, '2024-03-04', '09:00:00')")
+            raise RuntimeError("abort")
+    # The outer rollback undoes the inner block too
+    assert db.conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0] == 0
+
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO attendance (user_id, date, time) VALUES (1, '2024-03-04', '09:00:00')")
+    assert not db.conn.in_transaction
+    db.close()
+
+
+def test_transaction_does_not_adopt_a_raw_uncommitted_write(tmp_path):
+    db = make_db(tmp_path)
+    db.conn.execute("INSERT INTO attendance (user_id, date, time) VALUES (1, '2024-03-04', '09:00:00')")
+    with pytest.raises(sqlite3.OperationalError):
+        with db.transaction():
+            pass
+    db.conn.rollback()
+
+    # The depth counter was restored, so the next block starts its own transaction
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO attendance (user_id, date, time) VALUES (2, '2024-03-04', '09:00:00')")
+    assert [row[0] for row in db.conn.execute("SELECT user_id FROM attendance")] == [2]
+    db.close()
+
+
+def test_attendance_pages(tmp_path):
+    db = make_db(tmp_path)
+    # Every user is marked on the same days, mostly at the same time. A user has
+    # one record per day, so (date, time) orders their records strictly.
+    days = [f"2024-{month:02d}-{day:02d}" for month in (1, 2) for day in range(10, 23)]
+    db.insert_attendance([(user_id, day, "08:55:00" if i % 7 == 0 else "09:00:00")
+                          for user_id in (1, 2, 3) for i, day in enumerate(days)])
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE attendance SET status = 'Absent' WHERE user_id = 1 AND date LIKE '2024-02-1%'")
+
+    pages, after = [], None
+    while True:
+        page = db.get_attendance_page(1, after, limit=10)
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1][:2]
+    assert [len(page) for page in pages] == [10, 10, 6]
+    # Newest first, each record exactly once, and only this user's
+    rows = [row for page in pages for row in page]
+    assert rows == [row[5:] for row in db.get_attendance(1)]
+    assert [date for date, _, _ in rows] == sorted(days, reverse=True)
+
+    # A page boundary between two days: the next page starts at the older one
+    assert db.get_attendance_page(1, ("2024-01-15", "09:00:00"), limit=2) == [
+        ("2024-01-14", "09:00:00", "Present"), ("2024-01-13", "09:00:00", "Present")]
+    assert db.get_attendance_page(1, ("2024-01-10", "08:55:00")) == []
+
+    assert db.get_attendance_summary(1) == (26, 16)
+    assert db.get_attendance_summary(2) == (26, 26)
+    assert db.get_attendance_summary(99) == (0, 0)
+    db.close()
+
+
+def rollups_from_attendance(db):
+    """The rollup tables as they should be, computed straight from attendance"""
+    daily = db.conn.execute('''
+                            SELECT a.date, u.college, u.class, u.section, COUNT(*)
+                            FROM attendance a
+                                     JOIN users u ON a.user_id = u.id
+                            WHERE a.status = 'Present'
+                            GROUP BY 1, 2, 3, 4
+                            ''').fetchall()
+    monthly = db.conn.execute('''
+                              SELECT substr(date, 1, 7), user_id, COUNT(*)
+                              FROM attendance
+                              WHERE status = 'Present'
+                              GROUP BY 1, 2
+                              ''').fetchall()
+    return sorted(daily), sorted(monthly)
+
+
+def stored_rollups(db):
+    # Counts decremented to zero by deletes stay behind as rows; they mean nothing is present
+    daily = db.conn.execute('SELECT * FROM attendance_daily WHERE present > 0').fetchall()
+    monthly = db.conn.execute('SELECT * FROM attendance_monthly WHERE present > 0').fetchall()
+    return sorted(daily), sorted(monthly)
+
+
+def test_rollups_follow_attendance_writes(tmp_path):
+    db = make_db(tmp_path, users=6)
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET class = 'BSc' WHERE id > 3")
+
+    db.insert_attendance([(user_id, f"2024-{month:02d}-{day:02d}", "09:00:00")
+                          for user_id in range(1, 7) for month in (1, 2) for day in range(1, 1 + user_id)])
+    db.mark_attendance(1, "2024-02-20 09:00:00")
+    # Duplicates are skipped without touching the counts
+    db.insert_attendance([(1, "2024-01-01", "10:00:00"), (4, "2024-02-02", "10:00:00")])
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO attendance (user_id, date, time, status) "
+                       "VALUES (2, '2024-02-25', '09:00:00', 'Absent')")
+        cursor.execute("DELETE FROM attendance WHERE user_id = 5 AND date >= '2024-02-03'")
+
+    expected = rollups_from_attendance(db)
+    assert stored_rollups(db) == expected
+    assert ("2024-02-01", "College", "BSc", "A", 3) in expected[0]
+    assert ("2024-02", 1, 2) in expected[1]
+
+    report = {row[1]: row for row in db.get_group_report("2024-01-01", "2024-01-31")}
+    assert report["BCA"][3:6] == (3, 6, 6)
+    assert report["BSc"][3:6] == (3, 6, 15)
+
+    db.rebuild_rollups()
+    assert stored_rollups(db) == expected
+    db.close()
+
+
+def test_rollups_follow_edits_in_place(tmp_path):
+    db = make_db(tmp_path, users=4)
+    db.insert_attendance([(user_id, f"2024-03-{day:02d}", "09:00:00")
+                          for user_id in range(1, 5) for day in range(1, 6)])
+
+    # Students move class after their attendance was recorded
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET class = 'BSc', section = 'B' WHERE id IN (1, 2)")
+        cursor.execute("UPDATE users SET name = 'Renamed' WHERE id = 3")
+    assert stored_rollups(db) == rollups_from_attendance(db)
+    assert ("2024-03-01", "College", "BSc", "B", 2) in stored_rollups(db)[0]
+
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE attendance SET status = 'Absent' WHERE user_id = 1 AND date <= '2024-03-02'")
+        cursor.execute("UPDATE attendance SET status = 'Present' WHERE user_id = 1 AND date = '2024-03-01'")
+        cursor.execute("UPDATE attendance SET date = '2024-04-01' WHERE user_id = 3 AND date = '2024-03-05'")
+        # A record moved to another user in another class
+        cursor.execute("UPDATE attendance SET user_id = 3 WHERE user_id = 2 AND date = '2024-03-05'")
+    assert stored_rollups(db) == rollups_from_attendance(db)
+
+    # Later deletes take the count from the user's current group
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE users SET class = 'BCA', section = 'A' WHERE id = 1")
+        cursor.execute("DELETE FROM attendance WHERE user_id IN (1, 2) AND date = '2024-03-03'")
+    assert stored_rollups(db) == rollups_from_attendance(db)
+    db.close()
+
+
+def test_rebuild_rollups_repairs_drift(tmp_path):
+    db = make_db(tmp_path)
+    db.insert_attendance([(user_id, "2024-03-04", "09:00:00") for user_id in (1, 2, 3)])
+    expected = rollups_from_attendance(db)
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE attendance_daily SET present = 99")
+        cursor.execute("DELETE FROM attendance_monthly WHERE user_id = 2")
+    assert stored_rollups(db) != expected
+
+    db.rebuild_rollups()
+    assert stored_rollups(db) == expected
+    assert db.get_monthly_report("2024-03")[1][5:7] == (1, 1)
+    db.close()
+
+
+def test_presence_follows_committed_attendance_only(tmp_path):
+    db = make_db(tmp_path)
+    today = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    # Marked inside a transaction that is rolled back: not present
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            assert db.mark_attendance(1, today)[0]
+            db.insert_attendance([(2, today[:10], today[11:])])
+            assert 1 not in db.presence and 2 not in db.presence
+            raise RuntimeError("abort")
+    assert 1 not in db.presence and 2 not in db.presence
+
+    assert db.mark_attendance(1, today) == (True, "Attendance marked successfully")
+    assert 1 in db.presence
+    assert db.mark_attendance(1, today) == (False, "Attendance already marked for today")
+    db.close()
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+import pytest
+
+from detection import create_detector, load_detector_options, save_detector_options
+
+
+@pytest.fixture(scope="module")
+def yunet_model(tmp_path_factory):
+    """A stand-in for the YuNet model that scores every anchor by the mean brightness under it.
+
+    Boxes are 4 strides wide, so a bright patch at the frame's edge gives
+    boxes that reach past it.
+    """
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper, numpy_helper
+
+    nodes, initializers, outputs = [], [], []
+    for stride in (8, 16, 32):
+        nodes.append(helper.make_node("AveragePool", ["input"], [f"pool{stride}"],
+                                      kernel_shape=[stride, stride], strides=[stride, stride]))
+    for head, channels in (("cls", 1), ("obj", 1), ("bbox", 4), ("kps", 10)):
+        for stride in (8, 16, 32):
+            weight = np.zeros((channels, 3, 1, 1), dtype=np.float32)
+            bias = np.zeros(channels, dtype=np.float32)
+            if head in ("cls", "obj"):
+                weight[:] = 1 / 765.0
+            if head == "bbox":
+                bias[2:] = np.log(4)
+            name = f"{head}{stride}"
+            initializers += [numpy_helper.from_array(weight, f"w_{name}"),
+                             numpy_helper.from_array(bias, f"b_{name}"),
+                             numpy_helper.from_array(np.array([1, -1, channels], dtype=np.int64), f"shape_{name}")]
+            nodes += [helper.make_node("Conv", [f"pool{stride}", f"w_{name}", f"b_{name}"], [f"conv_{name}"]),
+                      helper.make_node("Transpose", [f"conv_{name}"], [f"nhwc_{name}"], perm=[0, 2, 3, 1]),
+                      helper.make_node("Reshape", [f"nhwc_{name}", f"shape_{name}"], [f"{head}_{stride}"])]
+            outputs.append(helper.make_tensor_value_info(f"{head}_{stride}", TensorProto.FLOAT, [1, "n", channels]))
+    graph = helper.make_graph(nodes, "yunet", [helper.make_tensor_value_info("input", TensorProto.FLOAT,
+                                                                             [1, 3, "h", "w"])],
+                              outputs, initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 11)])
+    model.ir_version = 7
+    path = str(tmp_path_factory.mktemp("models") / "yunet.onnx")
+    onnx.save(model, path)
+    return path
+
+
+def corner_patch():
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    gray[:64, 256:] = 255
+    return gray
+
+
+def test_yunet_boxes_are_clipped_to_the_frame(yunet_model):
+    detect = create_detector("yunet", model_path=yunet_model, score_threshold=0.5)
+    boxes = np.asarray(detect(corner_patch())).reshape(-1, 4)
+    assert len(boxes)
+    x, y, w, h = boxes.T
+    assert (x >= 0).all() and (y >= 0).all()
+    assert (x + w <= 320).all() and (y + h <= 240).all()
+    assert (w > 0).all() and (h > 0).all()
+    # Boxes centred on the edge lose the part outside it
+    assert ((x + w == 320) & (w < 32)).any()
+
+    assert len(detect(np.zeros((240, 320), dtype=np.uint8))) == 0
+
+
+def test_yunet_size_filter(yunet_model):
+    gray = corner_patch()
+    boxes = np.asarray(create_detector("yunet", model_path=yunet_model, score_threshold=0.5,
+                                       min_size=(60, 60))(gray)).reshape(-1, 4)
+    assert len(boxes) and (boxes[:, 2:] >= 60).all()
+
+    boxes = np.asarray(create_detector("yunet", model_path=yunet_model, score_threshold=0.5,
+                                       max_size=(40, 40))(gray)).reshape(-1, 4)
+    assert len(boxes) and (boxes[:, 2:] <= 40).all()
+
+    # Sizes are in frame pixels when the detector runs on a downscaled frame
+    boxes = np.asarray(create_detector("yunet", model_path=yunet_model, score_threshold=0.5, scale=0.5,
+                                       min_size=(60, 60))(gray)).reshape(-1, 4)
+    assert len(boxes) and (boxes[:, 2:] >= 60).all()
+
+
+def test_overriding_the_backend_drops_its_saved_options(tmp_path):
+    path = str(tmp_path / "detector.json")
+    save_detector_options({"backend": "yunet", "model_path": "models/yunet.onnx", "score_threshold": 0.7,
+                           "scale": 0.5, "min_size": [40, 40]}, path=path)
+
+    assert load_detector_options(path)["model_path"] == "models/yunet.onnx"
+    assert load_detector_options(path, backend="yunet", score_threshold=None)["score_threshold"] == 0.7
+    options = load_detector_options(path, backend="haar", min_neighbors=3)
+    assert options == {"backend": "haar", "scale": 0.5, "min_size": [40, 40], "min_neighbors": 3}
+    create_detector(**options)
+
+    assert load_detector_options(str(tmp_path / "missing.json"), backend="lbp") == {"backend": "lbp"}
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"calibration": {}}), json.dumps([1, 2]),
+                                     json.dumps({"options": "haar"})])
+def test_malformed_settings_are_reported(tmp_path, content):
+    path = tmp_path / "detector.json"
+    path.write_text(content)
+    with pytest.raises(ValueError, match="calibrate.py"):
+        load_detector_options(str(path))
@@ -0,0 +1,97 @@
+import csv
+
+import pytest
+
+import export
+from database import Database
+from export import EXPORT_HEADER, AttendanceExporter, ExportCancelled, export_attendance
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "attendance.db"))
+    for i in range(1, 4):
+        db.register_user(f"User {i}", f"E{i:03d}", "College", "BCA", "A", b"template")
+    db.insert_attendance([(user_id, f"2024-03-{day:02d}", "09:00:00")
+                          for user_id in range(1, 4) for day in range(1, 11)])
+    yield db
+    db.close()
+
+
+def test_csv_export(db, tmp_path):
+    path = str(tmp_path / "attendance.csv")
+    assert export_attendance(db, path, batch_size=7) == 30
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert tuple(rows[0]) == EXPORT_HEADER
+    assert len(rows) == 31
+    assert not (tmp_path / "attendance.csv.part").exists()
+
+
+def test_xlsx_export_continues_on_new_sheets(db, tmp_path, monkeypatch):
+    openpyxl = pytest.importorskip("openpyxl")
+    monkeypatch.setattr(export, "XLSX_SHEET_ROWS", 12)
+    path = str(tmp_path / "attendance.xlsx")
+    assert export_attendance(db, path, batch_size=7) == 30
+
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    assert workbook.sheetnames == ["Attendance", "Attendance (2)", "Attendance (3)"]
+    sheets = [list(workbook[name].values) for name in workbook.sheetnames]
+    workbook.close()
+    assert [len(rows) for rows in sheets] == [13, 13, 7]
+    assert all(rows[0] == EXPORT_HEADER for rows in sheets)
+    # No row is lost or repeated at the boundaries
+    enrollments_and_dates = [row[1:6:4] for rows in sheets for row in rows[1:]]
+    assert len(set(enrollments_and_dates)) == 30
+
+
+def test_empty_xlsx_export_has_a_header(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    db = Database(str(tmp_path / "attendance.db"))
+    path = str(tmp_path / "attendance.xlsx")
+    assert export_attendance(db, path) == 0
+    db.close()
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    assert list(workbook["Attendance"].values) == [EXPORT_HEADER]
+    workbook.close()
+
+
+@pytest.mark.parametrize("name", ["attendance.csv", "attendance.xlsx"])
+def test_failed_export_leaves_no_partial_file(db, tmp_path, name):
+    if name.endswith(".xlsx"):
+        pytest.importorskip("openpyxl")
+    path = tmp_path / name
+    path.write_text("previous export\n")
+
+    def fail(written, total):
+        if written > 10:
+            raise OSError("No space left on device")
+
+    with pytest.raises(OSError):
+        export_attendance(db, str(path), progress=fail, batch_size=7)
+    assert not (tmp_path / (name + ".part")).exists()
+    # The earlier file at the target is left as it was
+    assert path.read_text() == "previous export\n"
+
+
+@pytest.mark.parametrize("name", ["attendance.csv", "attendance.xlsx"])
+def test_cancelled_export_leaves_no_file(db, tmp_path, name):
+    if name.endswith(".xlsx"):
+        pytest.importorskip("openpyxl")
+    batches = []
+
+    def cancelled():
+        batches.append(1)
+        return len(batches) > 2
+
+    with pytest.raises(ExportCancelled):
+        export_attendance(db, str(tmp_path / name), cancelled=cancelled, batch_size=7)
+    assert list(tmp_path.glob(name + "*")) == []
+
+
+def test_exporter_reports_the_error(db, tmp_path):
+    exporter = AttendanceExporter(db, str(tmp_path / "missing" / "attendance.csv")).start()
+    exporter.thread.join()
+    assert exporter.done
+    assert isinstance(exporter.error, OSError)
+    assert list(tmp_path.glob("**/*.part")) == []
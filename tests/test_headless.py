@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+
+import headless
+from database import Database
+from headless import run_headless
+from metrics import METRICS
+from recognition import encode_vector, extract_face
+
+FACE_BOX = (60, 40, 120, 120)
+
+
+def face_frame():
+    """A dark 240x320 frame with one symmetric, sharp face at FACE_BOX"""
+    blocks = np.random.default_rng(0).integers(130, 210, (10, 5), dtype=np.uint8)
+    half = cv2.resize(blocks, (60, 120), interpolation=cv2.INTER_NEAREST)
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    x, y, w, h = FACE_BOX
+    gray[y:y + h, x:x + w] = np.hstack([half, half[:, ::-1]])
+    return gray
+
+
+def detect_face(gray):
+    """Stand-in face detector: the bounding box of everything brighter than the background"""
+    points = cv2.findNonZero((gray > 0).astype(np.uint8))
+    return [] if points is None else [cv2.boundingRect(points)]
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in yielding a few copies of a BGR frame"""
+
+    def __init__(self, source):
+        self.frames = [cv2.cvtColor(face_frame(), cv2.COLOR_GRAY2BGR)] * 12
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def read(self):
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop()
+
+    def release(self):
+        self.released = True
+
+
+class ClosingDatabase(Database):
+    closed = 0
+
+    def close(self):
+        ClosingDatabase.closed += 1
+        super().close()
+
+
+def test_metric_sources_are_removed(tmp_path, monkeypatch):
+    # Index and detector settings are read from and written to data/
+    monkeypatch.chdir(tmp_path)
+    db = Database(str(tmp_path / "attendance.db"))
+    os.makedirs("frames")
+    for i in range(3):
+        cv2.imwrite(os.path.join("frames", f"{i}.png"), np.full((120, 160, 3), 90, dtype=np.uint8))
+
+    stats = run_headless("frames", db=db)
+    assert stats.frames == 3
+    assert not {"headless", "writer", "cache"} & set(METRICS.sources)
+
+    # Also when the run fails
+    with pytest.raises(IOError):
+        run_headless("missing.avi", db=db)
+    assert not {"headless", "writer", "cache"} & set(METRICS.sources)
+    db.close()
+
+
+def test_recognized_face_is_marked(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database()
+    user_id = db.register_user("User", "E001", "College", "BCA", "A", b"template",
+                               encode_vector(extract_face(face_frame(), FACE_BOX)))
+    db.close()
+    monkeypatch.setattr(headless.cv2, "VideoCapture", FakeCapture)
+    monkeypatch.setattr(headless, "create_detector", lambda **options: detect_face)
+    monkeypatch.setattr(headless, "Database", ClosingDatabase)
+    monkeypatch.setattr(ClosingDatabase, "closed", 0)
+
+    # The database is opened and closed by run_headless itself
+    stats = run_headless("0", detect_every=4)
+    assert (stats.frames, stats.recognized, stats.marked) == (12, 1, 1)
+    assert ClosingDatabase.closed == 1
+    assert os.path.exists(os.path.join("data", "face_index.npz"))
+
+    db = Database()
+    rows = db.get_attendance_page(user_id)
+    assert len(rows) == 1
+    assert (rows[0][0], rows[0][2]) == (datetime.now().strftime("%Y-%m-%d"), "Present")
+    db.close()
@@ -0,0 +1,87 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from matchers import EmbeddingMatcher, Matcher, PixelDiffMatcher, create_matcher
+from recognition import MATCH_THRESHOLD, TEMPLATE_SIZE
+
+SFACE_MODEL_PATH = os.path.join('models', 'face_recognition_sface_2021dec.onnx')
+
+
+def faces(seed, count):
+    return np.random.default_rng(seed).integers(0, 256, (count,) + TEMPLATE_SIZE, dtype=np.uint8)
+
+
+def test_matcher_without_every_method_cannot_be_built():
+    class NoDistances(Matcher):
+        def embed(self, faces):
+            return faces
+
+        def shortlist_descriptors(self, vectors):
+            return vectors
+
+    with pytest.raises(TypeError):
+        NoDistances()
+
+
+def test_pixel_matcher_scores_like_the_original_comparison():
+    probes, gallery = faces(0, 3), faces(1, 5)
+    gallery[2] = np.clip(probes[1].astype(np.int16) + 20, 0, 255)
+    matcher = create_matcher("pixel")
+    distances = matcher.distances(matcher.embed(probes), matcher.embed(gallery))
+    # What the app did before matchers: np.mean(cv2.absdiff(face, stored_template)) < 50
+    expected = np.array([[np.mean(cv2.absdiff(probe, template)) for template in gallery] for probe in probes])
+    assert np.allclose(distances, expected)
+    assert ((distances < matcher.threshold) == (expected < MATCH_THRESHOLD)).all()
+    assert (distances < matcher.threshold).sum() == 1
+
+
+@pytest.fixture(scope="module")
+def block_model(tmp_path_factory):
+    """A stand-in embedding network: the mean of each 28x28 block of each channel, 48 values"""
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    nodes = [helper.make_node("AveragePool", ["input"], ["pooled"], kernel_shape=[28, 28], strides=[28, 28]),
+             helper.make_node("Flatten", ["pooled"], ["embedding"], axis=1)]
+    graph = helper.make_graph(nodes, "blocks",
+                              [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["n", 3, 112, 112])],
+                              [helper.make_tensor_value_info("embedding", TensorProto.FLOAT, ["n", 48])])
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 11)])
+    model.ir_version = 7
+    path = str(tmp_path_factory.mktemp("models") / "blocks.onnx")
+    onnx.save(model, path)
+    return path
+
+
+def test_embedding_matcher_with_a_generated_model(block_model):
+    matcher = EmbeddingMatcher(block_model, batch_size=4)
+    assert matcher.name == "dnn:blocks"
+    assert matcher.dim == 48 and matcher.cache_vectors
+
+    crops = faces(2, 10)
+    vectors = matcher.embed(crops)
+    assert vectors.shape == (10, 48) and vectors.dtype == np.float32
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    # Batches give the same vectors as faces one at a time
+    assert np.allclose(vectors[7], matcher.embed(crops[7])[0], atol=1e-5)
+
+    distances = matcher.distances(vectors, vectors)
+    assert np.allclose(np.diag(distances), 0.0, atol=1e-5)
+    assert np.allclose(distances, 1.0 - vectors @ vectors.T)
+    assert matcher.embed(np.empty((0,) + TEMPLATE_SIZE, dtype=np.uint8)).shape == (0, 48)
+
+
+@pytest.mark.skipif(not os.path.exists(SFACE_MODEL_PATH), reason=f"{SFACE_MODEL_PATH} is not downloaded")
+def test_sface_matcher():
+    matcher = create_matcher("dnn", SFACE_MODEL_PATH)
+    assert matcher.dim == 128
+    crops = faces(3, 2)
+    vectors = matcher.embed(crops)
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    distances = matcher.distances(vectors, vectors)
+    assert np.allclose(np.diag(distances), 0.0, atol=1e-5)
+    assert (distances >= -1e-5).all() and (distances <= 2 + 1e-5).all()
+    assert matcher.threshold == pytest.approx(1 - 0.363)
@@ -0,0 +1,109 @@
+import threading
+
+import numpy as np
+import pytest
+
+import metrics
+from metrics import QUANTILES, Histogram, MetricsLog, MetricsRegistry
+
+
+def test_quantiles_of_known_samples():
+    histogram = Histogram(buckets=(1, 2, 3, 4))
+    assert histogram.quantile(0.5) == 0.0
+    for value in (0.5, 1.5, 1.5, 2.5):
+        histogram.observe(value)
+
+    # Linear inside the bucket holding the rank: 2 of 4 samples is halfway through (1, 2]
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.625) == pytest.approx(1.75)
+    # Never above the largest value seen
+    assert histogram.quantile(1.0) == 2.5
+
+    # Values on a bound belong to that bucket; values past the last one report the maximum
+    histogram.observe(2)
+    histogram.observe(10)
+    counts, count, total, largest = histogram.snapshot()
+    assert counts == [1, 3, 1, 0, 1]
+    assert (count, total, largest) == (6, 18.0, 10)
+    assert histogram.quantile(0.99) == 10
+
+
+def test_quantiles_are_within_a_bucket_of_the_true_ones():
+    samples = np.random.default_rng(0).lognormal(np.log(0.02), 0.8, 5000)
+    histogram = Histogram()
+    for value in samples:
+        histogram.observe(value)
+    for q in QUANTILES:
+        # Default buckets grow 1.5x each
+        assert abs(np.log(histogram.quantile(q) / np.quantile(samples, q))) < np.log(1.5)
+
+
+def test_render(monkeypatch):
+    monkeypatch.setattr(metrics.time, "time", lambda: 1000.0)
+    registry = MetricsRegistry()
+    histogram = registry.histograms["detect"] = Histogram(buckets=(0.001, 0.01, 0.1))
+    for value in (0.0005, 0.005, 0.005, 0.01, 0.5):
+        histogram.observe(value)
+    registry.add_source("writer", lambda: {"pending": 3, "written": 120, "state": "running"})
+    registry.add_source("cache", lambda: {"user_info": {"hits": 7, "hit_rate": 0.875}, "login": {"hits": 0}},
+                        label="cache")
+    registry.add_source("broken", lambda: 1 / 0)
+    monkeypatch.setattr(metrics.time, "time", lambda: 1012.5)
+
+    assert registry.render() == '''\
+# HELP attendance_stage_seconds Latency of each recognition, display and database stage
+# TYPE attendance_stage_seconds histogram
+attendance_stage_seconds_bucket{stage="detect",le="0.001"} 1
+attendance_stage_seconds_bucket{stage="detect",le="0.01"} 4
+attendance_stage_seconds_bucket{stage="detect",le="0.1"} 4
+attendance_stage_seconds_bucket{stage="detect",le="+Inf"} 5
+attendance_stage_seconds_sum{stage="detect"} 0.5205
+attendance_stage_seconds_count{stage="detect"} 5
+# HELP attendance_stage_seconds_quantile Estimated latency quantiles of each stage
+# TYPE attendance_stage_seconds_quantile gauge
+attendance_stage_seconds_quantile{stage="detect",quantile="0.5"} 0.0055
+attendance_stage_seconds_quantile{stage="detect",quantile="0.95"} 0.5
+attendance_stage_seconds_quantile{stage="detect",quantile="0.99"} 0.5
+attendance_writer_pending 3
+attendance_writer_written 120
+attendance_cache_hits{cache="user_info"} 7
+attendance_cache_hit_rate{cache="user_info"} 0.875
+attendance_cache_hits{cache="login"} 0
+attendance_uptime_seconds 12.500
+'''
+
+
+def test_timers_record_on_error():
+    registry = MetricsRegistry()
+
+    @registry.timed("db.lookup")
+    def lookup():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        lookup()
+    with pytest.raises(ValueError):
+        with registry.timer("detect"):
+            raise ValueError("bad frame")
+    assert registry.histograms["db.lookup"].count == 1
+    assert registry.histograms["detect"].count == 1
+
+
+def test_metrics_log_writes_the_summary():
+    registry = MetricsRegistry()
+    registry.observe("detect", 0.004)
+    lines = []
+    written = threading.Event()
+
+    def write(text):
+        lines.append(text)
+        written.set()
+
+    log = MetricsLog(0.01, registry, write).start()
+    assert written.wait(5)
+    log.stop()
+    log.thread.join(5)
+    assert not log.thread.is_alive()
+    assert lines[0].splitlines()[1].startswith("detect ")
+    assert "4.00ms" in lines[0]
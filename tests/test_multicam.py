@@ -0,0 +1,31 @@
+import os
+
+import cv2
+import numpy as np
+
+from database import Database
+from multicam import MultiCameraServer
+
+
+def write_clip(directory, frames, rng):
+    """An image directory of `frames` faceless 640x480 frames"""
+    os.makedirs(directory)
+    for i in range(frames):
+        noise = rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)
+        cv2.imwrite(os.path.join(directory, f"{i:03d}.png"), cv2.GaussianBlur(noise, (15, 15), 0))
+    return directory
+
+
+def test_worker_that_finishes_early_is_not_a_crash(tmp_path):
+    # The short clip's worker exits while the long clip is still being processed
+    rng = np.random.default_rng(0)
+    short = write_clip(str(tmp_path / "short"), 2, rng)
+    long = write_clip(str(tmp_path / "long"), 60, rng)
+    db_path = str(tmp_path / "attendance.db")
+    Database(db_path).close()
+
+    server = MultiCameraServer([short, long], workers=2, db_path=db_path, report_interval=60)
+    totals = server.run()
+
+    assert totals["frames"] == 62
+    assert totals["captured"] == 62
@@ -0,0 +1,47 @@
+import numpy as np
+
+from pipeline import FrameRenderer
+
+
+class Photo:
+    """Stand-in for an ImageTk.PhotoImage that keeps what was pasted into it"""
+
+    def __init__(self, during_paste=None):
+        self.pasted = []
+        self.during_paste = during_paste
+
+    def paste(self, image):
+        if self.during_paste:
+            self.during_paste()
+        self.pasted.append(np.asarray(image)[..., :3].copy())
+
+
+def solid(value):
+    return np.full((120, 160, 3), value, dtype=np.uint8)
+
+
+def test_newest_frame_replaces_one_not_yet_displayed():
+    renderer = FrameRenderer((80, 60))
+    photo = Photo()
+    assert not renderer.paste_into(photo)
+
+    for value in (10, 20, 30):
+        renderer.render(solid(value), [])
+    assert renderer.paste_into(photo)
+    assert (photo.pasted[-1] == 30).all()
+    assert renderer.replaced == 2
+    # Nothing new since the last paste
+    assert not renderer.paste_into(photo)
+
+
+def test_render_never_writes_the_buffer_being_pasted():
+    renderer = FrameRenderer((80, 60))
+    renderer.render(solid(10), [])
+    # Frames keep arriving while the Tk thread is pasting
+    photo = Photo(during_paste=lambda: [renderer.render(solid(value), []) for value in (20, 30, 40)])
+
+    assert renderer.paste_into(photo)
+    assert (photo.pasted[0] == 10).all()
+    photo.during_paste = None
+    assert renderer.paste_into(photo)
+    assert (photo.pasted[1] == 40).all()
@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from presence import Cooldown, PresenceSet
+
+
+class Clock:
+    def __init__(self, when):
+        self.now = when.timestamp()
+
+    def __call__(self):
+        return self.now
+
+
+def test_presence_starts_each_day_from_the_database():
+    loaded = {"2024-03-04": [3, 17], "2024-03-05": [5]}
+    clock = Clock(datetime(2024, 3, 4, 23, 59))
+    presence = PresenceSet(lambda day: loaded.get(day, []), clock)
+
+    assert 3 in presence and 17 in presence
+    assert 4 not in presence
+    presence.add(4)
+    presence.add(1000)
+    assert 4 in presence and 1000 in presence
+    assert len(presence) == 4
+    assert presence.contains(3, "2024-03-04")
+    # Only today is tracked
+    assert not presence.contains(3, "2024-03-03")
+
+    clock.now = datetime(2024, 3, 5, 0, 0, 1).timestamp()
+    assert presence.today() == "2024-03-05"
+    assert 3 not in presence and 4 not in presence
+    assert 5 in presence
+    assert presence.stats() == {"present": 1}
+
+
+def test_update_after_midnight_drops_yesterdays_marks():
+    clock = Clock(datetime(2024, 3, 4, 23, 59, 59))
+    presence = PresenceSet(clock=clock)
+    presence.today()
+
+    # A batch written just before midnight is recorded just after it
+    clock.now = datetime(2024, 3, 5, 0, 0, 1).timestamp()
+    presence.update([(1, "2024-03-04"), (2, "2024-03-05")])
+    assert 1 not in presence
+    assert 2 in presence
+
+
+def test_cooldown():
+    clock = Clock(datetime(2024, 3, 4, 9, 0))
+    cooldown = Cooldown(60, clock)
+    assert cooldown.ready(1)
+    assert not cooldown.ready(1)
+    assert cooldown.ready(2)
+    clock.now += 61
+    assert cooldown.ready(1)
@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+
+from quality import BestFaceWindow, QualityGate
+
+
+class Quality:
+    """Stand-in for FaceQuality: scores, pass flags and rejection reasons"""
+
+    def __init__(self, scores, passed):
+        self.score = np.asarray(scores, dtype=np.float32)
+        self.passed = np.asarray(passed, dtype=bool)
+
+    def __len__(self):
+        return len(self.score)
+
+    def reason(self, i):
+        return "too blurry"
+
+
+def face(seed=0, low=60, span=140):
+    """A symmetric, sharp crop of 10x10 blocks with grey levels in [low, low + span)"""
+    blocks = np.random.default_rng(seed).integers(low, low + span, (10, 5), dtype=np.uint8)
+    half = cv2.resize(blocks, (50, 100), interpolation=cv2.INTER_NEAREST)
+    return np.hstack([half, half[:, ::-1]])
+
+
+def blurred(crop, sigma):
+    return cv2.GaussianBlur(crop, (0, 0), sigma)
+
+
+def crops(*values):
+    return np.stack([np.full((100, 100), value, dtype=np.uint8) for value in values])
+
+
+def test_best_crop_of_each_person_in_view():
+    window = BestFaceWindow(window=1.0)
+    user, classmate = (300, 100, 80, 80), (20, 40, 200, 200)
+    # The classmate is nearer the camera and scores higher on every frame
+    window.add(crops(1, 2), [user, classmate], Quality([0.5, 0.9], [True, True]), now=10.0)
+    window.add(crops(3, 4), [(304, 102, 80, 80), (24, 40, 200, 200)], Quality([0.6, 0.95], [True, True]), now=10.1)
+    window.add(crops(5, 6), [(302, 98, 80, 80), (20, 44, 200, 200)], Quality([0.1, 0.3], [False, True]), now=10.2)
+
+    assert window.best(now=10.3)[0][0, 0] == 4
+    faces = window.faces(now=10.3)
+    assert [face[0, 0] for face, _, _ in faces] == [4, 3]
+    assert faces[1][1] == (304, 102, 80, 80)
+
+    # Crops older than the window are forgotten
+    assert [face[0, 0] for face, _, _ in window.faces(now=11.15)] == [6]
+    assert window.faces(now=20.0) == []
+
+
+def test_rejection_is_kept_when_nothing_passes():
+    window = BestFaceWindow()
+    window.add(crops(1), [(0, 0, 80, 80)], Quality([0.2], [False]), now=1.0)
+    assert window.rejection == "too blurry"
+    assert window.best(now=1.1) is None
+    assert window.faces(now=1.1) == []
+
+
+def test_gate_rejections():
+    sharp = face()
+    samples = [
+        (None, sharp),
+        ("too blurry", blurred(sharp, 2.0)),
+        # Motion blur along one axis leaves the edges across it sharp, but still fails
+        ("too blurry", cv2.blur(sharp, (15, 1))),
+        ("too dark", face(low=5, span=40)),
+        ("too bright", face(low=220, span=35)),
+        # Sharp fine detail, but only 20 grey levels apart
+        ("low contrast", (120 + 20 * (np.indices((100, 100)).sum(axis=0) % 2)).astype(np.uint8)),
+        ("not facing the camera", np.hstack([sharp[:, :50], face(1)[:, :50]])),
+    ]
+    quality = QualityGate().assess(np.stack([crop for _, crop in samples]), [(0, 0, 120, 120)] * len(samples))
+    assert [quality.reason(i) for i in range(len(quality))] == [reason for reason, _ in samples]
+    assert list(quality.passed) == [True] + [False] * (len(samples) - 1)
+
+    small = QualityGate().assess(sharp[None], [(10, 10, 50, 70)])
+    assert not small.passed[0] and small.reason(0) == "too small"
+
+
+def test_gate_scores_sharper_and_larger_faces_higher():
+    sharp = face()
+    quality = QualityGate().assess(np.stack([sharp, blurred(sharp, 1.2), sharp, sharp, blurred(sharp, 2.0)]),
+                                   [(0, 0, 120, 120), (0, 0, 120, 120), (0, 0, 80, 90), (0, 0, 60, 60),
+                                    (0, 0, 120, 120)])
+    assert list(quality.passed) == [True, True, True, True, False]
+    assert list(np.argsort(-quality.score)) == [0, 2, 1, 3, 4]
+    assert quality.score[0] == 1.0
+    # Sharpness and size stop counting once they are good enough
+    good_enough = QualityGate().assess(np.stack([sharp, blurred(sharp, 0.8)]), [(0, 0, 200, 200)] * 2)
+    assert list(good_enough.score) == [1.0, 1.0]
+
+
+def test_window_reports_why_the_newest_faces_were_rejected():
+    gate, window = QualityGate(), BestFaceWindow()
+    frame = np.hstack([face(low=5, span=40), blurred(face(), 2.0)])
+    faces, quality = gate.crop(frame, [(0, 0, 100, 100), (100, 0, 100, 100)])
+    window.add(faces, [(0, 0, 100, 100), (100, 0, 100, 100)], quality, now=1.0)
+    # The first rejected face's reason
+    assert window.rejection == "too dark"
+    assert window.best(now=1.1) is None
+
+    faces, quality = gate.crop(np.hstack([face(), frame]), [(0, 0, 100, 100), (100, 0, 100, 100)])
+    window.add(faces, [(0, 0, 100, 100), (100, 0, 100, 100)], quality, now=1.2)
+    assert window.rejection is None
+    assert window.best(now=1.3)[2] == 1.0
@@ -0,0 +1,162 @@
+import sqlite3
+
+import cv2
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex
+from database import MIGRATIONS, Database
+from recognition import (MATCH_THRESHOLD, TEMPLATE_LENGTH, TEMPLATE_SIZE, VECTOR_HEADER, FaceIdentifier,
+                         decode_template, decode_vector, encode_vector, load_template)
+
+
+def smooth_faces(rng, count):
+    """Distinct smooth 100x100 crops, like faces under the same camera"""
+    grids = rng.integers(0, 256, (count, 5, 5)).astype(np.float32)
+    return np.stack([cv2.resize(grid, TEMPLATE_SIZE, interpolation=cv2.INTER_CUBIC) for grid in grids]
+                    ).clip(0, 255).astype(np.uint8)
+
+
+def noisy(rng, faces, sigma=8):
+    return (faces + rng.normal(0, sigma, faces.shape)).clip(0, 255).astype(np.uint8)
+
+
+def enroll(db, templates, start=0):
+    """Register one user per template; returns their ids"""
+    return [db.register_user(f"User {i}", f"E{i:05d}", "College", "BCA", "A", b"template",
+                             encode_vector(template.reshape(-1)))
+            for i, template in enumerate(templates, start)]
+
+
+def brute_force(templates, user_ids, probe, top_k=1):
+    """(user_id, distance) of the top_k users by mean absolute pixel difference over everyone"""
+    distances = np.abs(templates.reshape(-1, TEMPLATE_LENGTH).astype(np.int16) - probe.reshape(-1)).mean(axis=1)
+    return [(user_ids[i], float(distances[i])) for i in np.argsort(distances, kind="stable")[:top_k]]
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = Database(str(tmp_path / "attendance.db"))
+    yield db
+    db.close()
+
+
+def test_identify_agrees_with_a_full_scan(db):
+    rng = np.random.default_rng(0)
+    templates = smooth_faces(rng, 100)
+    user_ids = enroll(db, templates)
+    identifier = FaceIdentifier(db)
+    assert not identifier.index.trained
+
+    probes = noisy(rng, templates[::5])
+    for probe, results in zip(probes, identifier.identify_batch(probes, top_k=3)):
+        expected = brute_force(templates, user_ids, probe, top_k=3)
+        assert [user_id for user_id, _ in results] == [user_id for user_id, _ in expected]
+        assert np.allclose([d for _, d in results], [d for _, d in expected])
+
+    assert identifier.best_match(probes[0])[0] == user_ids[0]
+    # Someone who isn't enrolled is not matched to anyone
+    assert identifier.best_match(np.full(TEMPLATE_SIZE, 255, dtype=np.uint8)) is None
+
+
+def test_match_outside_the_shortlist_is_missed(db):
+    # The probe is a fine checkerboard; the user's template has the same pattern
+    # but is brighter, so only the pixel distance sees them as close. Flat decoys
+    # with the probe's average brightness fill the coarse shortlist.
+    checkers = (np.indices(TEMPLATE_SIZE).sum(axis=0) % 2).astype(np.uint8)
+    probe = checkers * 255
+    user = checkers * 215 + 40
+    decoys = [np.full(TEMPLATE_SIZE, 127, dtype=np.uint8)] * 5
+    user_ids = enroll(db, [user] + decoys)
+    assert brute_force(np.stack([user] + decoys), user_ids, probe)[0] == (user_ids[0], 20.0)
+
+    identifier = FaceIdentifier(db, shortlist=3)
+    results = identifier.identify(probe, top_k=3)
+    assert user_ids[0] not in [user_id for user_id, _ in results]
+    # The decoys are too far to be accepted instead
+    assert identifier.best_match(probe) is None
+
+    identifier = FaceIdentifier(db, shortlist=len(user_ids))
+    assert identifier.best_match(probe) == (user_ids[0], 20.0)
+
+
+def test_trained_index_agrees_with_a_full_scan(db):
+    rng = np.random.default_rng(2)
+    templates = smooth_faces(rng, 400)
+    user_ids = enroll(db, templates)
+    identifier = FaceIdentifier(db)
+    # A small index trains at 320 users instead of the default 10,240
+    n = identifier.count
+    identifier.index = IVFIndex(identifier.coarse.shape[1], n_lists=8, nprobe=2)
+    identifier.index.add(identifier.user_ids[:n], identifier.coarse[:n])
+    assert identifier.index.trained
+
+    probes = noisy(rng, templates[::8])
+    matches = identifier.best_matches(probes)
+    assert [match[0] for match in matches] == [brute_force(templates, user_ids, probe)[0][0] for probe in probes]
+    assert all(distance < MATCH_THRESHOLD for _, distance in matches)
+
+    # Users enrolled after training go straight into the index
+    newcomer = smooth_faces(np.random.default_rng(3), 1)
+    user_id, = enroll(db, newcomer, start=400)
+    assert identifier.index.count == 401
+    assert identifier.best_match(noisy(rng, newcomer)[0])[0] == user_id
+
+
+@pytest.mark.parametrize("vector", [(np.arange(TEMPLATE_LENGTH) % 256).astype(np.uint8),
+                                    np.linspace(-1, 1, 128, dtype=np.float32)])
+def test_vector_round_trip(vector):
+    # Templates are stored flattened whatever their shape
+    blob = encode_vector(vector.reshape(2, -1))
+    assert len(blob) == VECTOR_HEADER.size + vector.nbytes
+    decoded = decode_vector(blob)
+    assert decoded.dtype == vector.dtype
+    assert np.array_equal(decoded, vector)
+    # A view onto the blob, not a copy
+    assert not decoded.flags.writeable
+
+
+@pytest.mark.parametrize("blob", [
+    b"",
+    b"FVEC\x01",
+    b"JFIF\x01\x01\x00\x00\x04\x00\x00\x00abcd",
+    b"FVEC\x02\x01\x00\x00\x04\x00\x00\x00abcd",
+    b"FVEC\x01\x07\x00\x00\x04\x00\x00\x00abcd",
+    # Header promises more than the payload holds
+    b"FVEC\x01\x01\x00\x00\x10\x00\x00\x00abcd",
+])
+def test_bad_vector_header_is_rejected(blob):
+    with pytest.raises(ValueError):
+        decode_vector(blob)
+
+
+def test_unsupported_vector_dtype_is_rejected():
+    with pytest.raises(ValueError):
+        encode_vector(np.zeros(4, dtype=np.float64))
+
+
+def test_old_jpeg_templates_are_migrated(tmp_path):
+    # A database from before face vectors: the original schema with JPEG templates only
+    path = str(tmp_path / "attendance.db")
+    conn = sqlite3.connect(path)
+    MIGRATIONS[0](conn.cursor())
+    conn.execute("PRAGMA user_version = 1")
+    faces = smooth_faces(np.random.default_rng(4), 3)
+    jpegs = [cv2.imencode('.jpg', face)[1].tobytes() for face in faces]
+    conn.executemany("INSERT INTO users (name, enrollment, college, class, section, face_template) "
+                     "VALUES (?, ?, 'College', 'BCA', 'A', ?)",
+                     [(f"User {i}", f"E{i:03d}", jpeg) for i, jpeg in enumerate(jpegs)])
+    conn.commit()
+    conn.close()
+
+    db = Database(path)
+    identifier = FaceIdentifier(db)
+    before = identifier.identify_batch(faces)
+    assert db.migrate_face_vectors() == 3
+    assert db.migrate_face_vectors() == 0
+
+    for (user_id, face_template, face_vector), jpeg in zip(db.get_face_templates(), jpegs):
+        assert face_template == jpeg
+        assert np.array_equal(load_template(face_template, face_vector), decode_template(jpeg).reshape(-1))
+    assert FaceIdentifier(db).identify_batch(faces) == before
+    db.close()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from database import Database
+from metrics import METRICS
+from recognition import encode_vector
+from service import RecognitionService
+
+
+def face(seed):
+    """A symmetric, sharp 100x100 crop that passes the quality gate; odd and even seeds never match"""
+    low = 50 if seed % 2 else 130
+    blocks = np.random.default_rng(seed).integers(low, low + 80, (10, 5), dtype=np.uint8)
+    half = cv2.resize(blocks, (50, 100), interpolation=cv2.INTER_NEAREST)
+    return np.hstack([half, half[:, ::-1]])
+
+
+def enroll(db, seed):
+    template = face(seed)
+    return db.register_user(f"User {seed}", f"E{seed:03d}", "College", "BCA", "A",
+                            cv2.imencode('.jpg', template)[1].tobytes(), encode_vector(template))
+
+
+async def request(port, method, path, body=b"", headers=""):
+    """One request on a fresh connection; returns (status, parsed JSON)"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"{method} {path} HTTP/1.1\r\nContent-Type: application/octet-stream\r\n{headers}"
+                 f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    head, _, body = response.partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(body)
+
+
+def run_service(tmp_path, client):
+    """Start a service on a free port, run `client(service, port)` against it and shut down"""
+    async def main():
+        service = RecognitionService(str(tmp_path / "attendance.db"))
+        address = asyncio.get_running_loop().create_future()
+        server = asyncio.create_task(service.serve("127.0.0.1", 0, ready=address.set_result))
+        try:
+            await client(service, (await address)[1])
+        finally:
+            server.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await server
+    asyncio.run(main())
+
+
+@pytest.fixture
+def service_dir(tmp_path, monkeypatch):
+    # Nothing may be written to the working directory's data/
+    monkeypatch.chdir(tmp_path)
+    db = Database(str(tmp_path / "attendance.db"))
+    enroll(db, 1)
+    db.close()
+    return tmp_path
+
+
+def test_index_is_kept_next_to_the_database(service_dir, monkeypatch):
+    site = service_dir / "site"
+    site.mkdir()
+    db = Database(str(site / "attendance.db"))
+    enroll(db, 3)
+    db.close()
+    monkeypatch.chdir(site)
+
+    service = RecognitionService(str(site / "attendance.db"))
+    assert (site / "face_index.npz").exists()
+    assert not (service_dir / "data").exists() and not (site / "data").exists()
+    service.db.close()
+
+
+def test_identify_and_unknown_routes(service_dir):
+    async def client(service, port):
+        status, result = await request(port, "POST", "/identify?mark=0", face(1).tobytes())
+        assert status == 200
+        assert result["faces"][0]["user_id"] == 1
+
+        for i in range(3):
+            status, _ = await request(port, "GET", f"/scan/{i}")
+            assert status == 404
+        status, _ = await request(port, "GET", "/identify")
+        assert status == 405
+
+    run_service(service_dir, client)
+    # Every unknown path is recorded under one name
+    assert "service.unmatched" in METRICS.histograms
+    assert not [name for name in METRICS.histograms if name.startswith("service.scan")]
+
+
+def test_overlong_header_is_rejected(service_dir):
+    async def client(service, port):
+        status, result = await request(port, "GET", "/health", headers=f"X-Padding: {'a' * 70000}\r\n")
+        assert status == 431
+        status, _ = await request(port, "GET", "/health", headers="X-A: 1\r\n" * 101)
+        assert status == 431
+        # The server is still answering
+        status, _ = await request(port, "GET", "/health")
+        assert status == 200
+
+    run_service(service_dir, client)
+
+
+def test_batcher_survives_a_failed_batch(service_dir):
+    async def client(service, port):
+        best_matches = service.identifier.best_matches
+        calls = []
+
+        def fail_once(faces):
+            calls.append(1)
+            if len(calls) == 1:
+                raise MemoryError("out of memory")
+            return best_matches(faces)
+        service.identifier.best_matches = fail_once
+
+        status, result = await request(port, "POST", "/identify?mark=0", face(1).tobytes())
+        assert status == 500
+        status, result = await request(port, "POST", "/identify?mark=0", face(1).tobytes())
+        assert status == 200
+        assert result["faces"][0]["user_id"] == 1
+
+    run_service(service_dir, client)
+
+
+def test_users_enrolled_elsewhere_are_picked_up(service_dir):
+    async def client(service, port):
+        service.batcher.refresh_interval = 0
+        status, result = await request(port, "POST", "/identify?mark=0", face(2).tobytes())
+        assert result["faces"][0]["user_id"] is None
+
+        # The app enrolls a user through its own connection
+        db = Database(str(service_dir / "attendance.db"))
+        user_id = enroll(db, 2)
+        db.close()
+
+        status, result = await request(port, "POST", "/identify?mark=0", face(2).tobytes())
+        assert result["faces"][0]["user_id"] == user_id
+        status, health = await request(port, "GET", "/health")
+        assert health["users"] == 2
+
+    run_service(service_dir, client)
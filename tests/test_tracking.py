@@ -0,0 +1,71 @@
+import cv2
+import numpy as np
+
+from tracking import FaceTracker, iou
+
+
+def detect_blobs(gray):
+    """Stand-in face detector: the bounding boxes of the bright blobs in the image"""
+    contours, _ = cv2.findContours((gray > 127).astype(np.uint8), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    return [cv2.boundingRect(contour) for contour in contours]
+
+
+def frame(*boxes):
+    gray = np.zeros((240, 320), dtype=np.uint8)
+    for x, y, w, h in boxes:
+        gray[y:y + h, x:x + w] = 255
+    return gray
+
+
+def test_iou():
+    overlaps = iou([(0, 0, 10, 10)], [(0, 0, 10, 10), (5, 0, 10, 10), (20, 20, 5, 5)])
+    assert np.allclose(overlaps, [[1.0, 50 / 150, 0.0]])
+
+
+def test_tracks_keep_their_ids_while_faces_move():
+    tracker = FaceTracker(detect_blobs, detect_every=4)
+    tracks = tracker.update(frame((20, 20, 40, 40), (200, 100, 40, 40)))
+    ids = {track.box[0]: track.id for track in tracks}
+    assert len(ids) == 2
+
+    # Small steps are followed by ROI re-detection and, every 4th frame, full detection
+    for step in range(1, 9):
+        tracks = tracker.update(frame((20 + 3 * step, 20, 40, 40), (200 - 3 * step, 100, 40, 40)))
+        assert len(tracks) == 2
+    assert {track.box: track.id for track in tracks} == {
+        (44, 20, 40, 40): ids[20], (176, 100, 40, 40): ids[200]}
+    assert tracker.full_detections == 3
+    assert tracker.roi_detections == 12
+
+
+def test_new_face_gets_a_new_id():
+    tracker = FaceTracker(detect_blobs, detect_every=1)
+    first = tracker.update(frame((20, 20, 40, 40)))[0].id
+    tracks = tracker.update(frame((20, 20, 40, 40), (200, 100, 40, 40)))
+    assert sorted(track.id for track in tracks) == [first, first + 1]
+
+
+def test_lost_track_expires_after_max_misses():
+    tracker = FaceTracker(detect_blobs, detect_every=10, max_misses=3)
+    track = tracker.update(frame((20, 20, 40, 40)))[0]
+    track.recognized((7, 0.1))
+
+    # The face leaves: the ROI miss forces full detections until the track is dropped
+    assert tracker.update(frame()) == [track]
+    assert tracker.force_detect
+    assert tracker.update(frame()) == [track]
+    assert track.misses == 2
+    assert tracker.update(frame()) == []
+
+    # Coming back afterwards is a new track that has to be recognized again
+    returned = tracker.update(frame((20, 20, 40, 40)))[0]
+    assert returned.id != track.id
+    assert returned.needs_recognition
+
+
+def test_reset_forgets_tracks():
+    tracker = FaceTracker(detect_blobs, detect_every=10)
+    tracker.update(frame((20, 20, 40, 40)))
+    tracker.reset()
+    assert tracker.tracks == []
+    assert tracker.force_detect
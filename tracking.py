@@ -0,0 +1,146 @@
+import numpy as np
+
+from detection import create_detector
+
+# Recognition attempts per track before it is left unidentified
+MAX_RECOGNITION_ATTEMPTS = 3
+
+
+def iou(boxes_a, boxes_b):
+    """Pairwise intersection-over-union of two sets of (x, y, w, h) boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(1, -1, 4)
+    left = np.maximum(a[..., 0], b[..., 0])
+    top = np.maximum(a[..., 1], b[..., 1])
+    right = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+    bottom = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+    inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+class Track:
+    """A face followed across frames under a stable id"""
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.misses = 0
+        self.user_id = None
+        self.distance = None
+        self.attempts = 0
+
+    @property
+    def needs_recognition(self):
+        return self.user_id is None and self.attempts < MAX_RECOGNITION_ATTEMPTS
+
+    def recognized(self, match):
+        """Record the result of a recognition attempt, a (user_id, distance) pair or None"""
+        self.attempts += 1
+        if match:
+            self.user_id, self.distance = match
+
+
+class FaceTracker:
+    """Full-frame detection every few frames, cheap ROI re-detection in between.
+
+    Between full detections each track is looked for again only inside a
+    window around its last box. A track that isn't found there counts as a
+    miss and forces a full detection on the next frame; tracks that miss
+    `max_misses` frames in a row are dropped. Detections are matched to
+    tracks by IoU so each face keeps the same id while it stays in view.
+    """
+
+    def __init__(self, detect, detect_every=10, roi_margin=0.5, iou_threshold=0.3, max_misses=3):
+        self.detect = detect
+        self.detect_every = detect_every
+        self.roi_margin = roi_margin
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []
+        self.frame_index = 0
+        self.force_detect = True
+        self.last_id = 0
+        self.full_detections = 0
+        self.roi_detections = 0
+
+    def reset(self):
+        """Forget every track, e.g. when the next frame is unrelated to the last"""
+        self.tracks = []
+        self.force_detect = True
+
+    def update(self, gray):
+        """Advance one frame and return the active tracks"""
+        if self.force_detect or self.frame_index % self.detect_every == 0:
+            self._full_update(gray)
+        else:
+            self._roi_update(gray)
+        self.frame_index += 1
+        return self.tracks
+
+    def _full_update(self, gray):
+        self.full_detections += 1
+        self.force_detect = False
+        boxes = np.asarray(self.detect(gray), dtype=np.int32).reshape(-1, 4)
+
+        matched_tracks, matched_boxes = set(), set()
+        if self.tracks and len(boxes):
+            overlaps = iou([track.box for track in self.tracks], boxes)
+            # Greedy assignment, best overlaps first
+            for t, b in zip(*np.unravel_index(np.argsort(-overlaps, axis=None), overlaps.shape)):
+                if overlaps[t, b] < self.iou_threshold:
+                    break
+                if t in matched_tracks or b in matched_boxes:
+                    continue
+                self.tracks[t].box = tuple(int(v) for v in boxes[b])
+                self.tracks[t].misses = 0
+                matched_tracks.add(t)
+                matched_boxes.add(b)
+
+        survivors = []
+        for t, track in enumerate(self.tracks):
+            if t not in matched_tracks:
+                track.misses += 1
+            if track.misses < self.max_misses:
+                survivors.append(track)
+        for b in range(len(boxes)):
+            if b not in matched_boxes:
+                self.last_id += 1
+                survivors.append(Track(self.last_id, tuple(int(v) for v in boxes[b])))
+        self.tracks = survivors
+
+    def _roi_update(self, gray):
+        height, width = gray.shape[:2]
+        for track in self.tracks:
+            self.roi_detections += 1
+            x, y, w, h = track.box
+            mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+            x0, y0 = max(x - mx, 0), max(y - my, 0)
+            x1, y1 = min(x + w + mx, width), min(y + h + my, height)
+
+            boxes = np.asarray(self.detect(gray[y0:y1, x0:x1]), dtype=np.int32).reshape(-1, 4)
+            if len(boxes):
+                boxes[:, 0] += x0
+                boxes[:, 1] += y0
+                overlaps = iou([track.box], boxes)[0]
+                best = int(np.argmax(overlaps))
+                if overlaps[best] >= self.iou_threshold:
+                    track.box = tuple(int(v) for v in boxes[best])
+                    track.misses = 0
+                    continue
+
+            # Lost in its window, confirm with a full detection next frame
+            track.misses += 1
+            self.force_detect = True
+
+        self.tracks = [track for track in self.tracks if track.misses < self.max_misses]
+
+
+def create_tracking_detector(detector_options=None, **kwargs):
+    """Create a detection function that tracks faces between full detections.
+
+    `detector_options` are passed to create_detector(). Tracking needs frames
+    in order, so use it with a single detection worker.
+    """
+    tracker = FaceTracker(create_detector(**(detector_options or {})), **kwargs)
+    return lambda gray: [track.box for track in tracker.update(gray)]